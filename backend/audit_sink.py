@@ -0,0 +1,247 @@
+# Sink de auditoría con escritura diferida (write-behind).
+# - Encola registros en memoria sin tocar la BD en el request.
+# - Vuelca en lotes (INSERT multi-fila) cada N registros o T milisegundos.
+# - Si la BD no está disponible, guarda los lotes en un archivo de spill acotado.
+# - Un registro que viola una restricción va a cuarentena sin bloquear al resto del lote.
+# - Drena la cola al apagar el proceso.
+
+import os
+import json
+import queue
+import atexit
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError, DataError
+
+DB_URL = os.getenv("DATABASE_URL")
+
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "200"))
+AUDIT_FLUSH_MS = int(os.getenv("AUDIT_FLUSH_MS", "500"))
+AUDIT_QUEUE_MAX = int(os.getenv("AUDIT_QUEUE_MAX", "50000"))
+AUDIT_SPILL_PATH = os.getenv("AUDIT_SPILL_PATH", "./output/audit_spill.jsonl")
+AUDIT_SPILL_MAX_BYTES = int(os.getenv("AUDIT_SPILL_MAX_BYTES", str(64 * 1024 * 1024)))
+AUDIT_QUARANTINE_PATH = os.getenv("AUDIT_QUARANTINE_PATH", "./output/audit_quarantine.jsonl")
+
+# Columnas permitidas por tabla; el INSERT se arma solo con estas.
+TABLES = {
+    "conversation_logs": ("user_id", "contract_id", "mensaje_usuario", "respuesta_sistema", "ip_origen"),
+    "audit_trail": ("entidad", "accion", "usuario_responsable", "detalle_cambio"),
+}
+
+def _to_db_value(value: Any) -> Any:
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    return value
+
+def _spill_line(table: str, row: Dict[str, Any]) -> str:
+    return json.dumps({"table": table, "row": row}, ensure_ascii=False, default=str) + "\n"
+
+# ---------------------------
+# Sink
+# ---------------------------
+class AuditSink:
+    def __init__(self, db_url: Optional[str] = DB_URL,
+                 batch_size: int = AUDIT_BATCH_SIZE,
+                 flush_ms: int = AUDIT_FLUSH_MS,
+                 spill_path: str = AUDIT_SPILL_PATH,
+                 spill_max_bytes: int = AUDIT_SPILL_MAX_BYTES,
+                 quarantine_path: str = AUDIT_QUARANTINE_PATH):
+        self.db_url = db_url
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000.0
+        self.spill_path = spill_path
+        self.spill_max_bytes = spill_max_bytes
+        self.quarantine_path = quarantine_path
+        self.quarantined = 0
+
+        self._queue: "queue.Queue[tuple[str, Dict[str, Any]]]" = queue.Queue(maxsize=AUDIT_QUEUE_MAX)
+        self._engine = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.RLock()
+        self._start_lock = threading.Lock()
+        self.dropped = 0
+
+    def _get_engine(self):
+        if self._engine is None:
+            self._engine = create_engine(self.db_url, pool_pre_ping=True, pool_size=1, max_overflow=0)
+        return self._engine
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="audit-sink", daemon=True)
+                self._thread.start()
+
+    def submit(self, table: str, row: Dict[str, Any]) -> None:
+        """Encola un registro; nunca bloquea el request."""
+        if table not in TABLES:
+            raise ValueError(f"Tabla de auditoría desconocida: {table}")
+        self.start()
+        try:
+            self._queue.put_nowait((table, row))
+        except queue.Full:
+            # Cola llena: el registro va directo al spill para no perderlo
+            if not self._spill([(table, row)]):
+                self.dropped += 1
+
+    # ---------------------------
+    # Bucle de volcado
+    # ---------------------------
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect(self.flush_interval)
+            if batch:
+                self._flush(batch)
+        # Drenado final
+        while True:
+            batch = self._collect(0)
+            if not batch:
+                break
+            self._flush(batch)
+
+    def _collect(self, timeout: float) -> List[tuple]:
+        batch = []
+        deadline = time.monotonic() + timeout
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: List[tuple]) -> None:
+        by_table: Dict[str, List[Dict[str, Any]]] = {}
+        for table, row in batch:
+            cols = TABLES[table]
+            by_table.setdefault(table, []).append({c: _to_db_value(row.get(c)) for c in cols})
+
+        with self._get_engine().begin() as conn:
+            for table, rows in by_table.items():
+                cols = TABLES[table]
+                stmt = text(
+                    f"INSERT INTO {table} ({', '.join(cols)}) "
+                    f"VALUES ({', '.join(':' + c for c in cols)})"
+                )
+                # executemany: psycopg2 lo agrupa en INSERT ... VALUES multi-fila
+                conn.execute(stmt, rows)
+
+    def _flush(self, batch: List[tuple]) -> None:
+        # La escritura en BD ocurre sin el lock: submit() -> _spill() nunca espera I/O de BD
+        pending = self._take_spill()
+        try:
+            self._write(pending + batch)
+        except (IntegrityError, DataError) as e:
+            print(f"[AUDIT][WARN] Lote rechazado, se reintenta fila por fila: {e}")
+            resto = self._write_rows(pending + batch)
+            if resto:
+                # El archivo en curso queda solo con lo no escrito: nada se reinserta dos veces
+                self._replace_inflight(resto)
+                return
+        except SQLAlchemyError as e:
+            print(f"[AUDIT][ERROR] BD no disponible, se guarda en spill: {e}")
+            # Lo pendiente sigue en el archivo en curso; solo el lote nuevo va al spill
+            self._spill(batch)
+            return
+        self._clear_inflight()
+
+    def _write_rows(self, records: List[tuple]) -> List[tuple]:
+        """Escribe fila por fila; devuelve lo que quedó sin escribir si la BD se cae a mitad."""
+        for i, record in enumerate(records):
+            try:
+                self._write([record])
+            except (IntegrityError, DataError) as e:
+                self._quarantine(record, e)
+            except SQLAlchemyError as e:
+                print(f"[AUDIT][ERROR] BD no disponible, se guarda en spill: {e}")
+                return records[i:]
+        return []
+
+    # ---------------------------
+    # Spill en disco
+    # ---------------------------
+    def _spill(self, batch: List[tuple]) -> bool:
+        lines = [_spill_line(t, r) for t, r in batch]
+        size = sum(len(l.encode("utf-8")) for l in lines)
+        with self._lock:
+            # El límite cubre spill + archivo en curso: durante una caída de la BD el spill
+            # se mueve al archivo en curso en cada volcado
+            current = sum(os.path.getsize(p) for p in (self.spill_path, self._inflight_path())
+                          if os.path.exists(p))
+            if current + size > self.spill_max_bytes:
+                self.dropped += len(batch)
+                print(f"[AUDIT][ERROR] Spill lleno, se descartan {len(batch)} registros")
+                return False
+            os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                f.writelines(lines)
+        return True
+
+    def _inflight_path(self) -> str:
+        return self.spill_path + ".inflight"
+
+    def _take_spill(self) -> List[tuple]:
+        """Mueve el spill a un archivo en curso y lo lee; lo nuevo que llegue va a un spill limpio."""
+        inflight = self._inflight_path()
+        with self._lock:
+            if os.path.exists(self.spill_path):
+                if os.path.exists(inflight):
+                    # Quedó uno de un reintento anterior: se agregan al final
+                    with open(self.spill_path, "r", encoding="utf-8") as src, \
+                            open(inflight, "a", encoding="utf-8") as dst:
+                        dst.write(src.read())
+                    os.remove(self.spill_path)
+                else:
+                    os.replace(self.spill_path, inflight)
+        if not os.path.exists(inflight):
+            return []
+        out = []
+        with open(inflight, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                    out.append((rec["table"], rec["row"]))
+                except (ValueError, KeyError):
+                    continue
+        return out
+
+    def _replace_inflight(self, records: List[tuple]):
+        inflight = self._inflight_path()
+        tmp = inflight + ".tmp"
+        with self._lock:
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.writelines(_spill_line(t, r) for t, r in records)
+            os.replace(tmp, inflight)
+
+    def _clear_inflight(self):
+        if os.path.exists(self._inflight_path()):
+            os.remove(self._inflight_path())
+
+    def _quarantine(self, record: tuple, error: Exception):
+        table, row = record
+        self.quarantined += 1
+        print(f"[AUDIT][ERROR] Registro en cuarentena ({table}): {error}")
+        os.makedirs(os.path.dirname(self.quarantine_path) or ".", exist_ok=True)
+        with open(self.quarantine_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"table": table, "row": row, "error": str(error)[:500]},
+                               ensure_ascii=False, default=str) + "\n")
+
+    def close(self, timeout: float = 10.0):
+        """Detiene el hilo tras volcar todo lo encolado."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+# ---------------------------
+# Instancia del proceso
+# ---------------------------
+sink = AuditSink()
+atexit.register(sink.close)
@@ -1,41 +1,268 @@
 from fastapi import Depends, HTTPException
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials, APIKeyHeader
 from dotenv import load_dotenv
+from dataclasses import dataclass
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import threading
+import time
+import uuid
+import hmac
+import hashlib
 import jwt
 import os
 from datetime import datetime, timedelta
-from models import Usuario, db
-from werkzeug.security import check_password_hash
+from models import Usuario, db, PASSWORD_HASH_METHOD
+from werkzeug.security import check_password_hash, generate_password_hash
 
 load_dotenv()
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
+API_KEY_SECRET = os.getenv("API_KEY_SECRET") or SECRET_KEY
 security = HTTPBearer()
+optional_bearer = HTTPBearer(auto_error=False)
+api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
 
+# Caché de tokens verificados (por proceso)
+AUTH_CACHE_MAX = int(os.getenv("AUTH_CACHE_MAX", "10000"))
+# Cota de obsolescencia entre procesos: la invalidación solo es inmediata en el proceso local
+AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", "300"))
+
+# Hash de contraseñas fuera del event loop
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))
+PASSWORD_HASH_WAIT_SECONDS = float(os.getenv("PASSWORD_HASH_WAIT_SECONDS", "5"))
+
+# ---------------------------
+# Proyección ligera del usuario autenticado
+# ---------------------------
+@dataclass(frozen=True)
+class UsuarioAuth:
+    id: int
+    nombre: str
+    correo: str
+    rol_id: int
+
+    @classmethod
+    def from_model(cls, user: Usuario) -> "UsuarioAuth":
+        return cls(id=user.id, nombre=user.nombre, correo=user.correo, rol_id=user.rol_id)
+
+class TokenCache:
+    def __init__(self, max_size: int = AUTH_CACHE_MAX, ttl: int = AUTH_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._by_user = {}  # user_id -> claves en caché (acotado por max_size)
+        self._invalidations = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, claims, user = entry
+            if now >= expires_at:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return claims, user
+
+    def snapshot(self) -> int:
+        """Tomar antes de leer el usuario de la BD y pasarlo a put()."""
+        return self._invalidations
+
+    def put(self, key: str, claims: dict, user: UsuarioAuth, snapshot: int = None):
+        expires_at = min(float(claims.get("exp", 0)), time.time() + self.ttl)
+        with self._lock:
+            # Hubo una invalidación mientras se leía el usuario: la lectura pudo ser previa al commit
+            if snapshot is not None and snapshot != self._invalidations:
+                return
+            self._remove(key)
+            self._entries[key] = (expires_at, claims, user)
+            self._by_user.setdefault(user.id, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            keys = self._by_user.get(entry[2].id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_user[entry[2].id]
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            self._invalidations += 1
+            for key in self._by_user.pop(user_id, ()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+token_cache = TokenCache()
+api_key_cache = TokenCache()
+
+# Los cambios de credenciales invalidan la caché recién al confirmarse: antes del commit
+# otra request todavía lee (y cachearía) la fila anterior.
+_PENDING_INVALIDATIONS = "auth_invalidar_usuarios"
+
+def _invalidate(user_id: int):
+    token_cache.invalidate_user(user_id)
+    api_key_cache.invalidate_user(user_id)
+
+@event.listens_for(Usuario.contrasena_hash, "set")
+@event.listens_for(Usuario.activo, "set")
+@event.listens_for(Usuario.api_key_hash, "set")
+def _invalidate_on_change(target, value, oldvalue, initiator):
+    if target.id is None or value == oldvalue:
+        return
+    session = object_session(target)
+    if session is None:
+        _invalidate(target.id)
+        return
+    session.info.setdefault(_PENDING_INVALIDATIONS, set()).add(target.id)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    for user_id in session.info.pop(_PENDING_INVALIDATIONS, ()):
+        _invalidate(user_id)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_invalidations(session):
+    session.info.pop(_PENDING_INVALIDATIONS, None)
+
+# ---------------------------
+# Autenticación
+# ---------------------------
 def authenticate_user(email: str, password: str):
     user = Usuario.query.filter_by(correo=email).first()
-    if user and user.check_password(password):
+    if user and user.activo and user.check_password(password):
         return user
     raise HTTPException(status_code=401, detail="Credenciales inválidas")
 
+# pbkdf2_hmac/scrypt de hashlib liberan el GIL, así que un pool de hilos basta
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_hash_slots = asyncio.Semaphore(PASSWORD_HASH_MAX_PENDING)
+# Hash de referencia para igualar tiempos cuando el correo no existe
+_dummy_hash = None
+
+async def _run_hash(fn, *args):
+    try:
+        await asyncio.wait_for(_hash_slots.acquire(), PASSWORD_HASH_WAIT_SECONDS)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Demasiados inicios de sesión simultáneos, intente nuevamente")
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_hash_executor, fn, *args)
+    finally:
+        _hash_slots.release()
+
+async def _get_dummy_hash():
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = await _run_hash(generate_password_hash, uuid.uuid4().hex, PASSWORD_HASH_METHOD)
+    return _dummy_hash
+
+async def authenticate_user_async(email: str, password: str):
+    user = Usuario.query.filter_by(correo=email).first()
+    stored = user.contrasena_hash if user else await _get_dummy_hash()
+    ok = await _run_hash(check_password_hash, stored, password)
+    if not (user and ok and user.activo):
+        raise HTTPException(status_code=401, detail="Credenciales inválidas")
+
+    # Rehash transparente a los parámetros vigentes
+    if user.needs_rehash():
+        user.contrasena_hash = await _run_hash(generate_password_hash, password, PASSWORD_HASH_METHOD)
+        db.session.commit()
+    return user
+
 def create_token(user_id: int) -> str:
     payload = {
         "sub": user_id,
+        "jti": uuid.uuid4().hex,
         "exp": datetime.utcnow() + timedelta(hours=2)
     }
     return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> UsuarioAuth:
     token = credentials.credentials
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("sub")
-        user = Usuario.query.get(user_id)
-        if not user:
-            raise HTTPException(status_code=401, detail="Usuario no encontrado")
-        return user
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expirado")
     except jwt.InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Token inválido")
\ No newline at end of file
+        raise HTTPException(status_code=401, detail="Token inválido")
+
+    # Tokens sin jti (emitidos antes de la caché) se indexan por el token completo
+    key = payload.get("jti") or token
+    cached = token_cache.get(key)
+    if cached:
+        return cached[1]
+
+    snapshot = token_cache.snapshot()
+    user = Usuario.query.get(payload.get("sub"))
+    if not user:
+        raise HTTPException(status_code=401, detail="Usuario no encontrado")
+    if not user.activo:
+        raise HTTPException(status_code=401, detail="Usuario deshabilitado")
+
+    projection = UsuarioAuth.from_model(user)
+    token_cache.put(key, payload, projection, snapshot)
+    return projection
+
+# ---------------------------
+# API keys (clientes máquina)
+# ---------------------------
+def hash_api_key(key: str) -> str:
+    # HMAC rápido: la key ya tiene 256 bits de entropía, no necesita PBKDF2
+    return hmac.new(API_KEY_SECRET.encode("utf-8"), key.encode("utf-8"), hashlib.sha256).hexdigest()
+
+def _lookup_api_key(key: str):
+    key_hash = hash_api_key(key)
+    user = Usuario.query.filter_by(api_key_hash=key_hash).first()
+    if user is None:
+        # Keys legadas en texto plano: se migran al hash en el primer uso
+        user = Usuario.query.filter_by(api_key=key).first()
+        if user is not None:
+            user.api_key_hash = key_hash
+            user.api_key = None
+            db.session.commit()
+    return key_hash, user
+
+def verify_api_key(api_key: str = Depends(api_key_header)) -> UsuarioAuth:
+    if not api_key:
+        raise HTTPException(status_code=401, detail="API key requerida")
+    key_hash = hash_api_key(api_key)
+    cached = api_key_cache.get(key_hash)
+    if cached:
+        return cached[1]
+
+    snapshot = api_key_cache.snapshot()
+    key_hash, user = _lookup_api_key(api_key)
+    if not user or not user.activo:
+        raise HTTPException(status_code=401, detail="API key inválida")
+
+    projection = UsuarioAuth.from_model(user)
+    api_key_cache.put(key_hash, {"exp": time.time() + api_key_cache.ttl}, projection, snapshot)
+    return projection
+
+def get_current_user(
+    api_key: str = Depends(api_key_header),
+    credentials: HTTPAuthorizationCredentials = Depends(optional_bearer),
+) -> UsuarioAuth:
+    """X-API-Key si viene en la request; si no, bearer JWT."""
+    if api_key:
+        return verify_api_key(api_key)
+    if credentials is None:
+        raise HTTPException(status_code=401, detail="Token requerido")
+    return verify_token(credentials)
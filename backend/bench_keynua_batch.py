@@ -0,0 +1,40 @@
+# Benchmark: envío secuencial vs por lotes a un Keynua falso local.
+# Uso: python bench_keynua_batch.py [n_pdfs] [tamaño_kb] [concurrencia]
+
+import os
+import sys
+import time
+import asyncio
+import tempfile
+import fake_keynua
+from keynua_client import KeynuaClient, submit_batch
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+SIZE_KB = int(sys.argv[2]) if len(sys.argv) > 2 else 512
+CONCURRENCY = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+LATENCY_MS = 100  # latencia simulada de Keynua por request
+PORT = 8766
+
+async def main():
+    fake_keynua.serve(PORT, latency_ms=LATENCY_MS)
+    with tempfile.TemporaryDirectory() as tmp:
+        items = []
+        for i in range(N):
+            path = os.path.join(tmp, f"contrato_{i}.pdf")
+            with open(path, "wb") as f:
+                f.write(os.urandom(SIZE_KB * 1024))
+            items.append({"contrato_id": i, "pdf_path": path, "signer": {"contrato_id": i}})
+
+        async with KeynuaClient(base_url=f"http://127.0.0.1:{PORT}") as client:
+            t0 = time.perf_counter()
+            for item in items:
+                await client.send_document(item["pdf_path"], item["signer"])
+            seq = time.perf_counter() - t0
+            print(f"secuencial: {N / seq:>7.2f} docs/s ({seq:.2f} s)")
+
+            result = await submit_batch(client, items, CONCURRENCY)
+            print(f"lote x{CONCURRENCY}:   {result['docs_por_segundo']:>7.2f} docs/s ({result['segundos']:.2f} s), "
+                  f"fallidos={len(result['fallidos'])}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
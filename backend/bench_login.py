@@ -0,0 +1,54 @@
+# Benchmark: throughput de login vs latencia de chat en el mismo event loop.
+# Compara verificar contraseñas en línea (bloqueando el loop) con auth._run_hash, el mismo
+# pool acotado que usa authenticate_user_async (PASSWORD_HASH_WORKERS/MAX_PENDING de auth.py).
+# Uso: python bench_login.py [logins_concurrentes]
+
+import sys
+import time
+import asyncio
+import statistics
+from werkzeug.security import generate_password_hash, check_password_hash
+from models import PASSWORD_HASH_METHOD
+from auth import _run_hash, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING
+
+LOGINS = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+CHAT_TICK = 0.01  # una "request de chat" cada 10 ms
+
+HASH = generate_password_hash("secreto", method=PASSWORD_HASH_METHOD)
+
+async def chat_probe(stop: asyncio.Event, samples: list):
+    # Mide cuánto tarda el loop en atender una request liviana
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(CHAT_TICK)
+        samples.append((time.perf_counter() - t0 - CHAT_TICK) * 1000)
+
+async def login_inline():
+    check_password_hash(HASH, "secreto")
+
+async def login_pooled():
+    await _run_hash(check_password_hash, HASH, "secreto")
+
+async def scenario(name, login):
+    stop = asyncio.Event()
+    samples = []
+    probe = asyncio.create_task(chat_probe(stop, samples))
+    await asyncio.sleep(0.05)
+    t0 = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(LOGINS)))
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await probe
+    samples.sort()
+    p99 = samples[int(len(samples) * 0.99) - 1] if samples else 0.0
+    print(f"{name:<10} logins/s={LOGINS / elapsed:>7.2f}  "
+          f"chat retraso p50={statistics.median(samples):>8.2f} ms  p99={p99:>8.2f} ms  max={samples[-1]:>8.2f} ms")
+
+async def main():
+    print(f"{LOGINS} logins concurrentes, {PASSWORD_HASH_METHOD}, "
+          f"pool={PASSWORD_HASH_WORKERS}, pendientes={PASSWORD_HASH_MAX_PENDING}")
+    await scenario("inline", login_inline)
+    await scenario("pool", login_pooled)
+
+if __name__ == "__main__":
+    asyncio.run(main())
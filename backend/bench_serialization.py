@@ -0,0 +1,73 @@
+# Benchmark: costo de serializar las respuestas de cada endpoint.
+# Compara la ruta por defecto de FastAPI (jsonable_encoder + json.dumps) con
+# serialization.dumps (orjson, dataclasses y datetimes nativos).
+# Uso: python bench_serialization.py [iteraciones]
+
+import sys
+import json
+import time
+import datetime as dt
+from fastapi.encoders import jsonable_encoder
+from ner_engine import EntitySpan, NormalizedEntity, ExtractionResult
+from serialization import dumps
+
+ITERATIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+def fastapi_default(content) -> bytes:
+    # Equivalente a lo que hace JSONResponse tras jsonable_encoder
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False, allow_nan=False,
+                      indent=None, separators=(",", ":")).encode("utf-8")
+
+def extraction_result() -> ExtractionResult:
+    spans = [EntitySpan(text=f"Juan Pérez {i}", label="PERSONA", start=i * 20, end=i * 20 + 12) for i in range(12)]
+    normalized = [
+        NormalizedEntity(label="MONTO", original="S/ 1,500.00", value={"amount": 1500.0, "currency": "PEN", "formatted": "S/ 1,500.00"}, valid=True),
+        NormalizedEntity(label="DNI", original="4567 8912", value="45678912", valid=True),
+    ] * 6
+    return ExtractionResult(text="texto " * 200, entities=spans, by_label={"PERSONA": spans},
+                            normalized=normalized, missing_expected=["FECHA"])
+
+def payloads() -> dict:
+    ahora = dt.datetime.utcnow()
+    slots = {f"slot_{i}": f"valor del campo {i} " * 4 for i in range(40)}
+    return {
+        "/next-turn": {"status": "incomplete", "ask": "¿Cuál es el monto?", "filled": slots,
+                       "extraction": extraction_result()},
+        "/preview": {"html": "<p>Cláusula de ejemplo con datos del contrato.</p>\n" * 4000},
+        "/validate-link": {
+            "valid": True,
+            "datos_personales": {"nombre": "Juan Pérez", "email": "juan@example.com"},
+            "detalle_contrato": {"tipo": 3, "filled_slots": slots},
+            "codigo_probatorio": "a1b2c3d4",
+        },
+        "/jobs/{id}": {
+            "job_id": "0f8c", "tipo": "confirmacion", "estado": "completado", "etapa": None,
+            "etapas": [{"nombre": n, "inicio": ahora.isoformat(), "duracion_ms": 12.5}
+                       for n in ("render", "pdf", "hash", "registro")],
+            "resultado": {"evidence_id": 10}, "error": None,
+            "fecha_creacion": ahora, "fecha_actualizacion": ahora,
+        },
+        "/chat/{id}": {
+            "items": [{"id": i, "emisor": "usuario", "contenido": "mensaje " * 30, "fecha_creacion": ahora}
+                      for i in range(50)],
+            "next_cursor": "eyJ0IjoiMjAyNSJ9",
+        },
+    }
+
+def bench(fn, content) -> float:
+    fn(content)
+    t0 = time.perf_counter()
+    for _ in range(ITERATIONS):
+        fn(content)
+    return (time.perf_counter() - t0) / ITERATIONS * 1e6
+
+def main():
+    print(f"{ITERATIONS} iteraciones por endpoint (µs por respuesta)")
+    print(f"{'endpoint':<16}{'bytes':>10}{'fastapi':>12}{'orjson':>12}{'x':>8}")
+    for endpoint, content in payloads().items():
+        base = bench(fastapi_default, content)
+        fast = bench(dumps, content)
+        print(f"{endpoint:<16}{len(dumps(content)):>10}{base:>12.1f}{fast:>12.1f}{base / fast:>8.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+# Almacén de blobs direccionado por contenido (SHA-256) para evidencias (PDFs, videos).
+# - Ruta/clave: <raíz>/ab/cd/<sha256>: el fanout mantiene los directorios chicos.
+# - Escritura atómica: archivo temporal en el mismo filesystem + os.replace.
+# - Deduplicación: contenido idéntico se guarda una sola vez.
+# - Backend intercambiable con BLOB_BACKEND=local|s3 (S3/MinIO; ver fake_s3.py para pruebas).
+
+import os
+import uuid
+import hashlib
+import tempfile
+from dataclasses import dataclass
+
+BLOB_BACKEND = os.getenv("BLOB_BACKEND", "local")
+BLOB_DIR = os.getenv("BLOB_DIR", "./blobs")
+BLOB_CACHE_DIR = os.getenv("BLOB_CACHE_DIR", "./blobs_cache")
+BLOB_S3_BUCKET = os.getenv("BLOB_S3_BUCKET", "notaria-evidencias")
+BLOB_S3_ENDPOINT = os.getenv("BLOB_S3_ENDPOINT")  # p. ej. http://127.0.0.1:9000 (MinIO)
+BLOB_S3_PREFIX = os.getenv("BLOB_S3_PREFIX", "blobs")
+
+CHUNK_SIZE = 1024 * 1024
+
+@dataclass(frozen=True)
+class BlobRef:
+    sha256: str
+    size: int
+    uri: str
+    created: bool  # False si el contenido ya existía (deduplicado)
+
+def fanout(sha256: str) -> str:
+    return os.path.join(sha256[:2], sha256[2:4], sha256)
+
+def _copy_hashing(src, dst) -> tuple:
+    h = hashlib.sha256()
+    size = 0
+    for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+        h.update(chunk)
+        dst.write(chunk)
+        size += len(chunk)
+    return h.hexdigest(), size
+
+# ---------------------------
+# Backend local
+# ---------------------------
+class LocalBlobStore:
+    def __init__(self, root: str = BLOB_DIR):
+        self.root = os.path.abspath(root)
+        self.tmp_dir = os.path.join(self.root, "tmp")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def path(self, sha256: str) -> str:
+        return os.path.join(self.root, fanout(sha256))
+
+    def uri(self, sha256: str) -> str:
+        return self.path(sha256)
+
+    def exists(self, sha256: str) -> bool:
+        return os.path.exists(self.path(sha256))
+
+    def put_fileobj(self, src) -> BlobRef:
+        tmp_path = os.path.join(self.tmp_dir, uuid.uuid4().hex)
+        try:
+            with open(tmp_path, "wb") as tmp:
+                sha256, size = _copy_hashing(src, tmp)
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            final = self.path(sha256)
+            if os.path.exists(final):
+                return BlobRef(sha256, size, final, created=False)
+            os.makedirs(os.path.dirname(final), exist_ok=True)
+            os.replace(tmp_path, final)
+            return BlobRef(sha256, size, final, created=True)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def local_path(self, sha256: str) -> str:
+        return self.path(sha256)
+
+    def verify(self, sha256: str) -> bool:
+        h = hashlib.sha256()
+        with open(self.path(sha256), "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                h.update(chunk)
+        return h.hexdigest() == sha256
+
+# ---------------------------
+# Backend S3 / MinIO
+# ---------------------------
+class S3BlobStore:
+    def __init__(self, bucket: str = BLOB_S3_BUCKET, endpoint_url: str = BLOB_S3_ENDPOINT,
+                 prefix: str = BLOB_S3_PREFIX, cache_dir: str = BLOB_CACHE_DIR, client=None):
+        if client is None:
+            import boto3  # dependencia opcional, solo con BLOB_BACKEND=s3
+            client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        # Copias locales para herramientas que necesitan un archivo (Keynua, ffmpeg)
+        self.cache = LocalBlobStore(cache_dir)
+
+    def key(self, sha256: str) -> str:
+        return "/".join(filter(None, [self.prefix, sha256[:2], sha256[2:4], sha256]))
+
+    def uri(self, sha256: str) -> str:
+        return f"s3://{self.bucket}/{self.key(sha256)}"
+
+    def exists(self, sha256: str) -> bool:
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.key(sha256))
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def put_fileobj(self, src) -> BlobRef:
+        # La clave depende del hash: se copia primero a un temporal mientras se hashea
+        with tempfile.TemporaryFile() as tmp:
+            sha256, size = _copy_hashing(src, tmp)
+            if self.exists(sha256):
+                return BlobRef(sha256, size, self.uri(sha256), created=False)
+            tmp.seek(0)
+            # PUT de un solo objeto: el objeto aparece completo o no aparece
+            self.client.put_object(Bucket=self.bucket, Key=self.key(sha256), Body=tmp,
+                                   ContentLength=size, Metadata={"sha256": sha256})
+            return BlobRef(sha256, size, self.uri(sha256), created=True)
+
+    def local_path(self, sha256: str) -> str:
+        if not self.cache.exists(sha256):
+            body = self.client.get_object(Bucket=self.bucket, Key=self.key(sha256))["Body"]
+            ref = self.cache.put_fileobj(body)
+            if ref.sha256 != sha256:
+                raise ValueError(f"Blob corrupto en S3: {sha256} (leído {ref.sha256})")
+        return self.cache.path(sha256)
+
+    def verify(self, sha256: str) -> bool:
+        body = self.client.get_object(Bucket=self.bucket, Key=self.key(sha256))["Body"]
+        h = hashlib.sha256()
+        for chunk in iter(lambda: body.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+        return h.hexdigest() == sha256
+
+# ---------------------------
+# Instancia compartida y helpers
+# ---------------------------
+_store = None
+
+def get_blob_store():
+    global _store
+    if _store is None:
+        _store = S3BlobStore() if BLOB_BACKEND == "s3" else LocalBlobStore()
+    return _store
+
+def put_file(path: str, move: bool = False) -> BlobRef:
+    with open(path, "rb") as src:
+        ref = get_blob_store().put_fileobj(src)
+    if move:
+        os.unlink(path)
+    return ref
+
+def local_path_for(uri: str) -> str:
+    """Ruta local para un URI guardado en la BD (blob s3://, blob local o ruta legada)."""
+    store = get_blob_store()
+    if uri.startswith("s3://"):
+        return store.local_path(uri.rsplit("/", 1)[-1])
+    return uri
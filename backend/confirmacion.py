@@ -0,0 +1,114 @@
+# Pipeline de /confirm ejecutado como job (ver jobs.py):
+# render -> pdf -> hash (blob store) -> registro (evidencia + correo vía outbox).
+# Render y PDF (WeasyPrint, CPU y con el GIL tomado) corren en un pool de procesos;
+# el hash en un hilo. El request solo encola y devuelve el job_id.
+# Un reintento del job no duplica la evidencia ni el correo: ambos se confirman juntos
+# y la evidencia lleva el job_id que la creó.
+
+import os
+import asyncio
+import secrets
+import datetime as dt
+from concurrent.futures import ProcessPoolExecutor
+from template_engine import render_html, html_to_pdf
+from models import Contrato, Evidencia, db
+from outbox import add_outbox
+from jobs import job_handler
+from blob_store import put_file
+
+OUTPUT_DIR = os.getenv("OUTPUT_DIR", "./output")
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "2"))
+LINK_TTL_MINUTES = int(os.getenv("LINK_TTL_MINUTES", "15"))
+
+_pdf_executor = None
+
+def get_pdf_executor() -> ProcessPoolExecutor:
+    global _pdf_executor
+    if _pdf_executor is None:
+        _pdf_executor = ProcessPoolExecutor(max_workers=PDF_WORKERS)
+    return _pdf_executor
+
+def shutdown_pdf_executor():
+    global _pdf_executor
+    if _pdf_executor is not None:
+        _pdf_executor.shutdown(wait=True)
+        _pdf_executor = None
+
+def _enlace(token: str) -> str:
+    return f"{os.getenv('URL_BASE_FRONTEND')}/video/{token}"
+
+def _evidencia_del_job(contrato_id: int, job_id: str):
+    return (Evidencia.query
+            .filter(Evidencia.contrato_id == contrato_id,
+                    Evidencia.metadatos["job_id"].astext == job_id)
+            .first())
+
+def _resultado(evidencia: Evidencia) -> dict:
+    token = evidencia.metadatos["link_temporal"]
+    return {
+        "evidence_id": evidencia.id,
+        "token": token,
+        "link": _enlace(token),
+        "codigo_probatorio": evidencia.metadatos["codigo_probatorio"]
+    }
+
+@job_handler("confirmacion")
+async def run_confirmacion(ctx) -> dict:
+    data = ctx.payload
+    loop = asyncio.get_running_loop()
+    contrato = Contrato.query.get(data["contract_id"])
+    if not contrato:
+        raise LookupError("Contrato no encontrado")
+
+    previa = _evidencia_del_job(contrato.id, ctx.job.id)
+    if previa is not None:
+        # Reintento tras el commit del registro: evidencia y correo ya existen
+        return _resultado(previa)
+
+    async with ctx.stage("render"):
+        html = await loop.run_in_executor(
+            get_pdf_executor(), render_html, f"{data['contract_type']}_template.html", data["filled_slots"]
+        )
+
+    async with ctx.stage("pdf"):
+        # Temporal por job: confirmaciones concurrentes del mismo tipo no se pisan
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        pdf_path = os.path.join(OUTPUT_DIR, f"{data['contract_type']}_{ctx.job.id}.pdf")
+        await loop.run_in_executor(get_pdf_executor(), html_to_pdf, html, pdf_path)
+
+    async with ctx.stage("hash"):
+        # El blob store hashea al copiar; el PDF temporal se elimina
+        ref = await asyncio.to_thread(put_file, pdf_path, True)
+        hash_doc = ref.sha256
+
+    async with ctx.stage("registro"):
+        codigo_probatorio = secrets.token_hex(4)
+        token = secrets.token_urlsafe(16)
+        link_expiration = dt.datetime.utcnow() + dt.timedelta(minutes=LINK_TTL_MINUTES)
+
+        evidencia = Evidencia(
+            contrato_id=contrato.id,
+            tipo_id=1,
+            metadatos={
+                "hash_documento": hash_doc,
+                "codigo_probatorio": codigo_probatorio,
+                "link_temporal": token,
+                "link_expiration": link_expiration.isoformat(),
+                "estado_link": "activo",
+                "job_id": ctx.job.id,
+                "correo_encolado": True
+            }
+        )
+        db.session.add(evidencia)
+        contrato.archivo_original_url = ref.uri
+
+        enlace = _enlace(token)
+        # El correo sale por el outbox, confirmado en el mismo commit que la evidencia
+        add_outbox("email", {
+            "to_email": data.get("email"),
+            "subject": "Enlace para video probatorio",
+            "body": f"Ingrese al siguiente enlace: {enlace}\nCódigo: {codigo_probatorio}"
+        }, agregado=f"contrato:{contrato.id}")
+        db.session.commit()
+
+    return _resultado(evidencia)
@@ -0,0 +1,88 @@
+import sys, time, asyncio, tempfile, threading
+from collections import deque
+from urllib.parse import urlparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import httpx
+
+from script import Crawler, normalize, parse_page, save_page
+
+# Benchmark: crawler bloqueante (una página a la vez, sin sesión) vs crawler asíncrono,
+# contra un sitio estático local generado (árbol de páginas con latencia simulada).
+# Uso: python crawling/bench_crawl.py [paginas] [latencia_ms]
+
+PAGES = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+LATENCY_MS = float(sys.argv[2]) if len(sys.argv) > 2 else 20
+FANOUT = 6
+MAX_DEPTH = 5
+PORT = 8799
+
+PARAGRAPH = "<p>Texto de ejemplo sobre trámites y normativa del Estado peruano.</p>" * 20
+
+class SiteHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        time.sleep(LATENCY_MS / 1000.0)
+        path = urlparse(self.path).path
+        i = int(path.rsplit("/", 1)[-1]) if path.startswith("/p/") else 0
+        if i >= PAGES:
+            body = b"not found"
+            self.send_response(404)
+        else:
+            children = [c for c in range(i * FANOUT + 1, i * FANOUT + FANOUT + 1) if c < PAGES]
+            links = "".join(f'<a href="/p/{c}">p{c}</a><a href="/p/{c}#main">#</a>' for c in children)
+            body = f'<html><body>{PARAGRAPH}<a href="/p/0">inicio</a>{links}</body></html>'.encode("utf-8")
+            self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        pass
+
+def crawl_blocking(base_url: str, output_dir: str, max_depth: int) -> int:
+    # Equivalente al crawler anterior (requests.get sin sesión), iterativo
+    domain = urlparse(base_url).netloc
+    seen = {normalize(base_url)}
+    pending = deque([(normalize(base_url), 1)])
+    saved = 0
+    while pending:
+        url, depth = pending.popleft()
+        response = httpx.get(url)
+        if response.status_code != 200:
+            continue
+        text, links = parse_page(url, response.content)
+        save_page(output_dir, url, text)
+        saved += 1
+        for link in links:
+            link = normalize(link)
+            if depth + 1 <= max_depth and link not in seen and urlparse(link).netloc == domain:
+                seen.add(link)
+                pending.append((link, depth + 1))
+    return saved
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", PORT), SiteHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{PORT}/p/0"
+    print(f"Sitio local: {PAGES} páginas, fanout={FANOUT}, latencia={LATENCY_MS} ms")
+
+    with tempfile.TemporaryDirectory() as out:
+        t0 = time.perf_counter()
+        saved = crawl_blocking(base_url, out, MAX_DEPTH)
+        elapsed = time.perf_counter() - t0
+        print(f"{'bloqueante':<12} páginas={saved:>5}  {elapsed:>7.2f} s  {saved / elapsed:>8.1f} pág/s")
+
+    with tempfile.TemporaryDirectory() as out:
+        crawler = Crawler(base_url, out, max_depth=MAX_DEPTH, per_host=16, verbose=False)
+        t0 = time.perf_counter()
+        stats = asyncio.run(crawler.run())
+        elapsed = time.perf_counter() - t0
+        saved = stats["guardadas"]
+        print(f"{'asyncio':<12} páginas={saved:>5}  {elapsed:>7.2f} s  {saved / elapsed:>8.1f} pág/s  ({stats})")
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
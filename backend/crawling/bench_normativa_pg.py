@@ -0,0 +1,71 @@
+import os, sys, glob, json, time, statistics
+from sqlalchemy import create_engine, text
+
+# Benchmark: ILIKE '%q%' vs full-text (tsvector + GIN) sobre normativa_index.
+# Uso: python crawling/bench_normativa_pg.py [--load]
+#   --load  carga antes el corpus crawleado (crawling/data/*/*.json) en normativa_index
+
+DB_URL = os.getenv("DATABASE_URL")
+DATA_GLOB = "./crawling/data/*/*.json"
+QUERIES = ["ubigeo", "contrato", "privacidad", "tributos", "reclamo", "registro de propiedad", "datos personales"]
+REPEAT = 20
+
+ILIKE_SQL = text("""
+    SELECT titulo, texto, url
+    FROM normativa_index
+    WHERE texto ILIKE :pattern
+    LIMIT 3;
+""")
+
+FTS_SQL = text("""
+    SELECT r.titulo, r.url, r.rank,
+           ts_headline('spanish', r.texto, r.q, 'MaxFragments=2, MinWords=10, MaxWords=30') AS snippet
+    FROM (
+        SELECT n.id, n.titulo, n.texto, n.url, q, ts_rank(n.texto_tsv, q) AS rank
+        FROM normativa_index n, websearch_to_tsquery('spanish', :query) q
+        WHERE n.texto_tsv @@ q
+        ORDER BY rank DESC, n.id
+        LIMIT 3
+    ) r
+    ORDER BY r.rank DESC, r.id;
+""")
+
+def load_corpus(conn):
+    rows = []
+    for path in glob.glob(DATA_GLOB):
+        with open(path, "r", encoding="utf-8") as f:
+            doc = json.load(f)
+        rows.append({"titulo": doc.get("titulo", ""), "texto": doc.get("texto", ""), "url": doc.get("url", path)})
+    if rows:
+        conn.execute(text("INSERT INTO normativa_index (titulo, texto, url) VALUES (:titulo, :texto, :url)"), rows)
+    return len(rows)
+
+def timeit(conn, stmt, params):
+    samples = []
+    for _ in range(REPEAT):
+        t0 = time.perf_counter()
+        conn.execute(stmt, params).fetchall()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+def main():
+    engine = create_engine(DB_URL)
+    with engine.begin() as conn:
+        if "--load" in sys.argv:
+            print(f"Documentos cargados: {load_corpus(conn)}")
+            conn.execute(text("ANALYZE normativa_index"))
+
+        total = conn.execute(text("SELECT count(*) FROM normativa_index")).scalar()
+        print(f"Corpus: {total} documentos, {REPEAT} repeticiones por consulta (mediana en ms)")
+        print(f"{'consulta':<25}{'ILIKE':>10}{'FTS':>10}{'hits FTS':>10}")
+        for q in QUERIES:
+            t_ilike = timeit(conn, ILIKE_SQL, {"pattern": f"%{q}%"})
+            t_fts = timeit(conn, FTS_SQL, {"query": q})
+            hits = conn.execute(
+                text("SELECT count(*) FROM normativa_index WHERE texto_tsv @@ websearch_to_tsquery('spanish', :q)"),
+                {"q": q}
+            ).scalar()
+            print(f"{q:<25}{t_ilike:>10.2f}{t_fts:>10.2f}{hits:>10}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import json, time, queue, threading
+from elasticsearch import helpers
+
+# Indexador bulk con buffer, compartido por los workers del crawler.
+# - add() solo encola (con backpressure si la cola se llena): el I/O de indexación
+#   sale del camino del fetch.
+# - Un hilo propio agrupa acciones RAW/CANON y las envía con helpers.streaming_bulk
+#   al llegar a max_actions, max_bytes o flush_seconds, lo que ocurra primero.
+# - Errores por ítem: los transitorios (429/5xx/conexión) se reintentan en el lote
+#   siguiente hasta max_retries; el resto se registra y se descarta. Es la única capa
+#   de reintentos: streaming_bulk corre con max_retries=0.
+# - Los resultados se asocian a las acciones por posición: dos acciones sobre el mismo
+#   documento en un lote (p. ej. touch + update de CANON) tienen cada una su resultado.
+# - on_result(action, ok) se llama una vez por acción: ok=True cuando ES la confirmó,
+#   ok=False cuando se descartó. Lo que dependa de que el documento esté indexado
+#   (p. ej. el content_hash de la frontera) debe esperar a ok=True.
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+_STOP = object()
+
+class BulkIndexer:
+    def __init__(self, es, max_actions: int = 500, max_bytes: int = 5 * 1024 * 1024,
+                 flush_seconds: float = 2.0, max_retries: int = 3, queue_size: int = 10000, on_event=None,
+                 on_result=None):
+        self.es = es
+        self.max_actions = max_actions
+        self.max_bytes = max_bytes
+        self.flush_seconds = flush_seconds
+        self.max_retries = max_retries
+        self.on_event = on_event or (lambda event, **fields: None)
+        self.on_result = on_result or (lambda action, ok: None)
+        self.stats = {"enviadas": 0, "errores": 0, "reintentos": 0, "lotes": 0}
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._attempts = {}
+        self._retry = []
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="bulk-indexer", daemon=True)
+            self._thread.start()
+        return self
+
+    def add(self, action: dict):
+        self._queue.put(action)
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+        return self.stats
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---------------------------
+    # Hilo de envío
+    # ---------------------------
+    def _run(self):
+        batch, size = [], 0
+        deadline = time.monotonic() + self.flush_seconds
+        while True:
+            try:
+                action = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                action = None
+            if action is _STOP:
+                self._flush(batch)
+                # Vaciar reintentos pendientes antes de terminar
+                while self._retry:
+                    time.sleep(1)
+                    self._flush([])
+                return
+            if action is not None:
+                batch.append(action)
+                size += len(json.dumps(action, ensure_ascii=False, default=str))
+            if len(batch) >= self.max_actions or size >= self.max_bytes or time.monotonic() >= deadline:
+                self._flush(batch)
+                batch, size = [], 0
+                deadline = time.monotonic() + self.flush_seconds
+
+    def _flush(self, batch: list):
+        batch = self._retry + batch
+        self._retry = []
+        if not batch:
+            return
+        failed = 0
+        t0 = time.perf_counter()
+        # yield_ok=True y sin reintentos internos: un resultado por acción, en el mismo orden
+        results = helpers.streaming_bulk(
+            self.es, batch,
+            chunk_size=self.max_actions, max_chunk_bytes=self.max_bytes,
+            raise_on_error=False, raise_on_exception=False, yield_ok=True, max_retries=0,
+        )
+        for action, (ok, item) in zip(batch, results):
+            if ok:
+                self._attempts.pop(id(action), None)
+                self.on_result(action, True)
+                continue
+            failed += 1
+            self._handle_failure(action, next(iter(item.values())))
+
+        self.stats["lotes"] += 1
+        self.stats["enviadas"] += len(batch) - failed
+        self.on_event("bulk_flush", actions=len(batch), failed=failed,
+                      took_ms=round((time.perf_counter() - t0) * 1000, 1))
+
+    def _handle_failure(self, action, result: dict):
+        status = result.get("status")
+        # Con raise_on_exception=False los errores de conexión llegan sin status numérico
+        transient = status in RETRY_STATUS or not isinstance(status, int)
+        if transient:
+            # Por identidad: la misma acción vuelve en _retry mientras le queden intentos
+            key = id(action)
+            self._attempts[key] = self._attempts.get(key, 0) + 1
+            if self._attempts[key] <= self.max_retries:
+                self.stats["reintentos"] += 1
+                self._retry.append(action)
+                return
+            del self._attempts[key]
+        self.stats["errores"] += 1
+        self.on_result(action, False)
+        self.on_event("bulk_item_error", index=result.get("_index"), id=result.get("_id"),
+                      status=status, error=json.dumps(result.get("error"), ensure_ascii=False, default=str)[:500])
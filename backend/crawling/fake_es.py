@@ -0,0 +1,190 @@
+import sys, json, random, argparse, threading
+from urllib.parse import urlsplit, unquote, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Stub mínimo compatible con Elasticsearch 8 para probar el crawler/indexador sin un cluster.
+# - GET / (product check), POST [/{index}]/_bulk (index, create, update con upsert),
+#   GET /{index}/_doc/{id}, POST [/{index}]/_mget.
+# - Los updates con script emulan el script de versionado de normativa_canon.
+# - Inyección de fallas por ítem (429) para ejercitar reintentos.
+#
+# Uso: python crawling/fake_es.py [--port 9200] [--fail-rate 0.1]
+
+DOCS = {}  # (index, id) -> _source
+STATE = {"fail_rate": 0.0, "bulk_requests": 0, "bulk_items": 0, "mget_requests": 0, "rejected": 0}
+_lock = threading.Lock()
+
+def apply_canon_script(source, params: dict) -> dict:
+    # Misma lógica que el script painless de scriptv2/hybrid_indexer
+    source.setdefault("version_history", [])
+    if source.get("current") is None or \
+            source.get("_meta", {}).get("content_hash") != params["meta"]["content_hash"]:
+        source["version_history"].append(params["version_entry"])
+    source["current"] = params["new_doc"]
+    source["_meta"] = params["meta"]
+    return source
+
+def filter_source(source: dict, includes) -> dict:
+    # Soporta rutas con punto ("_meta.content_hash")
+    out = {}
+    for path in includes:
+        src, dst, keys = source, out, path.split(".")
+        for k in keys[:-1]:
+            if not isinstance(src.get(k), dict):
+                break
+            src = src[k]
+            dst = dst.setdefault(k, {})
+        else:
+            if keys[-1] in src:
+                dst[keys[-1]] = src[keys[-1]]
+    return out
+
+def merge_doc(source: dict, doc: dict):
+    # Update parcial: como ES, los objetos anidados se combinan en vez de reemplazarse
+    for k, v in doc.items():
+        if isinstance(v, dict) and isinstance(source.get(k), dict):
+            merge_doc(source[k], v)
+        else:
+            source[k] = v
+
+def apply_action(op: str, meta: dict, body: dict):
+    index, doc_id = meta.get("_index"), meta.get("_id")
+    key = (index, doc_id)
+    if op in ("index", "create"):
+        if op == "create" and key in DOCS:
+            return 409, {"type": "version_conflict_engine_exception"}, None
+        created = key not in DOCS
+        DOCS[key] = body
+        return (201 if created else 200), None, "created" if created else "updated"
+    if op == "update":
+        if key not in DOCS:
+            if "upsert" not in body:
+                return 404, {"type": "document_missing_exception"}, None
+            DOCS[key] = body["upsert"]
+            return 201, None, "created"
+        if "script" in body:
+            apply_canon_script(DOCS[key], body["script"].get("params", {}))
+        else:
+            merge_doc(DOCS[key], body.get("doc", {}))
+        return 200, None, "updated"
+    if op == "delete":
+        existed = DOCS.pop(key, None) is not None
+        return (200 if existed else 404), None, "deleted" if existed else "not_found"
+    return 400, {"type": "illegal_argument_exception", "reason": f"op {op}"}, None
+
+class FakeESHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _send_json(self, status: int, body: dict):
+        raw = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("X-Elastic-Product", "Elasticsearch")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", "0")))
+
+    def _parts(self):
+        return [unquote(p) for p in urlsplit(self.path).path.strip("/").split("/") if p]
+
+    def do_GET(self):
+        parts = self._parts()
+        if not parts:
+            return self._send_json(200, {"name": "fake-es", "cluster_name": "fake",
+                                         "version": {"number": "8.11.0", "build_flavor": "default"},
+                                         "tagline": "You Know, for Search"})
+        if parts == ["_fake", "stats"]:
+            with _lock:
+                return self._send_json(200, dict(STATE, docs=len(DOCS)))
+        if len(parts) == 3 and parts[1] == "_doc":
+            with _lock:
+                source = DOCS.get((parts[0], parts[2]))
+            if source is None:
+                return self._send_json(404, {"_index": parts[0], "_id": parts[2], "found": False})
+            return self._send_json(200, {"_index": parts[0], "_id": parts[2], "found": True, "_source": source})
+        if parts[-1] == "_mget":
+            return self._mget(parts)
+        self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        parts = self._parts()
+        if parts and parts[-1] == "_bulk":
+            return self._bulk(parts)
+        if parts and parts[-1] == "_mget":
+            return self._mget(parts)
+        self._body()
+        self._send_json(404, {"error": "not found"})
+
+    do_PUT = do_POST
+
+    def _bulk(self, parts):
+        default_index = parts[0] if len(parts) > 1 else None
+        lines = [l for l in self._body().decode("utf-8").split("\n") if l.strip()]
+        items, errors, i = [], False, 0
+        with _lock:
+            STATE["bulk_requests"] += 1
+            while i < len(lines):
+                op, meta = next(iter(json.loads(lines[i]).items()))
+                meta.setdefault("_index", default_index)
+                body = json.loads(lines[i + 1]) if op != "delete" else {}
+                i += 1 if op == "delete" else 2
+                STATE["bulk_items"] += 1
+                if random.random() < STATE["fail_rate"]:
+                    STATE["rejected"] += 1
+                    status, error, result = 429, {"type": "es_rejected_execution_exception"}, None
+                else:
+                    status, error, result = apply_action(op, meta, body)
+                item = {"_index": meta["_index"], "_id": meta.get("_id"), "status": status}
+                if error:
+                    item["error"] = error
+                    errors = True
+                else:
+                    item["result"] = result
+                items.append({op: item})
+        self._send_json(200, {"took": 1, "errors": errors, "items": items})
+
+    def _mget(self, parts):
+        default_index = parts[0] if len(parts) > 1 else None
+        req = json.loads(self._body() or b"{}")
+        wanted = req.get("docs") or [{"_id": i} for i in req.get("ids", [])]
+        query = parse_qs(urlsplit(self.path).query)
+        default_includes = ",".join(query.get("_source_includes", [])).split(",") if "_source_includes" in query else None
+        docs = []
+        with _lock:
+            STATE["mget_requests"] += 1
+            for d in wanted:
+                index = d.get("_index", default_index)
+                source = DOCS.get((index, d["_id"]))
+                doc = {"_index": index, "_id": d["_id"], "found": source is not None}
+                if source is not None:
+                    includes = d.get("_source") if isinstance(d.get("_source"), list) else default_includes
+                    if includes:
+                        source = filter_source(source, includes)
+                    doc["_source"] = source
+                docs.append(doc)
+        self._send_json(200, {"docs": docs})
+
+    def log_message(self, fmt, *args):
+        pass
+
+def serve(port: int = 9200, fail_rate: float = 0.0) -> ThreadingHTTPServer:
+    STATE["fail_rate"] = fail_rate
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeESHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=9200)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server = serve(args.port, args.fail_rate)
+    print(f"Fake Elasticsearch en http://127.0.0.1:{args.port} (fail_rate={args.fail_rate})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+        sys.exit(0)
@@ -0,0 +1,330 @@
+import sqlite3, threading, itertools
+from urllib.parse import urlparse
+from queue import PriorityQueue
+from datetime import datetime, timedelta
+
+# Frontera persistente del crawler (SQLite en modo WAL).
+# - Cada URL guarda dominio, profundidad, prioridad, estado, intentos y último status.
+# - La cola de trabajo vive en memoria (PriorityQueue: menor prioridad = antes);
+#   SQLite es el registro durable para retomar un crawl interrumpido.
+# - Las escrituras se acumulan y un hilo propio las aplica en una sola transacción
+#   cada batch_size operaciones o flush_seconds, lo que ocurra primero. Como se aplican
+#   en orden, si quedó persistido que una página se completó también quedaron sus links.
+#
+# Una "ronda" es una corrida completa del crawl. Si la última ronda no terminó, se retoma
+# (las URLs pendientes vuelven a la cola); si terminó, empieza una nueva y las URLs ya
+# conocidas se reutilizan al volver a descubrirse.
+#
+# Revisitas:
+# - Por URL se guardan los validadores (ETag, Last-Modified, content_hash) para
+#   pedidos condicionales en la ronda siguiente. Los de un contenido nuevo se guardan
+#   con set_validators() recién cuando el indexador confirma el documento: si la
+#   indexación se pierde, la página se vuelve a descargar e indexar.
+# - intervalo_horas sigue la frecuencia de cambio observada: se reduce a la mitad
+#   cuando la página cambió y crece x1.5 cuando no; proxima_visita = visita + intervalo.
+# - Una ronda nueva solo encola las URLs vencidas; el resto queda "programada"
+#   (conocida, pero no se descarga en esta ronda).
+
+PENDIENTE, HECHO, NO_ENCONTRADA, FALLIDA, PROGRAMADA = "pendiente", "hecho", "no_encontrada", "fallida", "programada"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT PRIMARY KEY,
+    dominio TEXT NOT NULL,
+    profundidad INTEGER NOT NULL,
+    prioridad INTEGER NOT NULL,
+    estado TEXT NOT NULL DEFAULT 'pendiente',
+    intentos INTEGER NOT NULL DEFAULT 0,
+    ultimo_status INTEGER,
+    ultimo_error TEXT,
+    ronda TEXT NOT NULL,
+    descubierta_en TEXT,
+    actualizada_en TEXT
+);
+CREATE INDEX IF NOT EXISTS urls_ronda_estado ON urls (ronda, estado, prioridad);
+CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor TEXT);
+CREATE TABLE IF NOT EXISTS rondas (ronda TEXT PRIMARY KEY, iniciada_en TEXT);
+"""
+
+# Columnas agregadas después del esquema inicial (se crean si faltan)
+REVISIT_COLUMNS = {
+    "etag": "TEXT",
+    "last_modified": "TEXT",
+    "content_hash": "TEXT",
+    "intervalo_horas": "REAL",
+    "proxima_visita": "TEXT",
+    "cambios": "INTEGER NOT NULL DEFAULT 0",
+    "ultimo_cambio": "TEXT",
+}
+
+REVISIT_GROWTH = 1.5
+
+SQL_ADD = """
+    INSERT INTO urls (url, dominio, profundidad, prioridad, estado, intentos, ronda, descubierta_en, actualizada_en)
+    VALUES (?, ?, ?, ?, 'pendiente', 0, ?, ?, ?)
+    ON CONFLICT(url) DO UPDATE SET
+        profundidad = excluded.profundidad, prioridad = excluded.prioridad, estado = 'pendiente',
+        intentos = 0, ronda = excluded.ronda, actualizada_en = excluded.actualizada_en
+"""
+SQL_COMPLETE = """
+    UPDATE urls SET
+        estado = ?, ultimo_status = ?, ultimo_error = NULL, actualizada_en = ?,
+        etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified),
+        content_hash = COALESCE(?, content_hash), intervalo_horas = ?, proxima_visita = ?,
+        cambios = cambios + ?, ultimo_cambio = COALESCE(?, ultimo_cambio)
+    WHERE url = ?
+"""
+SQL_VALIDATORS = """
+    UPDATE urls SET
+        etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified), content_hash = ?
+    WHERE url = ?
+"""
+SQL_RETRY = "UPDATE urls SET estado = ?, intentos = ?, ultimo_error = ?, actualizada_en = ? WHERE url = ?"
+
+_STOP = (float("inf"), 0, None, 0, 0)
+
+def _now() -> str:
+    return datetime.utcnow().isoformat()
+
+class Frontier:
+    def __init__(self, path: str, priority_fn=None, batch_size: int = 500, flush_seconds: float = 1.0,
+                 max_attempts: int = 3, revisit_min_hours: float = 6, revisit_max_hours: float = 24 * 30,
+                 revisit_default_hours: float = 24, on_event=None):
+        self.path = path
+        self.priority_fn = priority_fn or (lambda domain, depth: depth)
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_attempts = max_attempts
+        self.revisit_min_hours = revisit_min_hours
+        self.revisit_max_hours = revisit_max_hours
+        self.revisit_default_hours = revisit_default_hours
+        self.on_event = on_event or (lambda event, **fields: None)
+        self.ronda = None
+        self.stats = {"agregadas": 0, "completadas": 0, "reintentos": 0, "fallidas": 0, "validadores": 0,
+                      "escrituras": 0, "lotes": 0}
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        existentes = {row[1] for row in self._conn.execute("PRAGMA table_info(urls)")}
+        for columna, tipo in REVISIT_COLUMNS.items():
+            if columna not in existentes:
+                self._conn.execute(f"ALTER TABLE urls ADD COLUMN {columna} {tipo}")
+        self._known = {}  # url -> validadores e intervalo de la visita anterior
+        self._db_lock = threading.Lock()
+        self._queue: "PriorityQueue" = PriorityQueue()
+        self._seq = itertools.count()
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    # ---------------------------
+    # Rondas
+    # ---------------------------
+    def _meta(self, clave: str):
+        row = self._conn.execute("SELECT valor FROM meta WHERE clave = ?", (clave,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, clave: str, valor: str):
+        self._conn.execute("INSERT INTO meta (clave, valor) VALUES (?, ?) "
+                           "ON CONFLICT(clave) DO UPDATE SET valor = excluded.valor", (clave, valor))
+
+    def begin_run(self, ronda: str, fresh: bool = False, estimate_intervals=None) -> str:
+        """Retoma la ronda inconclusa (salvo fresh) o empieza `ronda`. Devuelve la ronda vigente.
+
+        estimate_intervals(urls) -> {url: horas} estima el intervalo de revisita de las URLs
+        que todavía no tienen uno (p. ej. a partir del historial de versiones indexado)."""
+        with self._db_lock:
+            previa = self._meta("ronda")
+            if previa and self._meta("ronda_completa") != "1" and not fresh:
+                self.ronda = previa
+                pendientes = self._enqueue_pending()
+                self.on_event("frontier_resume", ronda=previa, pendientes=pendientes)
+            else:
+                # Una ronda nueva no reutiliza el nombre de otra (p. ej. dos corridas el mismo día)
+                self.ronda, n = ronda, 1
+                while self._conn.execute("SELECT 1 FROM rondas WHERE ronda = ? UNION ALL "
+                                         "SELECT 1 FROM urls WHERE ronda = ? LIMIT 1",
+                                         (self.ronda, self.ronda)).fetchone():
+                    n += 1
+                    self.ronda = f"{ronda}-{n}"
+                self._conn.execute("INSERT INTO rondas (ronda, iniciada_en) VALUES (?, ?)", (self.ronda, _now()))
+                if estimate_intervals is not None:
+                    self._estimate_intervals(estimate_intervals)
+                # Solo vuelven a la cola las URLs cuya revisita venció
+                self._conn.execute(
+                    "UPDATE urls SET ronda = ?, intentos = 0, estado = CASE "
+                    "WHEN proxima_visita IS NULL OR proxima_visita <= ? THEN ? ELSE ? END",
+                    (self.ronda, _now(), PENDIENTE, PROGRAMADA))
+                self._set_meta("ronda", self.ronda)
+                self._set_meta("ronda_completa", "0")
+                pendientes = self._enqueue_pending()
+                programadas = self._conn.execute("SELECT COUNT(*) FROM urls WHERE ronda = ? AND estado = ?",
+                                                 (self.ronda, PROGRAMADA)).fetchone()[0]
+                self.on_event("frontier_new_run", ronda=self.ronda, pendientes=pendientes, programadas=programadas)
+            self._known = {
+                url: {"etag": etag, "last_modified": last_modified, "content_hash": chash, "intervalo_horas": horas}
+                for url, etag, last_modified, chash, horas in self._conn.execute(
+                    "SELECT url, etag, last_modified, content_hash, intervalo_horas FROM urls "
+                    "WHERE ronda = ? AND (content_hash IS NOT NULL OR intervalo_horas IS NOT NULL)", (self.ronda,))
+            }
+        return self.ronda
+
+    def _enqueue_pending(self) -> int:
+        rows = self._conn.execute(
+            "SELECT url, profundidad, prioridad, intentos FROM urls WHERE ronda = ? AND estado = ?",
+            (self.ronda, PENDIENTE)).fetchall()
+        for url, depth, prioridad, intentos in rows:
+            self._queue.put((prioridad, next(self._seq), url, depth, intentos))
+        return len(rows)
+
+    def _estimate_intervals(self, estimate_intervals, chunk: int = 1000):
+        rows = self._conn.execute("SELECT url, actualizada_en FROM urls WHERE intervalo_horas IS NULL").fetchall()
+        now = datetime.utcnow()
+        for i in range(0, len(rows), chunk):
+            batch = dict(rows[i:i + chunk])
+            updates = []
+            for url, horas in estimate_intervals(list(batch)).items():
+                horas = self._clamp(horas)
+                visita = datetime.fromisoformat(batch[url]) if batch.get(url) else now
+                updates.append((horas, (visita + timedelta(hours=horas)).isoformat(), url))
+            self._conn.execute("BEGIN")
+            self._conn.executemany("UPDATE urls SET intervalo_horas = ?, proxima_visita = ? WHERE url = ?", updates)
+            self._conn.execute("COMMIT")
+        self.on_event("frontier_intervals_estimated", urls=len(rows))
+
+    def known_urls(self):
+        """(url, dominio, estado) de la ronda vigente."""
+        with self._db_lock:
+            return self._conn.execute("SELECT url, dominio, estado FROM urls WHERE ronda = ?",
+                                      (self.ronda,)).fetchall()
+
+    # ---------------------------
+    # Cola
+    # ---------------------------
+    def add(self, url: str, domain: str, depth: int):
+        prioridad = self.priority_fn(domain, depth)
+        now = _now()
+        self._write(SQL_ADD, (url, domain, depth, prioridad, self.ronda, now, now), "agregadas")
+        self._queue.put((prioridad, next(self._seq), url, depth, 0))
+
+    def get(self):
+        """(url, depth, intentos), o None cuando el worker debe terminar."""
+        _, _, url, depth, intentos = self._queue.get()
+        return None if url is None else (url, depth, intentos)
+
+    def task_done(self):
+        self._queue.task_done()
+
+    def join(self):
+        self._queue.join()
+
+    def stop_workers(self, n: int):
+        for _ in range(n):
+            self._queue.put(_STOP)
+
+    def validators(self, url: str) -> dict:
+        """Validadores de la visita anterior ({} si la URL es nueva)."""
+        return self._known.get(url, {})
+
+    def next_interval(self, prev_hours, changed) -> float:
+        if prev_hours is None:
+            horas = self.revisit_default_hours
+        elif changed is None:
+            horas = prev_hours
+        else:
+            horas = prev_hours / 2 if changed else prev_hours * REVISIT_GROWTH
+        return self._clamp(horas)
+
+    def _clamp(self, horas: float) -> float:
+        return min(self.revisit_max_hours, max(self.revisit_min_hours, horas))
+
+    def complete(self, url: str, status=None, estado: str = HECHO, etag=None, last_modified=None,
+                 content_hash=None, changed=None):
+        """Registra la visita y agenda la próxima. changed=None: no se sabe si cambió (sin hash previo)."""
+        prev = self._known.pop(url, {})
+        if not prev.get("content_hash"):
+            changed = None
+        horas = self.next_interval(prev.get("intervalo_horas"), changed)
+        now = datetime.utcnow()
+        self._write(SQL_COMPLETE, (
+            estado, status, now.isoformat(), etag, last_modified, content_hash,
+            horas, (now + timedelta(hours=horas)).isoformat(),
+            1 if changed else 0, now.isoformat() if changed else None, url,
+        ), "completadas")
+
+    def set_validators(self, url: str, etag=None, last_modified=None, content_hash=None):
+        """Validadores de un contenido ya indexado (ver complete(): los de un cambio no se guardan ahí)."""
+        self._write(SQL_VALIDATORS, (etag, last_modified, content_hash, url), "validadores")
+
+    def retry(self, item, error: str) -> bool:
+        """Reencola el item si le quedan intentos; si no, lo marca como fallido."""
+        url, depth, intentos = item
+        intentos += 1
+        if intentos < self.max_attempts:
+            self._write(SQL_RETRY, (PENDIENTE, intentos, error[:500], _now(), url), "reintentos")
+            # Penalizado por intento, para no reintentarlo de inmediato
+            prioridad = self.priority_fn(urlparse(url).netloc.lower(), depth) + intentos
+            self._queue.put((prioridad, next(self._seq), url, depth, intentos))
+            return True
+        self._write(SQL_RETRY, (FALLIDA, intentos, error[:500], _now(), url), "fallidas")
+        return False
+
+    # ---------------------------
+    # Escritura por lotes
+    # ---------------------------
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="frontier-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def _write(self, sql: str, params: tuple, stat: str):
+        with self._pending_lock:
+            self._pending.append((sql, params))
+            self.stats[stat] += 1
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        with self._pending_lock:
+            ops, self._pending = self._pending, []
+        if not ops:
+            return
+        with self._db_lock:
+            self._conn.execute("BEGIN")
+            try:
+                # Agrupa corridas consecutivas de la misma sentencia sin alterar el orden
+                for sql, group in itertools.groupby(ops, key=lambda op: op[0]):
+                    self._conn.executemany(sql, [params for _, params in group])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        self.stats["escrituras"] += len(ops)
+        self.stats["lotes"] += 1
+
+    def close(self) -> dict:
+        """Persiste lo pendiente; si ya no quedan URLs por visitar, la ronda queda completa."""
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        with self._db_lock:
+            restantes = self._conn.execute("SELECT COUNT(*) FROM urls WHERE ronda = ? AND estado = ?",
+                                           (self.ronda, PENDIENTE)).fetchone()[0]
+            if restantes == 0:
+                self._set_meta("ronda_completa", "1")
+            self._conn.close()
+        return dict(self.stats, pendientes=restantes)
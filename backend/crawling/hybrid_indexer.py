@@ -1,122 +1,272 @@
-import os, json, hashlib, datetime, sys
+import os, json, hashlib, datetime, sys, sqlite3, resource
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 from elasticsearch import Elasticsearch, helpers
 
+# Uso: python crawling/hybrid_indexer.py [CRAWL_VERSION] [--full] [--cache]
+#   --full   reindexa todo, aunque el content_hash no haya cambiado
+#   --cache  toma los hashes previos del último manifest local en vez de hacer mget a CANON_INDEX
+#
+# Pipeline de una sola pasada y memoria acotada:
+#   archivos (scandir) -> parseo en paralelo (procesos, ventana acotada)
+#   -> hashes previos por lotes -> acciones RAW + CANON (generador) -> streaming_bulk
+# El manifest (cambios en JSONL, hashes en SQLite) también se escribe en streaming.
+
 # Configuración
-es = Elasticsearch(hosts=["http://localhost:9200"])
+ES_URL = os.getenv("ES_URL", "http://localhost:9200")
+es = Elasticsearch(hosts=[ES_URL])
 BASE = "normativa"
 CANON_INDEX = f"{BASE}_canon"
 INPUT_DIR = "./normativa"
+MANIFEST_DIR = "./crawling/manifests"
+MGET_CHUNK = 1000
+PARSE_WORKERS = int(os.getenv("INDEXER_PARSE_WORKERS", str(os.cpu_count() or 2)))
+PARSE_BATCH = 64            # archivos por tarea del pool
+PARSE_WINDOW = PARSE_WORKERS * 4  # tareas en vuelo como máximo
+BULK_CHUNK = 500
+BULK_MAX_BYTES = 10 * 1024 * 1024
 
 def today_str():
     return datetime.date.today().isoformat()
 
-CRAWL_VERSION = sys.argv[1] if len(sys.argv) > 1 else today_str()
+ARGS = [a for a in sys.argv[1:] if not a.startswith("--")]
+FLAGS = {a for a in sys.argv[1:] if a.startswith("--")}
+CRAWL_VERSION = ARGS[0] if ARGS else today_str()
 RAW_INDEX = f"{BASE}-{CRAWL_VERSION}"
 
+CANON_SCRIPT = """
+    if (ctx._source.version_history == null) {
+        ctx._source.version_history = [];
+    }
+    if (ctx._source.current == null) {
+        ctx._source.current = params.new_doc;
+        ctx._source._meta = params.meta;
+        ctx._source.version_history.add(params.version_entry);
+    } else {
+        def prev_hash = ctx._source._meta.content_hash;
+        if (prev_hash != params.meta.content_hash) {
+            ctx._source.version_history.add(params.version_entry);
+        }
+        ctx._source.current = params.new_doc;
+        ctx._source._meta = params.meta;
+    }
+"""
+
 def sha256_text(s: str) -> str:
     return hashlib.sha256(s.encode("utf-8")).hexdigest()
 
-def index_raw_snapshots():
-    actions = []
-    now_iso = datetime.datetime.utcnow().isoformat()
-    count = 0
-
-    for fn in os.listdir(INPUT_DIR):
-        if not fn.endswith(".json"):
-            continue
-        path = os.path.join(INPUT_DIR, fn)
+# Lectura y parseo (una vez por archivo)
+def parse_files(paths):
+    out = []
+    for path in paths:
         with open(path, "r", encoding="utf-8") as f:
             doc = json.load(f)
+        fn = os.path.basename(path)
+        out.append((fn, doc.get("url", fn), doc, sha256_text(doc.get("texto", ""))))
+    return out
 
-        url = doc.get("url", fn)
-        texto = doc.get("texto", "")
-        chash = sha256_text(texto)
+def iter_batches(iterable, size: int):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
-        doc["_meta"] = {
-            "last_crawled_at": now_iso,
-            "crawl_version": CRAWL_VERSION,
-            "content_hash": chash
-        }
+def iter_parsed(workers: int = PARSE_WORKERS):
+    """(archivo, url, doc, content_hash) en orden de llegada; como mucho PARSE_WINDOW lotes en memoria."""
+    paths = (e.path for e in os.scandir(INPUT_DIR) if e.is_file() and e.name.endswith(".json"))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for batch in iter_batches(paths, PARSE_BATCH):
+            pending.add(pool.submit(parse_files, batch))
+            if len(pending) >= PARSE_WINDOW:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    yield from fut.result()
+        for fut in pending:
+            yield from fut.result()
 
-        actions.append({
-            "_op_type": "index",
-            "_index": RAW_INDEX,
-            "_id": url,
-            "_source": doc
-        })
-        count += 1
+# Hashes previos
+def previous_hashes_es(urls):
+    """content_hash vigente en CANON_INDEX, vía mget (solo _meta.content_hash)."""
+    resp = es.mget(index=CANON_INDEX, ids=list(urls), source_includes=["_meta.content_hash"])
+    return {d["_id"]: d["_source"].get("_meta", {}).get("content_hash")
+            for d in resp["docs"] if d.get("found")}
 
-    if actions:
-        helpers.bulk(es, actions)
-    return count
+def open_previous_manifest_db():
+    """Base de hashes del último manifest local anterior a esta versión (o None)."""
+    if not os.path.isdir(MANIFEST_DIR):
+        return None
+    previos = sorted(fn for fn in os.listdir(MANIFEST_DIR)
+                     if fn.endswith(".hashes.db") and fn[:-len(".hashes.db")] < CRAWL_VERSION)
+    if not previos:
+        return None
+    return sqlite3.connect(f"file:{os.path.join(MANIFEST_DIR, previos[-1])}?mode=ro", uri=True)
 
-def upsert_canonical_with_history():
-    now_iso = datetime.datetime.utcnow().isoformat()
-    actions = []
+def previous_hashes_db(conn, urls):
+    urls = list(urls)
+    rows = conn.execute(f"SELECT url, hash FROM hashes WHERE url IN ({','.join('?' * len(urls))})", urls)
+    return dict(rows.fetchall())
 
-    for fn in os.listdir(INPUT_DIR):
-        if not fn.endswith(".json"):
-            continue
-        path = os.path.join(INPUT_DIR, fn)
-        with open(path, "r", encoding="utf-8") as f:
-            doc = json.load(f)
+def iter_with_previous(parsed, lookup):
+    """Agrega el hash previo a cada documento, consultando por lotes de MGET_CHUNK."""
+    for batch in iter_batches(parsed, MGET_CHUNK):
+        previous = lookup({url for _, url, _, _ in batch}) if lookup else {}
+        for fn, url, doc, chash in batch:
+            yield fn, url, doc, chash, previous.get(url)
+
+# Manifest incremental
+class ManifestWriter:
+    """<version>.json (resumen), <version>.changes.jsonl y <version>.hashes.db, publicados al final."""
 
-        url = doc.get("url", fn)
-        texto = doc.get("texto", "")
-        titulo = doc.get("titulo", "")
-        chash = sha256_text(texto)
-
-        script = {
-            "source": """
-                if (ctx._source.version_history == null) {
-                    ctx._source.version_history = [];
-                }
-                if (ctx._source.current == null) {
-                    ctx._source.current = params.new_doc;
-                    ctx._source._meta = params.meta;
-                    ctx._source.version_history.add(params.version_entry);
-                } else {
-                    def prev_hash = ctx._source._meta.content_hash;
-                    if (prev_hash != params.meta.content_hash) {
-                        ctx._source.version_history.add(params.version_entry);
-                    }
-                    ctx._source.current = params.new_doc;
-                    ctx._source._meta = params.meta;
-                }
-            """,
+    def __init__(self, source: str):
+        os.makedirs(MANIFEST_DIR, exist_ok=True)
+        self.base = os.path.join(MANIFEST_DIR, CRAWL_VERSION)
+        self.source = source
+        self.counts = {"new": 0, "changed": 0, "unchanged": 0}
+        self._changes = open(self.base + ".changes.jsonl.tmp", "w", encoding="utf-8")
+        if os.path.exists(self.base + ".hashes.db.tmp"):
+            os.unlink(self.base + ".hashes.db.tmp")
+        self._db = sqlite3.connect(self.base + ".hashes.db.tmp")
+        self._db.execute("CREATE TABLE hashes (url TEXT PRIMARY KEY, hash TEXT NOT NULL)")
+        self._rows = []
+
+    def record(self, fn: str, url: str, chash: str, prev):
+        self._rows.append((url, chash))
+        if len(self._rows) >= MGET_CHUNK:
+            self._flush_rows()
+        if prev == chash:
+            self.counts["unchanged"] += 1
+            return "unchanged"
+        status = "new" if prev is None else "changed"
+        self.counts[status] += 1
+        self._changes.write(json.dumps({"url": url, "file": fn, "status": status, "content_hash": chash,
+                                        "previous_hash": prev}, ensure_ascii=False) + "\n")
+        return status
+
+    def _flush_rows(self):
+        self._db.executemany("INSERT OR REPLACE INTO hashes (url, hash) VALUES (?, ?)", self._rows)
+        self._rows = []
+
+    def commit(self) -> str:
+        self._flush_rows()
+        self._db.commit()
+        self._db.close()
+        self._changes.close()
+        os.replace(self.base + ".changes.jsonl.tmp", self.base + ".changes.jsonl")
+        os.replace(self.base + ".hashes.db.tmp", self.base + ".hashes.db")
+        manifest = {
+            "crawl_version": CRAWL_VERSION,
+            "generated_at": datetime.datetime.utcnow().isoformat(),
+            "raw_index": RAW_INDEX,
+            "canon_index": CANON_INDEX,
+            "previous_source": self.source,
+            "counts": self.counts,
+            "changes_file": os.path.basename(self.base + ".changes.jsonl"),
+            "hashes_db": os.path.basename(self.base + ".hashes.db"),
+        }
+        with open(self.base + ".json.tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(self.base + ".json.tmp", self.base + ".json")
+        return self.base + ".json"
+
+# Acciones
+def raw_action(url: str, doc: dict, meta: dict) -> dict:
+    doc["_meta"] = meta
+    return {"_op_type": "index", "_index": RAW_INDEX, "_id": url, "_source": doc}
+
+def canon_action(url: str, doc: dict, meta: dict, now_iso: str) -> dict:
+    texto, titulo = doc.get("texto", ""), doc.get("titulo", "")
+    version_entry = {"crawled_at": now_iso, "crawl_version": CRAWL_VERSION, "content_hash": meta["content_hash"]}
+    return {
+        "_op_type": "update",
+        "_index": CANON_INDEX,
+        "_id": url,
+        "script": {
+            "source": CANON_SCRIPT,
             "lang": "painless",
             "params": {
                 "new_doc": {"titulo": titulo, "texto": texto, "url": url},
-                "meta": {"last_crawled_at": now_iso, "crawl_version": CRAWL_VERSION, "content_hash": chash},
-                "version_entry": {"crawled_at": now_iso, "crawl_version": CRAWL_VERSION, "content_hash": chash}
+                "meta": meta,
+                "version_entry": version_entry
             }
+        },
+        "upsert": {
+            "current": {"titulo": titulo, "texto": texto, "url": url},
+            "_meta": meta,
+            "version_history": [version_entry]
         }
+    }
 
-        actions.append({
-            "_op_type": "update",
-            "_index": CANON_INDEX,
-            "_id": url,
-            "script": script,
-            "upsert": {
-                "current": {"titulo": titulo, "texto": texto, "url": url},
-                "_meta": {"last_crawled_at": now_iso, "crawl_version": CRAWL_VERSION, "content_hash": chash},
-                "version_history": [
-                    {"crawled_at": now_iso, "crawl_version": CRAWL_VERSION, "content_hash": chash}
-                ]
-            }
-        })
+def touch_action(url: str, now_iso: str) -> dict:
+    # Sin cambios: solo _meta.last_crawled_at (lo usa la estimación de revisitas de scriptv2).
+    # Sin upsert: si el documento no existe, ES responde 404 y no se crea uno a medias.
+    return {
+        "_op_type": "update",
+        "_index": CANON_INDEX,
+        "_id": url,
+        "doc": {"_meta": {"last_crawled_at": now_iso}},
+    }
 
-    if actions:
-        helpers.bulk(es, actions)
-        return len(actions)
-    return 0
+def iter_actions(items, manifest: ManifestWriter, stats: dict):
+    now_iso = datetime.datetime.utcnow().isoformat()
+    for fn, url, doc, chash, prev in items:
+        if manifest.record(fn, url, chash, prev) == "unchanged":
+            yield touch_action(url, now_iso)
+            stats["touch"] += 1
+            continue
+        meta = {"last_crawled_at": now_iso, "crawl_version": CRAWL_VERSION, "content_hash": chash}
+        yield raw_action(url, doc, meta)
+        yield canon_action(url, doc, meta, now_iso)
+        stats["raw"] += 1
+        stats["canon"] += 1
 
 def main():
-    n_raw = index_raw_snapshots()
-    n_canon = upsert_canonical_with_history()
+    full, use_cache = "--full" in FLAGS, "--cache" in FLAGS
+    prev_db = None
+    if full:
+        source, lookup = "full", None
+    elif use_cache:
+        prev_db = open_previous_manifest_db()
+        source = "manifest"
+        lookup = (lambda urls: previous_hashes_db(prev_db, urls)) if prev_db else None
+    else:
+        source, lookup = "mget", previous_hashes_es
+
+    manifest = ManifestWriter(source)
+    stats = {"raw": 0, "canon": 0, "touch": 0, "touch_missing": 0}
+    actions = iter_actions(iter_with_previous(iter_parsed(), lookup), manifest, stats)
+    errors = []
+    # streaming_bulk consume el generador por chunks: nunca hay más de un chunk en memoria
+    for ok, item in helpers.streaming_bulk(es, actions, chunk_size=BULK_CHUNK,
+                                           max_chunk_bytes=BULK_MAX_BYTES, max_retries=3,
+                                           raise_on_error=False):
+        if ok:
+            continue
+        op_type, result = next(iter(item.items()))
+        # Solo el touch es un update sin upsert: 404 = documento CANON inexistente, no es un error
+        if op_type == "update" and result.get("status") == 404:
+            stats["touch_missing"] += 1
+        else:
+            errors.append(item)
+    if prev_db is not None:
+        prev_db.close()
+    if errors:
+        # Como antes: sin manifest nuevo, la próxima corrida vuelve a comparar contra el anterior
+        raise helpers.BulkIndexError(f"{len(errors)} documento(s) no se indexaron", errors)
+    manifest_path = manifest.commit()
 
-    print(f"[{CRAWL_VERSION}] Snapshots indexados: {n_raw} en '{RAW_INDEX}'")
-    print(f"[{CRAWL_VERSION}] Canónicos upsert: {n_canon} en '{CANON_INDEX}'")
+    counts = manifest.counts
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"[{CRAWL_VERSION}] Nuevos: {counts['new']}, cambiados: {counts['changed']}, "
+          f"sin cambios: {counts['unchanged']} (hashes previos: {source})")
+    print(f"[{CRAWL_VERSION}] Snapshots indexados: {stats['raw']} en '{RAW_INDEX}'")
+    print(f"[{CRAWL_VERSION}] Canónicos upsert: {stats['canon']} en '{CANON_INDEX}'")
+    print(f"[{CRAWL_VERSION}] Sin cambios, last_crawled_at actualizado: {stats['touch']} "
+          f"(sin documento canónico: {stats['touch_missing']})")
+    print(f"[{CRAWL_VERSION}] Manifest: {manifest_path} (RSS pico: {peak_mb:.1f} MB)")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,40 +1,128 @@
-import requests
-from bs4 import BeautifulSoup
 import os
 import json
+import random
+import asyncio
+from collections import defaultdict
 from urllib.parse import urljoin, urlparse
 
-OUTPUT_DIR = "./crawling/data/gob_data"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+import httpx
+from bs4 import BeautifulSoup
+
+# Crawler asíncrono de gob.pe.
+# - Frontera explícita (cola BFS por profundidad) en lugar de recursión.
+# - Un solo cliente HTTP con pool de conexiones, timeouts y reintentos con backoff.
+# - Límite de concurrencia global y por host.
+# Salida: <titulo>.txt y <titulo>.json ({"titulo", "texto", "url"}) en OUTPUT_DIR.
+
+OUTPUT_DIR = os.getenv("CRAWL_OUTPUT_DIR", "./crawling/data/gob_data")
+BASE_URL = os.getenv("CRAWL_BASE_URL", "https://www.gob.pe/busquedas")
+MAX_DEPTH = int(os.getenv("CRAWL_MAX_DEPTH", "2"))
+CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "16"))
+PER_HOST_CONCURRENCY = int(os.getenv("CRAWL_PER_HOST_CONCURRENCY", "4"))
+TIMEOUT = float(os.getenv("CRAWL_TIMEOUT", "15"))
+MAX_RETRIES = int(os.getenv("CRAWL_MAX_RETRIES", "3"))
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+def normalize(url: str) -> str:
+    # El fragmento (#main) no cambia el documento: no se vuelve a descargar
+    return urlparse(url)._replace(fragment="").geturl()
+
+def title_for(url: str) -> str:
+    return url.split("/")[-1] or "index"
+
+def parse_page(url: str, content: bytes):
+    soup = BeautifulSoup(content, "html.parser")
+    text = " ".join([t.get_text(strip=True) for t in soup.find_all("p")])
+    links = [urljoin(url, link["href"]) for link in soup.find_all("a", href=True)]
+    return text, links
 
-BASE_URL = "https://www.gob.pe/busquedas"
-visited = set()
+def save_page(output_dir: str, url: str, text: str):
+    title = title_for(url)
+    with open(os.path.join(output_dir, f"{title}.txt"), "w", encoding="utf-8") as f:
+        f.write(text)
+    with open(os.path.join(output_dir, f"{title}.json"), "w", encoding="utf-8") as f:
+        json.dump({"titulo": title, "texto": text, "url": url}, f, ensure_ascii=False, indent=2)
 
-def crawl(url, depth=1, max_depth=2):
-    if depth > max_depth or url in visited:
-        return
-    visited.add(url)
-    try:
-        response = requests.get(url)
+class Crawler:
+    def __init__(self, base_url: str = BASE_URL, output_dir: str = OUTPUT_DIR, max_depth: int = MAX_DEPTH,
+                 concurrency: int = CONCURRENCY, per_host: int = PER_HOST_CONCURRENCY,
+                 timeout: float = TIMEOUT, max_retries: int = MAX_RETRIES, verbose: bool = True):
+        self.base_url = base_url
+        self.domain = urlparse(base_url).netloc
+        self.output_dir = output_dir
+        self.max_depth = max_depth
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.verbose = verbose
+        self.frontier: "asyncio.Queue[tuple[str, int]]" = asyncio.Queue()
+        self.seen = set()
+        self.host_slots = defaultdict(lambda: asyncio.Semaphore(per_host))
+        self.stats = {"guardadas": 0, "errores": 0, "reintentos": 0}
+
+    def log(self, msg: str):
+        if self.verbose:
+            print(msg)
+
+    def enqueue(self, url: str, depth: int):
+        url = normalize(url)
+        if depth > self.max_depth or url in self.seen or urlparse(url).netloc != self.domain:
+            return
+        self.seen.add(url)
+        self.frontier.put_nowait((url, depth))
+
+    async def fetch(self, client: httpx.AsyncClient, url: str):
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.host_slots[urlparse(url).netloc]:
+                    response = await client.get(url)
+                if response.status_code not in RETRY_STATUS:
+                    return response
+            except httpx.TransportError:
+                if attempt == self.max_retries:
+                    raise
+            if attempt < self.max_retries:
+                self.stats["reintentos"] += 1
+                await asyncio.sleep(random.uniform(0, min(8, 0.5 * 2 ** attempt)))
+        return response
+
+    async def process(self, client: httpx.AsyncClient, url: str, depth: int):
+        response = await self.fetch(client, url)
         if response.status_code != 200:
-            print(f"Error al acceder a {url}")
+            self.log(f"Error al acceder a {url}")
+            self.stats["errores"] += 1
             return
-        soup = BeautifulSoup(response.content, "html.parser")
-        text = " ".join([t.get_text(strip=True) for t in soup.find_all("p")])
-        title = url.split("/")[-1] or "index"
-        txt_path = os.path.join(OUTPUT_DIR, f"{title}.txt")
-        with open(txt_path, "w", encoding="utf-8") as f:
-            f.write(text)
-        json_path = os.path.join(OUTPUT_DIR, f"{title}.json")
-        with open(json_path, "w", encoding="utf-8") as f:
-            json.dump({"titulo": title, "texto": text, "url": url}, f, ensure_ascii=False, indent=2)
-        print(f"Guardado: {url}")
-        for link in soup.find_all("a", href=True):
-            href = link["href"]
-            full_url = urljoin(url, href)
-            if urlparse(full_url).netloc == urlparse(BASE_URL).netloc:
-                crawl(full_url, depth + 1, max_depth)
-    except Exception as e:
-        print(f"Error procesando {url}: {e}")
-
-crawl(BASE_URL)
+        # El parseo y la escritura no bloquean el event loop
+        text, links = await asyncio.to_thread(parse_page, url, response.content)
+        await asyncio.to_thread(save_page, self.output_dir, url, text)
+        self.stats["guardadas"] += 1
+        self.log(f"Guardado: {url}")
+        for link in links:
+            self.enqueue(link, depth + 1)
+
+    async def worker(self, client: httpx.AsyncClient):
+        while True:
+            url, depth = await self.frontier.get()
+            try:
+                await self.process(client, url, depth)
+            except Exception as e:
+                self.stats["errores"] += 1
+                self.log(f"Error procesando {url}: {e}")
+            finally:
+                self.frontier.task_done()
+
+    async def run(self) -> dict:
+        os.makedirs(self.output_dir, exist_ok=True)
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        async with httpx.AsyncClient(timeout=self.timeout, limits=limits, follow_redirects=True) as client:
+            self.enqueue(self.base_url, 1)
+            workers = [asyncio.create_task(self.worker(client)) for _ in range(self.concurrency)]
+            await self.frontier.join()
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        return self.stats
+
+if __name__ == "__main__":
+    print(asyncio.run(Crawler().run()))
@@ -1,4 +1,5 @@
 import os
+import sys
 import json
 import time
 import random
@@ -8,9 +9,14 @@ from queue import Queue
 from urllib.parse import urlparse, urljoin
 from datetime import datetime, date
 
+import httpx
+from bs4 import BeautifulSoup
 from playwright.sync_api import sync_playwright
 from elasticsearch import Elasticsearch
 
+from bulk_indexer import BulkIndexer
+from frontier import Frontier, HECHO, NO_ENCONTRADA
+
 # ==========================
 # CONFIGURACIÓN GENERAL
 # ==========================
@@ -23,11 +29,35 @@ START_URLS = [
 OUTPUT_HTML_DIR = "./crawling/html_snapshots"
 os.makedirs(OUTPUT_HTML_DIR, exist_ok=True)
 
-CONCURRENCY = 4
+CONCURRENCY = 16           # workers HTTP
+RENDER_WORKERS = 2         # hilos con Chromium (cada uno con su navegador)
+CONTEXT_MAX_PAGES = 50     # se recicla el contexto del navegador cada N páginas
+HTTP_TIMEOUT = 15
+MIN_STATIC_TEXT = 200      # menos texto que esto en el HTML plano => probablemente requiere JS
+LEARN_MIN_SAMPLES = 5      # muestras por dominio antes de fijar su modo
+LEARN_JS_RATIO = 0.8       # si >= 80% de sus páginas necesitó JS, el dominio va directo al navegador
 MAX_DEPTH_PER_DOMAIN = 2
 MAX_PAGES_PER_DOMAIN = 200
 MAX_RETRIES = 3
 
+# Frontera persistente: permite retomar un crawl interrumpido (ver frontier.py).
+# Con --fresh se descarta la ronda inconclusa y se empieza una nueva.
+FRONTIER_DB = os.getenv("CRAWL_FRONTIER_DB", "./crawling/frontier.db")
+FRONTIER_BATCH = 500        # escrituras por transacción
+FRONTIER_FLUSH_SECONDS = 1.0
+FRONTIER_MAX_ATTEMPTS = 3   # intentos por URL antes de darla por fallida
+DOMAIN_PRIORITY = {         # menor = antes; la profundidad suma 1 por nivel
+    "www.gob.pe": 0,
+    "www.notariado.org": 1,
+}
+DEFAULT_DOMAIN_PRIORITY = 2
+
+# Revisitas: cada URL se vuelve a pedir (condicional, con ETag/Last-Modified) cuando
+# vence su intervalo, que se adapta a cuán seguido cambia la página.
+REVISIT_MIN_HOURS = 6
+REVISIT_MAX_HOURS = 24 * 30
+REVISIT_DEFAULT_HOURS = 24
+
 PROXIES = [
     
 ]
@@ -35,7 +65,8 @@ PROXIES = [
 # ELASTICSEARCH
 # ==========================
 
-es = Elasticsearch(hosts=["http://localhost:9200"])
+ES_URL = os.getenv("ES_URL", "http://localhost:9200")
+es = Elasticsearch(hosts=[ES_URL])
 
 BASE = "normativa"
 
@@ -46,15 +77,28 @@ CRAWL_VERSION = today_str()
 RAW_INDEX = f"{BASE}-{CRAWL_VERSION}"
 CANON_INDEX = f"{BASE}_canon"
 
+BULK_MAX_ACTIONS = 500
+BULK_MAX_BYTES = 5 * 1024 * 1024
+BULK_FLUSH_SECONDS = 2.0
+
 # ==========================
 # ESTADO GLOBAL (THREAD-SAFE)
 # ==========================
 
-url_queue: "Queue[tuple[str,int]]" = Queue()
+render_queue: "Queue[tuple[str,int,int]]" = Queue()
 visited_by_domain = {}
 pages_per_domain = {}
+render_mode_by_domain = {}  # dominio -> {"http": n, "js": n}
+fetch_stats = {"http": 0, "browser": 0, "escalated": 0, "not_modified": 0, "unchanged": 0}
 state_lock = threading.Lock()
 
+http_client = httpx.Client(
+    timeout=HTTP_TIMEOUT,
+    follow_redirects=True,
+    limits=httpx.Limits(max_connections=CONCURRENCY, max_keepalive_connections=CONCURRENCY),
+    headers={"User-Agent": "Mozilla/5.0 (compatible; NotarIA-crawler/2.0)"},
+)
+
 # ==========================
 # UTILIDADES
 # ==========================
@@ -120,6 +164,69 @@ def load_page_universal(page, url: str) -> bool:
     log_event("page_load_failed", url=url)
     return False
 
+# Fetch HTTP (sin navegador)
+
+JS_MARKERS = (
+    "enable javascript", "habilite javascript", "activa javascript",
+    'id="__next"', 'id="root"', 'id="app"', "ng-app", "data-reactroot", "window.__nuxt__",
+)
+
+def fetch_static(url: str, headers=None):
+    """GET plano con retries; devuelve la respuesta o None si hay que escalar al navegador."""
+    for attempt in range(1, MAX_RETRIES + 1):
+        try:
+            r = http_client.get(url, headers=headers)
+            if r.status_code in (429, 500, 502, 503, 504):
+                raise httpx.HTTPStatusError(f"status {r.status_code}", request=r.request, response=r)
+            return r
+        except httpx.HTTPError as e:
+            log_event("http_fetch_error", url=url, attempt=attempt, error=str(e))
+            time.sleep(0.5 * attempt)
+    return None
+
+def conditional_headers(validators: dict) -> dict:
+    """If-None-Match / If-Modified-Since de la visita anterior, solo si su contenido ya está indexado."""
+    if not validators.get("content_hash"):
+        return {}
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+def extract_static(url: str, html: str):
+    """Título, texto y links desde el HTML, con el mismo criterio que extract_text()."""
+    soup = BeautifulSoup(html, "html.parser")
+    title = soup.title.get_text(strip=True) if soup.title else ""
+    for tag in soup(["script", "style", "noscript", "template"]):
+        tag.decompose()
+    nodes = soup.find_all(["p", "h1", "h2", "h3", "h4", "span", "article", "section", "div"])
+    texts = [t for t in (n.get_text(" ", strip=True) for n in nodes) if len(t) > 5]
+    links = [urljoin(url, a["href"]) for a in soup.find_all("a", href=True)]
+    return title, " ".join(texts), links
+
+def needs_js(html: str, text: str) -> bool:
+    if len(text) < MIN_STATIC_TEXT:
+        return True
+    head = html[:20000].lower()
+    # Shell de SPA con poco contenido propio
+    return any(m in head for m in JS_MARKERS) and len(text) < MIN_STATIC_TEXT * 5
+
+def record_render_mode(domain: str, used_js: bool):
+    with state_lock:
+        counts = render_mode_by_domain.setdefault(domain, {"http": 0, "js": 0})
+        counts["js" if used_js else "http"] += 1
+
+def domain_needs_browser(domain: str) -> bool:
+    """Flag aprendido: el dominio casi siempre necesita JS, no vale la pena el GET previo."""
+    with state_lock:
+        counts = render_mode_by_domain.get(domain)
+        if not counts:
+            return False
+        total = counts["http"] + counts["js"]
+        return total >= LEARN_MIN_SAMPLES and counts["js"] / total >= LEARN_JS_RATIO
+
 def extract_title(page) -> str:
     try:
         title = page.title()
@@ -158,11 +265,44 @@ def save_html_snapshot(url: str, html: str):
 # INDEXACIÓN EN ELASTICSEARCH
 # ==========================
 
-def index_document_es(url: str, title: str, text: str, is_asset: bool):
+# url -> acciones sin confirmar y validadores a guardar en la frontera cuando ES confirme todas
+pending_validators = {}
+pending_validators_lock = threading.Lock()
+
+def on_index_result(action: dict, ok: bool):
+    if "doc" in action:
+        # touch_document_es: no forma parte de la indexación del contenido
+        return
+    url = action.get("_id")
+    with pending_validators_lock:
+        pendiente = pending_validators.get(url)
+        if pendiente is None:
+            return
+        if ok:
+            pendiente["acciones"] -= 1
+        if ok and pendiente["acciones"]:
+            return
+        del pending_validators[url]
+    # Descartada: sin validadores nuevos, la próxima ronda la vuelve a descargar e indexar
+    if ok:
+        frontier.set_validators(url, **pendiente["validadores"])
+
+bulk_indexer = BulkIndexer(es, max_actions=BULK_MAX_ACTIONS, max_bytes=BULK_MAX_BYTES,
+                           flush_seconds=BULK_FLUSH_SECONDS, max_retries=MAX_RETRIES, on_event=log_event,
+                           on_result=on_index_result)
+
+def index_document_es(url: str, title: str, text: str, is_asset: bool, validators: dict = None):
+    """Encola las acciones RAW y CANON; el envío lo hace bulk_indexer en su propio hilo.
+
+    validators se guardan en la frontera recién cuando ES confirma todas las acciones."""
     content = text if text else url
     chash = sha256_text(content)
     now_iso = datetime.utcnow().isoformat()
 
+    if validators is not None:
+        with pending_validators_lock:
+            pending_validators[url] = {"acciones": 1 if is_asset else 2, "validadores": validators}
+
     raw_doc = {
         "titulo": title,
         "texto": text,
@@ -175,8 +315,7 @@ def index_document_es(url: str, title: str, text: str, is_asset: bool):
         }
     }
 
-    es.index(index=RAW_INDEX, id=url, document=raw_doc)
-    log_event("index_raw_ok", index=RAW_INDEX, url=url)
+    bulk_indexer.add({"_op_type": "index", "_index": RAW_INDEX, "_id": url, "_source": raw_doc})
 
     if not is_asset:
         script = {
@@ -229,8 +368,81 @@ def index_document_es(url: str, title: str, text: str, is_asset: bool):
             ]
         }
 
-        es.update(index=CANON_INDEX, id=url, script=script, upsert=upsert_doc)
-        log_event("index_canon_ok", index=CANON_INDEX, url=url)
+        bulk_indexer.add({
+            "_op_type": "update",
+            "_index": CANON_INDEX,
+            "_id": url,
+            "script": script,
+            "upsert": upsert_doc,
+            "retry_on_conflict": 3,
+        })
+
+def touch_document_es(url: str):
+    """Contenido sin cambios: solo se actualiza _meta.last_crawled_at en CANON (lo usa la estimación de revisitas)."""
+    bulk_indexer.add({
+        "_op_type": "update",
+        "_index": CANON_INDEX,
+        "_id": url,
+        "doc": {"_meta": {"last_crawled_at": datetime.utcnow().isoformat()}},
+        "retry_on_conflict": 3,
+    })
+
+# ==========================
+# FRONTERA
+# ==========================
+
+def frontier_priority(domain: str, depth: int) -> int:
+    return DOMAIN_PRIORITY.get(domain, DEFAULT_DOMAIN_PRIORITY) + depth
+
+frontier = Frontier(FRONTIER_DB, priority_fn=frontier_priority, batch_size=FRONTIER_BATCH,
+                    flush_seconds=FRONTIER_FLUSH_SECONDS, max_attempts=FRONTIER_MAX_ATTEMPTS,
+                    revisit_min_hours=REVISIT_MIN_HOURS, revisit_max_hours=REVISIT_MAX_HOURS,
+                    revisit_default_hours=REVISIT_DEFAULT_HOURS, on_event=log_event)
+
+def revisit_hours_from_history(version_history, last_crawled_at=None):
+    """Mitad del tiempo medio entre cambios según version_history; si nunca cambió,
+    todo el período observado. None si todavía no hay historia suficiente."""
+    fechas = sorted(datetime.fromisoformat(v["crawled_at"]) for v in version_history if v.get("crawled_at"))
+    if not fechas:
+        return None
+    fin = max(fechas[-1], datetime.fromisoformat(last_crawled_at)) if last_crawled_at else fechas[-1]
+    horas = (fin - fechas[0]).total_seconds() / 3600
+    if horas <= 0:
+        return None
+    cambios = len(fechas) - 1
+    return horas / cambios / 2 if cambios else horas
+
+def estimate_revisit_hours(urls):
+    """Intervalos iniciales de revisita desde CANON_INDEX, para URLs que la frontera aún no agendó."""
+    try:
+        resp = es.mget(index=CANON_INDEX, ids=urls, source_includes=["version_history", "_meta.last_crawled_at"])
+    except Exception as e:
+        log_event("revisit_estimate_error", error=str(e))
+        return {}
+    estimados = {}
+    for d in resp["docs"]:
+        if not d.get("found"):
+            continue
+        source = d["_source"]
+        try:
+            horas = revisit_hours_from_history(source.get("version_history") or [],
+                                               source.get("_meta", {}).get("last_crawled_at"))
+        except (TypeError, ValueError) as e:
+            # Una fecha ilegible no debe frenar la ronda: la URL queda con el intervalo por defecto
+            log_event("revisit_estimate_error", url=d["_id"], error=str(e))
+            continue
+        if horas:
+            estimados[d["_id"]] = horas
+    return estimados
+
+def restore_frontier_state():
+    """Al retomar una ronda, reconstruye visitados y páginas por dominio desde la frontera."""
+    with state_lock:
+        for url, domain, estado in frontier.known_urls():
+            visited_by_domain.setdefault(domain, set()).add(url)
+            pages_per_domain.setdefault(domain, 0)
+            if estado == HECHO:
+                pages_per_domain[domain] += 1
 
 # ==========================
 # CRAWL LÓGICO
@@ -254,9 +466,52 @@ def enqueue_url(url: str, depth: int):
             return
 
         visited_by_domain[domain].add(url)
-        url_queue.put((url, depth))
+        frontier.add(url, domain, depth)
+
+def handle_page(url: str, depth: int, html: str, title: str, text: str, links, via: str,
+                status=None, headers=None):
+    domain = get_domain(url)
+    chash = sha256_text(text if text else url)
+    headers = headers or {}
+    validators = {"etag": headers.get("etag"), "last_modified": headers.get("last-modified"), "content_hash": chash}
+    # Mismo contenido que la visita anterior: no hace falta snapshot ni reindexar
+    changed = chash != frontier.validators(url).get("content_hash")
+    if changed:
+        save_html_snapshot(url, html)
+        index_document_es(url=url, title=title, text=text, is_asset=False, validators=validators)
+    else:
+        touch_document_es(url)
+
+    with state_lock:
+        pages_per_domain[domain] += 1
+        current_pages = pages_per_domain[domain]
+        fetch_stats[via] += 1
+        if not changed:
+            fetch_stats["unchanged"] += 1
+
+    log_event("page_crawled", url=url, depth=depth, domain=domain, pages=current_pages, via=via, changed=changed)
+
+    if depth < MAX_DEPTH_PER_DOMAIN:
+        for link in links:
+            try:
+                link = clean_url(link)
+                if not link.startswith("http"):
+                    continue
+                if get_domain(link) != domain:
+                    continue
+                enqueue_url(link, depth + 1)
+            except Exception:
+                continue
+
+    # Después de encolar los links: la frontera persiste ambas cosas en orden.
+    # Si cambió, los validadores nuevos los guarda on_index_result cuando ES confirma.
+    if changed:
+        frontier.complete(url, status, changed=True)
+    else:
+        frontier.complete(url, status, changed=False, **validators)
 
-def process_page(page, url: str, depth: int):
+def process_page(url: str, depth: int) -> bool:
+    """Intenta la página por HTTP. Devuelve False si hay que renderizarla con el navegador."""
     domain = get_domain(url)
     log_event("crawl_start", url=url, depth=depth, domain=domain)
 
@@ -264,102 +519,189 @@ def process_page(page, url: str, depth: int):
     if is_asset_url(url):
         log_event("asset_detected", url=url, domain=domain)
         index_document_es(url=url, title="", text="", is_asset=True)
-        return
-
+        frontier.complete(url)
+        return True
+
+    if domain_needs_browser(domain):
+        return False
+
+    r = fetch_static(url, conditional_headers(frontier.validators(url)))
+    if r is None:
+        return False
+    if r.status_code == 304:
+        with state_lock:
+            fetch_stats["not_modified"] += 1
+        log_event("page_not_modified", url=url, depth=depth, domain=domain)
+        touch_document_es(url)
+        frontier.complete(url, 304, etag=r.headers.get("etag"), last_modified=r.headers.get("last-modified"),
+                          changed=False)
+        return True
+    if r.status_code in (404, 410):
+        log_event("page_not_found", url=url, status=r.status_code)
+        frontier.complete(url, r.status_code, NO_ENCONTRADA)
+        return True
+    if r.status_code != 200 or "html" not in r.headers.get("content-type", "html"):
+        return False
+
+    html = r.text
+    title, text, links = extract_static(url, html)
+    if needs_js(html, text):
+        record_render_mode(domain, used_js=True)
+        return False
+
+    record_render_mode(domain, used_js=False)
+    handle_page(url, depth, html, title, text, links, via="http", status=r.status_code, headers=r.headers)
+    return True
+
+def render_page(page, url: str, depth: int) -> bool:
     if not load_page_universal(page, url):
-        return
+        return False
 
     html = page.content()
     title = extract_title(page)
     text = extract_text(page)
 
-    save_html_snapshot(url, html)
-
-    index_document_es(url=url, title=title, text=text, is_asset=False)
-
     try:
         links = page.eval_on_selector_all("a[href]", "els => els.map(e => e.href)")
     except Exception:
         links = []
 
-    with state_lock:
-        pages_per_domain[domain] += 1
-        current_pages = pages_per_domain[domain]
+    handle_page(url, depth, html, title, text, links, via="browser")
+    return True
 
-    log_event("page_crawled", url=url, depth=depth, domain=domain, pages=current_pages)
+# ==========================
+# WORKERS
+# ==========================
 
-    if depth >= MAX_DEPTH_PER_DOMAIN:
-        return
+def fetch_worker(worker_id: int):
+    log_event("worker_started", worker_id=worker_id, kind="http")
+    while True:
+        item = frontier.get()
+        if item is None:
+            frontier.task_done()
+            break
 
-    for link in links:
+        url, depth, _ = item
         try:
-            link = clean_url(link)
-            if not link.startswith("http"):
+            if not process_page(url, depth):
+                # El render worker marca task_done al terminar
+                with state_lock:
+                    fetch_stats["escalated"] += 1
+                render_queue.put(item)
                 continue
-            if get_domain(link) != domain:
-                continue
-            enqueue_url(link, depth + 1)
-        except Exception:
-            continue
-
-# ==========================
-# WORKER
-# ==========================
-
-def worker_thread(worker_id: int):
+        except Exception as e:
+            log_event("worker_error", worker_id=worker_id, url=url, error=str(e))
+            frontier.retry(item, str(e))
+        frontier.task_done()
+    log_event("worker_stopped", worker_id=worker_id, kind="http")
+
+class BrowserSlot:
+    """Chromium propio del hilo (Playwright sync no se comparte entre hilos), lanzado
+    recién con la primera página que lo necesita; contexto aislado reciclado cada N páginas."""
+
+    def __init__(self, proxy=None):
+        self.proxy = proxy
+        self._pw = None
+        self.browser = None
+        self.context = None
+        self.page = None
+        self.pages = 0
+
+    def get_page(self):
+        if self.browser is None:
+            self._pw = sync_playwright().start()
+            self.browser = self._pw.chromium.launch(headless=True, proxy=self.proxy)
+        if self.context is None or self.pages >= CONTEXT_MAX_PAGES:
+            self._new_context()
+        self.pages += 1
+        return self.page
+
+    def _new_context(self):
+        if self.context is not None:
+            self.context.close()
+        self.context = self.browser.new_context()
+        self.page = self.context.new_page()
+        setup_blocking(self.page)
+        self.pages = 0
+
+    def close(self):
+        if self.context is not None:
+            self.context.close()
+        if self.browser is not None:
+            self.browser.close()
+            self._pw.stop()
+
+def render_worker(worker_id: int):
     proxy = None
     if PROXIES:
         proxy = {"server": random.choice(PROXIES)}
 
-    with sync_playwright() as pw:
-        browser = pw.chromium.launch(headless=True, proxy=proxy)
-        page = browser.new_page()
-        setup_blocking(page)
-
-        log_event("worker_started", worker_id=worker_id, proxy=proxy)
+    slot = BrowserSlot(proxy)
+    log_event("worker_started", worker_id=worker_id, kind="browser", proxy=proxy)
 
-        while True:
-            item = url_queue.get()
-            if item is None:
-                url_queue.task_done()
-                break
-
-            url, depth = item
-            try:
-                process_page(page, url, depth)
-            except Exception as e:
-                log_event("worker_error", worker_id=worker_id, url=url, error=str(e))
+    while True:
+        item = render_queue.get()
+        if item is None:
+            break
 
-            url_queue.task_done()
+        url, depth, _ = item
+        try:
+            if not render_page(slot.get_page(), url, depth):
+                frontier.retry(item, "page_load_failed")
+        except Exception as e:
+            log_event("worker_error", worker_id=worker_id, url=url, error=str(e))
+            frontier.retry(item, str(e))
+            # Contexto posiblemente roto: se descarta
+            slot.pages = CONTEXT_MAX_PAGES
+        frontier.task_done()
 
-        browser.close()
-        log_event("worker_stopped", worker_id=worker_id)
+    slot.close()
+    log_event("worker_stopped", worker_id=worker_id, kind="browser")
 
 # ==========================
 # MAIN
 # ==========================
 
 def main():
+    global CRAWL_VERSION, RAW_INDEX
+    # Si hay una ronda inconclusa se retoma, con su versión e índice RAW
+    CRAWL_VERSION = frontier.begin_run(CRAWL_VERSION, fresh="--fresh" in sys.argv,
+                                       estimate_intervals=estimate_revisit_hours)
+    RAW_INDEX = f"{BASE}-{CRAWL_VERSION}"
+    restore_frontier_state()
+
     log_event("crawl_init", seeds=START_URLS, raw_index=RAW_INDEX, canon_index=CANON_INDEX)
+    bulk_indexer.start()
+    frontier.start()
 
     for url in START_URLS:
         enqueue_url(url, depth=1)
 
     threads = []
     for i in range(CONCURRENCY):
-        t = threading.Thread(target=worker_thread, args=(i,), daemon=True)
+        t = threading.Thread(target=fetch_worker, args=(i,), daemon=True)
         threads.append(t)
         t.start()
+    renderers = []
+    for i in range(RENDER_WORKERS):
+        t = threading.Thread(target=render_worker, args=(i,), daemon=True)
+        renderers.append(t)
+        t.start()
 
-    url_queue.join()
+    frontier.join()
 
-    for _ in threads:
-        url_queue.put((None, 0))
+    frontier.stop_workers(len(threads))
+    for _ in renderers:
+        render_queue.put(None)
 
-    for t in threads:
+    for t in threads + renderers:
         t.join()
+    http_client.close()
+    index_stats = bulk_indexer.close()
+    frontier_stats = frontier.close()
 
-    log_event("crawl_done", domains=list(visited_by_domain.keys()))
+    log_event("crawl_done", domains=list(visited_by_domain.keys()), fetch=fetch_stats,
+              render_mode=render_mode_by_domain, indexing=index_stats, frontier=frontier_stats)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,4 +1,30 @@
+import itertools
+import contextvars
+from contextlib import contextmanager
+from flask import globals as flask_globals
 from flask_sqlalchemy import SQLAlchemy
 
+# Los workers en segundo plano (webhooks, outbox, jobs) corren como tareas del mismo
+# event loop: cada uno necesita su propia sesión para que un commit/rollback de uno
+# no arrastre los claims ni los cambios de otro.
+_worker_scope = contextvars.ContextVar("db_worker_scope", default=None)
+_worker_ids = itertools.count(1)
+
+def _scopefunc():
+    worker = _worker_scope.get()
+    if worker is not None:
+        return ("worker", worker)
+    return id(flask_globals.app_ctx._get_current_object())
+
 # Inicialización de la instancia de SQLAlchemy
-db = SQLAlchemy()
\ No newline at end of file
+db = SQLAlchemy(session_options={"scopefunc": _scopefunc})
+
+@contextmanager
+def worker_session():
+    """Da a la tarea actual una sesión propia de db.session hasta salir del bloque."""
+    token = _worker_scope.set(next(_worker_ids))
+    try:
+        yield db.session
+    finally:
+        db.session.remove()
+        _worker_scope.reset(token)
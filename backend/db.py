@@ -2,7 +2,13 @@
 from database import db
 from sqlalchemy.exc import SQLAlchemyError
 import os
-from sqlalchemy.sql import func
+import json
+import base64
+from datetime import datetime
+from sqlalchemy import text, tuple_
+from audit_sink import sink
+import kpis
+from models import Usuario, Contrato, Evidencia, Mensaje
 
 DB_URL = os.getenv("DATABASE_URL")
 
@@ -59,26 +65,27 @@ def update_video_attempt(evidence_id):
     return attempts
 
 def log_conversation(user_id, contract_id, mensaje_usuario, respuesta_sistema, ip):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO conversation_logs (user_id, contract_id, mensaje_usuario, respuesta_sistema, ip_origen)
-        VALUES (%s, %s, %s, %s, %s);
-    """, (user_id, contract_id, mensaje_usuario, respuesta_sistema, ip))
-    conn.commit()
-    cur.close()
-    conn.close()
+    # Escritura diferida: el commit lo hace el sink en lote, fuera del request
+    sink.submit("conversation_logs", {
+        "user_id": user_id,
+        "contract_id": contract_id,
+        "mensaje_usuario": mensaje_usuario,
+        "respuesta_sistema": respuesta_sistema,
+        "ip_origen": ip
+    })
 
 def audit_action(entidad, accion, usuario, detalle):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO audit_trail (entidad, accion, usuario_responsable, detalle_cambio)
-        VALUES (%s, %s, %s, %s);
-    """, (entidad, accion, usuario, detalle))
-    conn.commit()
-    cur.close()
-    conn.close()
+    sink.submit("audit_trail", {
+        "entidad": entidad,
+        "accion": accion,
+        "usuario_responsable": usuario,
+        "detalle_cambio": detalle
+    })
+
+def insert_conversation_log(record):
+    # Registros de ner_engine.audit_log
+    audit_action("ner", record.get("action"), record.get("user_id"),
+                 {"payload": record.get("payload"), "timestamp": record.get("timestamp")})
 
 def get_evidencia_by_token(token):
     conn = get_connection()
@@ -133,16 +140,133 @@ def update_evidencia_signed(evidencia_id, hash_final, blockchain_hash, tsa_times
 
 
 # ---------------------------
-# KPIs
+# HISTORIAL DE CHAT (paginación keyset sobre (fecha_creacion, id))
 # ---------------------------
-def get_kpi_tiempo_promedio():
+# fecha_creacion admite NULL: el orden es fecha DESC NULLS LAST, id DESC. Las filas
+# con fecha se leen por índice con (fecha, id) < cursor y, al agotarse, siguen las
+# filas sin fecha por id; un cursor con fecha null indica que ya se está en ese tramo.
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+
+def encode_cursor(fecha, row_id):
+    raw = json.dumps([fecha.isoformat() if fecha is not None else None, row_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def decode_cursor(cursor):
     try:
-        result = db.session.query(
-            func.avg(func.extract('epoch', Contrato.fecha_actualizacion - Contrato.fecha_creacion)).label("tiempo_promedio_segundos")
-        ).filter(Contrato.estado == 'firmado').one()
-        return result.tiempo_promedio_segundos
-    except SQLAlchemyError as e:
-        raise e
+        fecha, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return (datetime.fromisoformat(fecha) if fecha is not None else None), int(row_id)
+    except (ValueError, TypeError):
+        raise ValueError("Cursor inválido")
+
+def _page_size(limit):
+    return max(1, min(limit or HISTORY_PAGE_SIZE, HISTORY_MAX_PAGE_SIZE))
+
+def get_chats_page(usuario_id, cursor=None, limit=None):
+    # El subquery usa solo columnas de ix_chats_usuario_fecha_id (index-only scan);
+    # último mensaje y contrato salen de un probe por índice por cada chat de la página.
+    limit = _page_size(limit)
+    params = {"usuario_id": usuario_id, "limit": limit + 1}
+    keyset_fecha, keyset_sin_fecha = "", ""
+    if cursor:
+        c_fecha, params["c_id"] = decode_cursor(cursor)
+        if c_fecha is None:
+            keyset_fecha, keyset_sin_fecha = "AND false", "AND id < :c_id"
+        else:
+            params["c_fecha"] = c_fecha
+            keyset_fecha = "AND (fecha_creacion, id) < (:c_fecha, :c_id)"
+
+    rows = db.session.execute(text(f"""
+        SELECT c.id, c.nombre, c.estado, c.fecha_creacion, c.fecha_actualizacion,
+               m.contenido AS ultimo_mensaje,
+               k.id AS contrato_id, k.codigo AS contrato_codigo, k.titulo AS contrato_titulo,
+               k.estado AS contrato_estado
+        FROM (
+            SELECT * FROM (
+                (SELECT id, nombre, estado, fecha_creacion, fecha_actualizacion
+                 FROM chats
+                 WHERE usuario_id = :usuario_id AND fecha_creacion IS NOT NULL {keyset_fecha}
+                 ORDER BY fecha_creacion DESC, id DESC
+                 LIMIT :limit)
+                UNION ALL
+                (SELECT id, nombre, estado, fecha_creacion, fecha_actualizacion
+                 FROM chats
+                 WHERE usuario_id = :usuario_id AND fecha_creacion IS NULL {keyset_sin_fecha}
+                 ORDER BY id DESC
+                 LIMIT :limit)
+            ) u
+            ORDER BY fecha_creacion DESC NULLS LAST, id DESC
+            LIMIT :limit
+        ) c
+        LEFT JOIN LATERAL (
+            SELECT left(contenido, 200) AS contenido FROM mensajes
+            WHERE chat_id = c.id ORDER BY fecha_creacion DESC, id DESC LIMIT 1
+        ) m ON true
+        LEFT JOIN LATERAL (
+            SELECT id, codigo, titulo, estado FROM contratos WHERE chat_id = c.id ORDER BY id DESC LIMIT 1
+        ) k ON true
+        ORDER BY c.fecha_creacion DESC NULLS LAST, c.id DESC;
+    """), params).fetchall()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    items = [{
+        "chat_id": r.id,
+        "nombre": r.nombre,
+        "estado": r.estado,
+        "contrato": {
+            "id": r.contrato_id,
+            "codigo": r.contrato_codigo,
+            "titulo": r.contrato_titulo,
+            "estado": r.contrato_estado,
+        } if r.contrato_id is not None else None,
+        "fecha_creacion": r.fecha_creacion,
+        "fecha_actualizacion": r.fecha_actualizacion,
+        "ultimo_mensaje": r.ultimo_mensaje
+    } for r in rows]
+    next_cursor = encode_cursor(rows[-1].fecha_creacion, rows[-1].id) if has_more else None
+    return items, next_cursor
+
+def get_mensajes_page(chat_id, cursor=None, limit=None):
+    # Página de mensajes más recientes a más antiguos vía ix_mensajes_chat_fecha_id;
+    # metadatos (JSONB pesado) no se proyecta.
+    limit = _page_size(limit)
+    q = db.session.query(
+        Mensaje.id, Mensaje.remitente, Mensaje.contenido, Mensaje.fecha_creacion
+    ).filter(Mensaje.chat_id == chat_id)
+    c_fecha, c_id = decode_cursor(cursor) if cursor else (None, None)
+
+    rows = []
+    if not cursor or c_fecha is not None:
+        con_fecha = q.filter(Mensaje.fecha_creacion.isnot(None))
+        if cursor:
+            con_fecha = con_fecha.filter(tuple_(Mensaje.fecha_creacion, Mensaje.id) < (c_fecha, c_id))
+        rows = con_fecha.order_by(Mensaje.fecha_creacion.desc(), Mensaje.id.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        # Tramo final: mensajes sin fecha, por id
+        sin_fecha = q.filter(Mensaje.fecha_creacion.is_(None))
+        if c_id is not None and c_fecha is None:
+            sin_fecha = sin_fecha.filter(Mensaje.id < c_id)
+        rows += sin_fecha.order_by(Mensaje.id.desc()).limit(limit + 1 - len(rows)).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(rows[-1].fecha_creacion, rows[-1].id) if has_more else None
+    # Orden cronológico dentro de la página para mostrar en el chat
+    items = [{
+        "id": r.id,
+        "remitente": r.remitente,
+        "contenido": r.contenido,
+        "fecha": r.fecha_creacion
+    } for r in reversed(rows)]
+    return items, next_cursor
+
+# ---------------------------
+# KPIs
+# ---------------------------
+def get_kpi_tiempo_promedio(tipo_contrato_id=None, dia=None):
+    # Precalculado en kpi_agregados (ver kpis.py)
+    return kpis.promedio(kpis.KPI_TIEMPO_FIRMA, tipo_contrato_id, dia)
 
 # ---------------------------
 # CRAWLER
@@ -159,16 +283,24 @@ def insert_normativa(titulo, texto, url):
     cur.close()
     conn.close()
 
-def search_normativa_pg(query):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT titulo, texto, url
-        FROM normativa_index
-        WHERE texto ILIKE %s
-        LIMIT 3;
-    """, (f"%{query}%",))
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-    return [{"titulo": r[0], "texto": r[1], "url": r[2]} for r in rows]
\ No newline at end of file
+def search_normativa_pg(query, page=1, page_size=3):
+    # Full-text con índice GIN sobre texto_tsv (migrations/001_normativa_fts.sql).
+    # ts_headline solo se calcula sobre la página ya rankeada.
+    offset = max(page - 1, 0) * page_size
+    rows = db.session.execute(text("""
+        SELECT r.titulo, r.url, r.rank,
+               ts_headline('spanish', r.texto, r.q,
+                           'MaxFragments=2, MinWords=10, MaxWords=30, FragmentDelimiter= ... ') AS snippet
+        FROM (
+            SELECT n.id, n.titulo, n.texto, n.url, q, ts_rank(n.texto_tsv, q) AS rank
+            FROM normativa_index n, websearch_to_tsquery('spanish', :query) q
+            WHERE n.texto_tsv @@ q
+            ORDER BY rank DESC, n.id
+            LIMIT :limit OFFSET :offset
+        ) r
+        ORDER BY r.rank DESC, r.id;
+    """), {"query": query, "limit": page_size, "offset": offset}).fetchall()
+    return [
+        {"titulo": r.titulo, "texto": r.snippet, "url": r.url, "rank": float(r.rank)}
+        for r in rows
+    ]
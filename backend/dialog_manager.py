@@ -2,7 +2,8 @@ import random
 from typing import Dict, Optional
 from ner_engine import fill_slots_from_text, missing_message, audit_log
 from contracts_data import CONTRACTS
-from models import Usuario, Contrato, db
+from models import Usuario, Contrato
+from db import audit_action
 
 QUESTION_VARIANTS = {
     "default": [
@@ -46,14 +47,8 @@ def process_message(user_id: int, contract_type: str, current_slots: Dict[str, s
 
     new_slots = fill_slots_from_text(contract_type, next_slot["tipo_dato"], message, current_slots)
 
-    # Registrar auditoría
-    audit_entry = {
-        "usuario_id": user.id,
-        "accion": "slot_fill",
-        "detalle": {"message": message, "new_slots": new_slots}
-    }
-    db.session.add(audit_entry)
-    db.session.commit()
+    # Registrar auditoría (escritura diferida, sin commit en el request)
+    audit_action("contrato", "slot_fill", user.id, {"message": message, "new_slots": new_slots})
 
     next_q = get_next_question(contract_type, new_slots)
     if next_q:
@@ -0,0 +1,99 @@
+# Servidor Keynua falso para desarrollo y pruebas locales del cliente.
+# - POST /sign: consume el multipart por streaming y responde como Keynua.
+# - Inyección de fallas y latencia para ejercitar reintentos y circuit breaker.
+# - Respeta Idempotency-Key (misma key -> misma respuesta).
+#
+# Uso: python fake_keynua.py [--port 8765] [--fail-rate 0.2] [--latency-ms 50]
+#      KEYNUA_API=http://127.0.0.1:8765 uvicorn main:app
+
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+STATE = {"fail_rate": 0.0, "latency": 0.0, "requests": 0, "bytes": 0}
+_responses = {}
+_lock = threading.Lock()
+
+class FakeKeynuaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, para verificar reutilización de conexiones
+
+    def _send_json(self, status: int, body: dict):
+        raw = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _drain_body(self) -> int:
+        remaining = int(self.headers.get("Content-Length", "0"))
+        total = 0
+        while remaining > 0:
+            chunk = self.rfile.read(min(65536, remaining))
+            if not chunk:
+                break
+            total += len(chunk)
+            remaining -= len(chunk)
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            while True:
+                size = int(self.rfile.readline().strip() or b"0", 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                total += len(self.rfile.read(size))
+                self.rfile.readline()
+        return total
+
+    def do_GET(self):
+        if self.path == "/stats":
+            with _lock:
+                return self._send_json(200, dict(STATE))
+        self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        size = self._drain_body()
+        with _lock:
+            STATE["requests"] += 1
+            STATE["bytes"] += size
+        if STATE["latency"]:
+            time.sleep(STATE["latency"])
+        if self.path != "/sign":
+            return self._send_json(404, {"error": "not found"})
+        if random.random() < STATE["fail_rate"]:
+            return self._send_json(503, {"error": "unavailable"})
+
+        key = self.headers.get("Idempotency-Key") or uuid.uuid4().hex
+        with _lock:
+            if key not in _responses:
+                _responses[key] = {"id": uuid.uuid4().hex, "status": "sent", "received_bytes": size}
+            body = _responses[key]
+        self._send_json(200, body)
+
+    def log_message(self, fmt, *args):
+        pass
+
+def serve(port: int = 8765, fail_rate: float = 0.0, latency_ms: float = 0.0) -> ThreadingHTTPServer:
+    STATE["fail_rate"] = fail_rate
+    STATE["latency"] = latency_ms / 1000.0
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeKeynuaHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    server = serve(args.port, args.fail_rate, args.latency_ms)
+    print(f"Fake Keynua en http://127.0.0.1:{args.port} (fail_rate={args.fail_rate}, latency={args.latency_ms}ms)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+        sys.exit(0)
@@ -0,0 +1,111 @@
+# Servidor S3 mínimo (estilo MinIO, path-style) para probar S3BlobStore sin red.
+# - PUT/GET/HEAD/DELETE de objetos en memoria; los buckets se crean al primer PUT.
+# - Decodifica cuerpos aws-chunked (checksums en trailer de botocore reciente).
+# - No valida firmas: cualquier credencial sirve.
+#
+# Uso: python fake_s3.py [--port 9000]
+#      BLOB_BACKEND=s3 BLOB_S3_ENDPOINT=http://127.0.0.1:9000 \
+#      AWS_ACCESS_KEY_ID=x AWS_SECRET_ACCESS_KEY=x AWS_DEFAULT_REGION=us-east-1 uvicorn main:app
+
+import sys
+import hashlib
+import argparse
+import threading
+from urllib.parse import urlsplit, unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+OBJECTS = {}  # (bucket, key) -> (bytes, metadata)
+STATE = {"puts": 0, "gets": 0, "heads": 0, "bytes_in": 0}
+_lock = threading.Lock()
+
+class FakeS3Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _target(self):
+        path = unquote(urlsplit(self.path).path).lstrip("/")
+        bucket, _, key = path.partition("/")
+        return bucket, key
+
+    def _send(self, status: int, body: bytes = b"", headers: dict = None, head: bool = False):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body and not head:
+            self.wfile.write(body)
+
+    def _not_found(self, head: bool = False):
+        body = b"<?xml version=\"1.0\"?><Error><Code>NoSuchKey</Code><Message>Not found</Message></Error>"
+        self._send(404, body, {"Content-Type": "application/xml"}, head=head)
+
+    def _read_body(self) -> bytes:
+        raw = self.rfile.read(int(self.headers.get("Content-Length", "0")))
+        if "aws-chunked" not in self.headers.get("Content-Encoding", "") and \
+                not self.headers.get("x-amz-decoded-content-length"):
+            return raw
+        # <hex>[;chunk-signature=...]\r\n<datos>\r\n ... 0\r\n<trailers>\r\n\r\n
+        data, pos = bytearray(), 0
+        while True:
+            end = raw.index(b"\r\n", pos)
+            size = int(raw[pos:end].split(b";")[0], 16)
+            if size == 0:
+                return bytes(data)
+            data += raw[end + 2:end + 2 + size]
+            pos = end + 2 + size + 2
+
+    def do_PUT(self):
+        body = self._read_body()
+        bucket, key = self._target()
+        metadata = {k: v for k, v in self.headers.items() if k.lower().startswith("x-amz-meta-")}
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        with _lock:
+            if key:
+                OBJECTS[(bucket, key)] = (body, metadata)
+            STATE["puts"] += 1
+            STATE["bytes_in"] += len(body)
+        self._send(200, headers={"ETag": etag})
+
+    def _get(self, head: bool):
+        bucket, key = self._target()
+        with _lock:
+            STATE["heads" if head else "gets"] += 1
+            obj = OBJECTS.get((bucket, key))
+        if obj is None:
+            return self._not_found(head)
+        body, metadata = obj
+        headers = {"Content-Type": "application/octet-stream", "ETag": f'"{hashlib.md5(body).hexdigest()}"'}
+        headers.update(metadata)
+        self._send(200, body, headers, head=head)
+
+    def do_GET(self):
+        self._get(head=False)
+
+    def do_HEAD(self):
+        self._get(head=True)
+
+    def do_DELETE(self):
+        bucket, key = self._target()
+        with _lock:
+            OBJECTS.pop((bucket, key), None)
+        self._send(204)
+
+    def log_message(self, fmt, *args):
+        pass
+
+def serve(port: int = 9000) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeS3Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=9000)
+    args = parser.parse_args()
+    server = serve(args.port)
+    print(f"Fake S3 en http://127.0.0.1:{args.port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+        sys.exit(0)
@@ -0,0 +1,135 @@
+# ETag, compresión y caché de respuestas ya codificadas (usado por /preview).
+# - El ETag fuerte depende de la versión de la plantilla (y sus dependencias) y del hash
+#   de los slots: se calcula sin renderizar, así que un If-None-Match que coincide cuesta
+#   solo un hash. Cada codificación es otra representación: lleva su sufijo ("...-gzip").
+# - Cuerpos comprimidos (br si está instalado brotli, si no gzip) en un LRU por (etag, encoding).
+
+import os
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from serialization import canonical_dumps
+from template_engine import template_version
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él se sirve gzip
+    brotli = None
+
+PREVIEW_CACHE_MAX_BYTES = int(os.getenv("PREVIEW_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+
+# ---------------------------
+# ETag / If-None-Match
+# ---------------------------
+def preview_etag(template_name: str, slots: dict) -> str:
+    h = hashlib.sha256()
+    h.update(template_name.encode("utf-8"))
+    h.update(b"\0" + template_version(template_name).encode("ascii") + b"\0")
+    h.update(canonical_dumps(slots))
+    return f'"{h.hexdigest()[:32]}"'
+
+def representation_etag(etag: str, content_encoding: str) -> str:
+    if content_encoding == "identity":
+        return etag
+    return f'{etag[:-1]}-{content_encoding}"'
+
+def _base_etag(tag: str) -> str:
+    # If-None-Match usa comparación débil: W/"x" coincide con "x"
+    tag = tag.strip().removeprefix("W/")
+    for coding in ("br", "gzip"):
+        if tag.endswith(f'-{coding}"'):
+            return tag[:-len(coding) - 2] + '"'
+    return tag
+
+def matching_etag(if_none_match: str, etag: str):
+    """El tag de If-None-Match que corresponde a etag (en cualquier codificación), o None.
+
+    El 304 lo devuelve tal cual: es la representación que el cliente tiene guardada."""
+    if not if_none_match:
+        return None
+    if if_none_match.strip() == "*":
+        return etag
+    for tag in if_none_match.split(","):
+        if _base_etag(tag) == etag:
+            return tag.strip()
+    return None
+
+# ---------------------------
+# Compresión
+# ---------------------------
+def _accepted(accept_encoding: str) -> dict:
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    return accepted
+
+def choose_encoding(accept_encoding: str) -> str:
+    accepted = _accepted(accept_encoding)
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return "identity"
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        # mtime fijo: el mismo contenido produce los mismos bytes
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return body
+
+def encode_body(body: bytes, encoding: str):
+    """Devuelve (cuerpo, Content-Encoding efectivo); cuerpos chicos no se comprimen."""
+    if len(body) < COMPRESS_MIN_BYTES:
+        encoding = "identity"
+    return compress(body, encoding), encoding
+
+# ---------------------------
+# Caché de cuerpos codificados
+# ---------------------------
+class EncodedBodyCache:
+    # Clave: (etag, encoding pedido); valor: (cuerpo, Content-Encoding efectivo)
+    def __init__(self, max_bytes: int = PREVIEW_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, etag: str, encoding: str):
+        with self._lock:
+            entry = self._entries.get((etag, encoding))
+            if entry is not None:
+                self._entries.move_to_end((etag, encoding))
+            return entry
+
+    def put(self, etag: str, encoding: str, body: bytes, content_encoding: str) -> tuple:
+        entry = (body, content_encoding)
+        if len(body) > self.max_bytes:
+            return entry
+        with self._lock:
+            previous = self._entries.pop((etag, encoding), None)
+            if previous is not None:
+                self.size -= len(previous[0])
+            self._entries[(etag, encoding)] = entry
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+        return entry
+
+preview_cache = EncodedBodyCache()
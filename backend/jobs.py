@@ -0,0 +1,161 @@
+# Trabajos asíncronos persistidos en la tabla jobs.
+# - create_job() encola; un pool de workers los ejecuta fuera del request.
+# - Cada etapa queda registrada (inicio y duración) y es visible vía /jobs/{id}.
+# - Lease: si un worker muere, el job vuelve a tomarse al vencer lease_hasta; mientras
+#   el job avanza (stage/progress) el lease se renueva.
+# - Los tipos con max_concurrency solo se reclaman si hay cupo libre en este proceso.
+
+import os
+import time
+import asyncio
+import inspect
+import datetime as dt
+from collections import Counter
+from contextlib import asynccontextmanager
+from sqlalchemy import text
+from models import Job, db
+from database import worker_session
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_MAX_INTENTOS = int(os.getenv("JOB_MAX_INTENTOS", "3"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "0.5"))
+
+ESTADOS_FINALES = {"completado", "error"}
+
+JOB_HANDLERS = {}
+JOB_LIMITS = {}  # tipo -> máximo de jobs de ese tipo ejecutándose en este proceso
+_en_curso = Counter()
+
+def job_handler(tipo: str, max_concurrency: int = None):
+    def register(fn):
+        JOB_HANDLERS[tipo] = fn
+        if max_concurrency is not None:
+            JOB_LIMITS[tipo] = max_concurrency
+        return fn
+    return register
+
+def create_job(tipo: str, payload: dict, usuario_id: int = None) -> Job:
+    if tipo not in JOB_HANDLERS:
+        raise ValueError(f"Tipo de job desconocido: {tipo}")
+    job = Job(tipo=tipo, payload=payload, usuario_id=usuario_id, estado="en_cola", etapas=[])
+    db.session.add(job)
+    return job
+
+# ---------------------------
+# Progreso por etapa
+# ---------------------------
+class JobContext:
+    def __init__(self, job: Job):
+        self.job = job
+
+    @property
+    def payload(self) -> dict:
+        return self.job.payload
+
+    def _renew_lease(self):
+        self.job.lease_hasta = dt.datetime.utcnow() + dt.timedelta(seconds=JOB_LEASE_SECONDS)
+
+    def _lease_half_spent(self) -> bool:
+        restante = (self.job.lease_hasta - dt.datetime.utcnow()).total_seconds() if self.job.lease_hasta else 0
+        return restante < JOB_LEASE_SECONDS / 2
+
+    @asynccontextmanager
+    async def stage(self, nombre: str):
+        self.job.etapa = nombre
+        self.job.progreso = None
+        self._renew_lease()
+        db.session.commit()
+        inicio = dt.datetime.utcnow()
+        t0 = time.perf_counter()
+        yield
+        # Reasignar la lista para que SQLAlchemy detecte el cambio del JSONB
+        self.job.etapas = list(self.job.etapas or []) + [{
+            "nombre": nombre,
+            "inicio": inicio.isoformat(),
+            "duracion_ms": round((time.perf_counter() - t0) * 1000, 2)
+        }]
+        self._renew_lease()
+        db.session.commit()
+
+    def progress(self, porcentaje: int):
+        # Solo se escribe cuando cambia (o el lease va por la mitad), para no hacer
+        # un commit por línea de progreso
+        porcentaje = max(0, min(100, int(porcentaje)))
+        if porcentaje != self.job.progreso or self._lease_half_spent():
+            self.job.progreso = porcentaje
+            self._renew_lease()
+            db.session.commit()
+
+# ---------------------------
+# Workers
+# ---------------------------
+def _claim(excluidos=()):
+    row = db.session.execute(text("""
+        UPDATE jobs
+        SET estado = 'ejecutando', intentos = intentos + 1,
+            lease_hasta = timezone('utc', now()) + make_interval(secs => :lease)
+        WHERE id = (
+            SELECT id FROM jobs
+            WHERE (estado = 'en_cola'
+                   OR (estado = 'ejecutando' AND lease_hasta < timezone('utc', now())))
+              AND tipo <> ALL(:excluidos)
+            ORDER BY fecha_creacion
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, tipo;
+    """), {"lease": JOB_LEASE_SECONDS, "excluidos": list(excluidos)}).first()
+    db.session.commit()
+    return (row.id, row.tipo) if row else (None, None)
+
+def _saturados() -> list:
+    # Un job no debe gastar su lease esperando cupo: los tipos sin cupo no se reclaman
+    return [tipo for tipo, limite in JOB_LIMITS.items() if _en_curso[tipo] >= limite]
+
+async def run_job(job_id: str):
+    job = Job.query.get(job_id)
+    fn = JOB_HANDLERS.get(job.tipo)
+    try:
+        if fn is None:
+            raise LookupError(f"Sin handler para {job.tipo}")
+        resultado = fn(JobContext(job))
+        if inspect.isawaitable(resultado):
+            resultado = await resultado
+    except Exception as e:
+        db.session.rollback()
+        job = Job.query.get(job_id)
+        job.error = str(e)
+        job.estado = "error" if job.intentos >= JOB_MAX_INTENTOS else "en_cola"
+        db.session.commit()
+        return
+    job.resultado = resultado
+    job.estado = "completado"
+    job.etapa = None
+    job.progreso = None
+    job.lease_hasta = None
+    db.session.commit()
+
+async def _worker(stop: asyncio.Event):
+    # Sesión propia: el rollback de un job fallido no afecta al job de otro worker
+    with worker_session():
+        while not stop.is_set():
+            try:
+                job_id, tipo = _claim(_saturados())
+                if job_id:
+                    _en_curso[tipo] += 1
+                    try:
+                        await run_job(job_id)
+                    finally:
+                        _en_curso[tipo] -= 1
+                    continue
+            except Exception as e:
+                db.session.rollback()
+                print(f"[JOBS][ERROR] {e}")
+            try:
+                await asyncio.wait_for(stop.wait(), JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+async def run_job_workers(stop: asyncio.Event, workers: int = JOB_WORKERS):
+    await asyncio.gather(*(_worker(stop) for _ in range(workers)))
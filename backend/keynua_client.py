@@ -1,29 +1,202 @@
-import requests
 import os
+import json
+import time
+import uuid
+import random
+import asyncio
+import httpx
 from models import Contrato, Evidencia, db
+from outbox import notificar_estado_contrato
+from blob_store import local_path_for
 
 KEYNUA_API = os.getenv("KEYNUA_API", "https://api.keynua.com")
 KEYNUA_TOKEN = os.getenv("KEYNUA_TOKEN", "your_api_token")
 
-def send_to_keynua(pdf_path: str, signer_data: dict) -> dict:
-    headers = {"Authorization": f"Bearer {KEYNUA_TOKEN}"}
-    with open(pdf_path, "rb") as file:
-        files = {"file": file}
-        payload = {"signer": signer_data}
-        r = requests.post(f"{KEYNUA_API}/sign", headers=headers, files=files, data=payload)
-        if r.status_code == 200:
-            response = r.json()
-            # Registrar evidencia de envío
-            evidencia = Evidencia(
-                contrato_id=signer_data.get("contrato_id"),
-                tipo_id=1,  # Asumimos que 1 corresponde a "Envío a Keynua"
-                metadatos=response
-            )
-            db.session.add(evidencia)
-            db.session.commit()
-            return response
-        else:
-            r.raise_for_status()
+KEYNUA_MAX_CONNECTIONS = int(os.getenv("KEYNUA_MAX_CONNECTIONS", "20"))
+KEYNUA_CONNECT_TIMEOUT = float(os.getenv("KEYNUA_CONNECT_TIMEOUT", "5"))
+KEYNUA_READ_TIMEOUT = float(os.getenv("KEYNUA_READ_TIMEOUT", "60"))
+KEYNUA_MAX_RETRIES = int(os.getenv("KEYNUA_MAX_RETRIES", "3"))
+KEYNUA_BACKOFF_BASE = float(os.getenv("KEYNUA_BACKOFF_BASE", "0.5"))
+KEYNUA_BACKOFF_MAX = float(os.getenv("KEYNUA_BACKOFF_MAX", "8"))
+KEYNUA_BREAKER_FAILURES = int(os.getenv("KEYNUA_BREAKER_FAILURES", "5"))
+KEYNUA_BREAKER_RESET = float(os.getenv("KEYNUA_BREAKER_RESET", "30"))
+KEYNUA_BATCH_CONCURRENCY = int(os.getenv("KEYNUA_BATCH_CONCURRENCY", "8"))
+KEYNUA_BATCH_MAX = int(os.getenv("KEYNUA_BATCH_MAX", "200"))  # contratos por pedido a /keynua/batch
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+class KeynuaError(Exception):
+    pass
+
+class KeynuaUnavailable(KeynuaError):
+    """Circuito abierto: Keynua falló repetidamente y no se intenta la llamada."""
+
+# ---------------------------
+# Circuit breaker
+# ---------------------------
+class CircuitBreaker:
+    def __init__(self, max_failures: int = KEYNUA_BREAKER_FAILURES, reset_timeout: float = KEYNUA_BREAKER_RESET):
+        self.max_failures = max_failures
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def check(self):
+        if self.state == "open":
+            raise KeynuaUnavailable("Keynua no disponible (circuito abierto)")
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.max_failures:
+            self.opened_at = time.monotonic()
+
+def backoff_delay(attempt: int) -> float:
+    # Backoff exponencial con full jitter
+    return random.uniform(0, min(KEYNUA_BACKOFF_MAX, KEYNUA_BACKOFF_BASE * (2 ** attempt)))
+
+# ---------------------------
+# Cliente
+# ---------------------------
+class KeynuaClient:
+    def __init__(self, base_url: str = KEYNUA_API, token: str = KEYNUA_TOKEN,
+                 max_retries: int = KEYNUA_MAX_RETRIES, breaker: CircuitBreaker = None):
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self._http = httpx.AsyncClient(
+            base_url=base_url,
+            headers={"Authorization": f"Bearer {token}"},
+            timeout=httpx.Timeout(KEYNUA_READ_TIMEOUT, connect=KEYNUA_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=KEYNUA_MAX_CONNECTIONS,
+                                max_keepalive_connections=KEYNUA_MAX_CONNECTIONS),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._http.aclose()
+
+    async def send_document(self, pdf_path: str, signer_data: dict) -> dict:
+        # La misma Idempotency-Key en todos los reintentos evita envíos duplicados
+        idempotency_key = uuid.uuid4().hex
+        # pdf_path puede ser un URI del blob store (s3://...): se materializa localmente
+        local_path = await asyncio.to_thread(local_path_for, pdf_path)
+        filename = os.path.basename(local_path)
+        if not filename.endswith(".pdf"):
+            filename += ".pdf"
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            self.breaker.check()
+            try:
+                # El PDF se envía por streaming desde disco (chunks), sin cargarlo completo
+                with open(local_path, "rb") as file:
+                    r = await self._http.post(
+                        "/sign",
+                        files={"file": (filename, file, "application/pdf")},
+                        data={"signer": json.dumps(signer_data, ensure_ascii=False)},
+                        headers={"Idempotency-Key": idempotency_key},
+                    )
+            except httpx.TransportError as e:
+                last_error = e
+            else:
+                if r.status_code == 200:
+                    self.breaker.record_success()
+                    return r.json()
+                if r.status_code not in RETRY_STATUS:
+                    # Error del cliente: no cuenta para el circuito ni se reintenta
+                    r.raise_for_status()
+                    raise KeynuaError(f"Respuesta inesperada de Keynua: {r.status_code}")
+                last_error = KeynuaError(f"Keynua respondió {r.status_code}")
+
+            self.breaker.record_failure()
+            if attempt < self.max_retries:
+                await asyncio.sleep(backoff_delay(attempt))
+        raise KeynuaError(f"Keynua falló tras {self.max_retries + 1} intentos: {last_error}")
+
+_client = None
+
+def get_client() -> KeynuaClient:
+    global _client
+    if _client is None:
+        _client = KeynuaClient()
+    return _client
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+# ---------------------------
+# Evidencias
+# ---------------------------
+def build_envio_evidencia(contrato_id: int, response: dict) -> Evidencia:
+    return Evidencia(
+        contrato_id=contrato_id,
+        tipo_id=1,  # Asumimos que 1 corresponde a "Envío a Keynua"
+        metadatos=response
+    )
+
+async def send_to_keynua(pdf_path: str, signer_data: dict) -> dict:
+    response = await get_client().send_document(pdf_path, signer_data)
+    # Registrar evidencia de envío (el commit ocurre después del I/O, no durante)
+    db.session.add(build_envio_evidencia(signer_data.get("contrato_id"), response))
+    db.session.commit()
+    return response
+
+# ---------------------------
+# Envío por lotes
+# ---------------------------
+async def submit_batch(client: KeynuaClient, items: list, concurrency: int = KEYNUA_BATCH_CONCURRENCY) -> dict:
+    """Envía varios PDFs en paralelo (acotado). items: [{"contrato_id", "pdf_path", "signer"}]."""
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(item):
+        async with slots:
+            try:
+                return item, await client.send_document(item["pdf_path"], item["signer"]), None
+            except (KeynuaError, httpx.HTTPError, OSError) as e:
+                return item, None, e
+
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*(one(item) for item in items))
+    elapsed = time.perf_counter() - t0
+
+    enviados = [(item, resp) for item, resp, err in results if err is None]
+    fallidos = [(item, err) for item, resp, err in results if err is not None]
+    return {
+        "enviados": enviados,
+        "fallidos": fallidos,
+        "segundos": elapsed,
+        "docs_por_segundo": len(enviados) / elapsed if elapsed > 0 else None,
+    }
+
+async def send_batch_to_keynua(items: list, concurrency: int = KEYNUA_BATCH_CONCURRENCY) -> dict:
+    result = await submit_batch(get_client(), items, concurrency)
+    # Todas las evidencias de envío en una sola transacción
+    db.session.add_all([build_envio_evidencia(item["contrato_id"], resp) for item, resp in result["enviados"]])
+    db.session.commit()
+    return {
+        "enviados": [{"contrato_id": item["contrato_id"], "respuesta": resp} for item, resp in result["enviados"]],
+        "fallidos": [{"contrato_id": item["contrato_id"], "error": str(err)} for item, err in result["fallidos"]],
+        "segundos": round(result["segundos"], 3),
+        "docs_por_segundo": result["docs_por_segundo"],
+    }
 
 def handle_webhook(data: dict):
     transaction_id = data.get("transaction_id")
@@ -31,6 +204,8 @@ def handle_webhook(data: dict):
     contrato = Contrato.query.filter_by(codigo=transaction_id).first()
     if contrato:
         contrato.estado = status
+        # La notificación se confirma junto con el cambio de estado
+        notificar_estado_contrato(contrato)
         db.session.commit()
         return {"ok": True}
-    return {"error": "Contrato no encontrado"}
\ No newline at end of file
+    return {"error": "Contrato no encontrado"}
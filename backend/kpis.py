@@ -0,0 +1,111 @@
+# KPIs de contratos mantenidos de forma incremental.
+# - Cada cambio de Contrato.estado actualiza sumas y conteos en kpi_agregados,
+#   en la misma transacción que el cambio de estado.
+# - Se acumula por (tipo de contrato, día) y en filas de total, de modo que
+#   /metrics lee valores precalculados por clave primaria.
+
+import datetime as dt
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert
+from models import Contrato, KpiAgregado, KPI_TODOS_TIPOS, KPI_TODOS_DIAS
+
+ESTADOS = ["borrador", "en_proceso", "enviado_keynua", "firmado", "entregado", "cancelado"]
+
+KPI_TIEMPO_FIRMA = "tiempo_firma"
+
+def kpi_etapa(estado: str) -> str:
+    return f"etapa:{estado}"
+
+def kpi_funnel(estado: str) -> str:
+    return f"funnel:{estado}"
+
+# ---------------------------
+# Escritura
+# ---------------------------
+def _upsert(conn, kpi: str, tipo_contrato_id: int, dia: dt.date, valor: float):
+    # Se actualizan las 4 granularidades: total, por tipo, por día y por tipo+día
+    rows = [
+        {"kpi": kpi, "tipo_contrato_id": t, "dia": d, "suma": valor, "conteo": 1,
+         "fecha_actualizacion": dt.datetime.utcnow()}
+        for t in {KPI_TODOS_TIPOS, tipo_contrato_id or KPI_TODOS_TIPOS}
+        for d in {KPI_TODOS_DIAS, dia}
+    ]
+    stmt = insert(KpiAgregado.__table__).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["kpi", "tipo_contrato_id", "dia"],
+        set_={
+            "suma": KpiAgregado.__table__.c.suma + stmt.excluded.suma,
+            "conteo": KpiAgregado.__table__.c.conteo + stmt.excluded.conteo,
+            "fecha_actualizacion": stmt.excluded.fecha_actualizacion,
+        }
+    )
+    conn.execute(stmt)
+
+def _transiciones(session):
+    for obj in session.new:
+        if isinstance(obj, Contrato):
+            yield obj, None, obj.estado or "borrador"
+    for obj in session.dirty:
+        if isinstance(obj, Contrato):
+            # estado usa active_history, así que deleted trae el valor previo aunque
+            # el atributo estuviera expirado al asignarlo
+            hist = inspect(obj).attrs.estado.history
+            anterior = hist.deleted[0] if hist.deleted else None
+            if hist.added and hist.added[0] != anterior:
+                yield obj, anterior, hist.added[0]
+
+@event.listens_for(Session, "before_flush")
+def registrar_transiciones(session, flush_context, instances):
+    pendientes = list(_transiciones(session))
+    if not pendientes:
+        return
+
+    conn = session.connection()
+    ahora = dt.datetime.utcnow()
+    hoy = ahora.date()
+    for contrato, anterior, nuevo in pendientes:
+        meta = contrato.metadatos if contrato.metadatos is not None else {}
+        creado = contrato.fecha_creacion or ahora
+
+        # Tiempo en la etapa que se abandona
+        if anterior:
+            desde = meta.get("estado_desde")
+            inicio = dt.datetime.fromisoformat(desde) if desde else creado
+            _upsert(conn, kpi_etapa(anterior), contrato.tipo_contrato_id, hoy, (ahora - inicio).total_seconds())
+
+        _upsert(conn, kpi_funnel(nuevo), contrato.tipo_contrato_id, hoy, 0)
+
+        if nuevo == "firmado":
+            _upsert(conn, KPI_TIEMPO_FIRMA, contrato.tipo_contrato_id, hoy, (ahora - creado).total_seconds())
+
+        meta["estado_desde"] = ahora.isoformat()
+        contrato.metadatos = meta
+
+# ---------------------------
+# Lectura (O(1): búsqueda por clave primaria)
+# ---------------------------
+def get_kpi(kpi: str, tipo_contrato_id: int = None, dia: dt.date = None):
+    return KpiAgregado.query.get((kpi, tipo_contrato_id or KPI_TODOS_TIPOS, dia or KPI_TODOS_DIAS))
+
+def promedio(kpi: str, tipo_contrato_id: int = None, dia: dt.date = None):
+    row = get_kpi(kpi, tipo_contrato_id, dia)
+    return row.promedio if row else None
+
+def funnel(tipo_contrato_id: int = None, dia: dt.date = None) -> dict:
+    rows = KpiAgregado.query.filter(
+        KpiAgregado.kpi.in_([kpi_funnel(e) for e in ESTADOS]),
+        KpiAgregado.tipo_contrato_id == (tipo_contrato_id or KPI_TODOS_TIPOS),
+        KpiAgregado.dia == (dia or KPI_TODOS_DIAS)
+    ).all()
+    conteos = {r.kpi.split(":", 1)[1]: r.conteo for r in rows}
+    return {e: conteos.get(e, 0) for e in ESTADOS}
+
+def duracion_etapas(tipo_contrato_id: int = None, dia: dt.date = None) -> dict:
+    rows = KpiAgregado.query.filter(
+        KpiAgregado.kpi.in_([kpi_etapa(e) for e in ESTADOS]),
+        KpiAgregado.tipo_contrato_id == (tipo_contrato_id or KPI_TODOS_TIPOS),
+        KpiAgregado.dia == (dia or KPI_TODOS_DIAS)
+    ).all()
+    promedios = {r.kpi.split(":", 1)[1]: r.promedio for r in rows}
+    return {e: promedios.get(e) for e in ESTADOS}
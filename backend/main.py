@@ -1,45 +1,44 @@
-import os
-import hashlib
-import secrets
+import json
+import asyncio
 import datetime as dt
-import smtplib
-from email.mime.text import MIMEText
 from fastapi import FastAPI, Depends, UploadFile, File, HTTPException, Request
-from auth import verify_token, create_token
-from template_engine import render_html, html_to_pdf
-from keynua_client import send_to_keynua, handle_webhook
-from models import Usuario, Contrato, Evidencia, db
+from fastapi.responses import Response, StreamingResponse
+from auth import create_token, authenticate_user_async, get_current_user
+from template_engine import render_html
+from keynua_client import KEYNUA_BATCH_CONCURRENCY, KEYNUA_BATCH_MAX, send_batch_to_keynua, close_client as close_keynua_client
+from dialog_manager import process_message
+from models import Usuario, Chat, Contrato, Evidencia, Job, db
+from db import get_chats_page, get_mensajes_page
+from webhook_queue import enqueue_event, run_consumer as run_webhook_consumer
+from outbox import run_dispatcher as run_outbox_dispatcher
+from jobs import ESTADOS_FINALES, JOB_POLL_SECONDS, create_job, run_job_workers
+from confirmacion import shutdown_pdf_executor
+import video_processing  # registra el job "video"
+from audit_sink import sink as audit_sink
+from blob_store import get_blob_store
+import kpis
+from serialization import FastJSONResponse, FastJSONRoute, dumps as json_dumps
+from http_cache import preview_cache, preview_etag, representation_etag, matching_etag, choose_encoding, encode_body
 
-app = FastAPI()
-os.makedirs(os.getenv("VIDEOS_DIR"), exist_ok=True)
+app = FastAPI(default_response_class=FastJSONResponse)
+app.router.route_class = FastJSONRoute
+_consumer_stop = asyncio.Event()
 
-VIDEOS_DIR = os.getenv("VIDEOS_DIR", "./videos")
+@app.on_event("startup")
+async def start_background_consumers():
+    app.state.webhook_consumer = asyncio.create_task(run_webhook_consumer(_consumer_stop))
+    app.state.outbox_dispatcher = asyncio.create_task(run_outbox_dispatcher(_consumer_stop))
+    app.state.job_workers = asyncio.create_task(run_job_workers(_consumer_stop))
 
-# ---------------------------
-# Utilidades
-# ---------------------------
-def generate_sha256(file_path: str) -> str:
-    sha256 = hashlib.sha256()
-    with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            sha256.update(chunk)
-    return sha256.hexdigest()
-
-def send_email(to_email: str, subject: str, body: str):
-    smtp_server = os.getenv("SMTP_HOST")
-    smtp_port = os.getenv("SMTP_PORT")
-    from_email = os.getenv("SMTP_EMAIL")
-    password = os.getenv("SMTP_PASSWORD")
-
-    msg = MIMEText(body)
-    msg["Subject"] = subject
-    msg["From"] = from_email
-    msg["To"] = to_email
-
-    with smtplib.SMTP(smtp_server, smtp_port) as server:
-        server.starttls()
-        server.login(from_email, password)
-        server.sendmail(from_email, [to_email], msg.as_string())
+@app.on_event("shutdown")
+async def shutdown_resources():
+    _consumer_stop.set()
+    await app.state.webhook_consumer
+    await app.state.outbox_dispatcher
+    await app.state.job_workers
+    shutdown_pdf_executor()
+    audit_sink.close()
+    await close_keynua_client()
 
 # ---------------------------
 # Endpoints
@@ -52,66 +51,134 @@ async def login(data: dict):
     token = create_token(user_id)
     return {"access_token": token, "token_type": "bearer"}
 
+@app.post("/auth/login")
+async def auth_login(data: dict):
+    correo = data.get("correo")
+    contrasena = data.get("contrasena")
+    if not correo or not contrasena:
+        raise HTTPException(status_code=401, detail="Credenciales inválidas")
+    user = await authenticate_user_async(correo, contrasena)
+    token = create_token(user.id)
+    return {"api_key": token, "usuario_id": user.id, "access_token": token, "token_type": "bearer"}
+
 @app.post("/next-turn")
-async def next_turn(data: dict, user=Depends(verify_token)):
+async def next_turn(data: dict, user=Depends(get_current_user)):
     contract_type = data["contract_type"]
     message = data["message"]
     current_slots = data.get("filled_slots", {})
-    result = process_message(user["sub"], contract_type, current_slots, message)
+    result = process_message(user.id, contract_type, current_slots, message)
     return result
 
 @app.post("/preview")
-async def preview_contract(data: dict, user=Depends(verify_token)):
-    html = render_html(f"{data['contract_type']}_template.html", data["filled_slots"])
-    return {"html": html}
+async def preview_contract(data: dict, request: Request, user=Depends(get_current_user)):
+    template_name = f"{data['contract_type']}_template.html"
+    etag = preview_etag(template_name, data["filled_slots"])
+    headers = {"Vary": "Accept-Encoding", "Cache-Control": "private, no-cache"}
+    # Preview sin cambios: ni render ni transferencia
+    matched = matching_etag(request.headers.get("If-None-Match"), etag)
+    if matched:
+        headers["ETag"] = matched
+        return Response(status_code=304, headers=headers)
 
-@app.post("/confirm")
-async def confirm_contract(data: dict, user=Depends(verify_token)):
+    encoding = choose_encoding(request.headers.get("Accept-Encoding"))
+    cached = preview_cache.get(etag, encoding)
+    if cached is None:
+        html = render_html(template_name, data["filled_slots"])
+        body, content_encoding = encode_body(json_dumps({"html": html}), encoding)
+        cached = preview_cache.put(etag, encoding, body, content_encoding)
+    body, content_encoding = cached
+    headers["ETag"] = representation_etag(etag, content_encoding)
+    if content_encoding != "identity":
+        headers["Content-Encoding"] = content_encoding
+    return Response(body, media_type="application/json", headers=headers)
+
+@app.post("/confirm", status_code=202)
+async def confirm_contract(data: dict, user=Depends(get_current_user)):
     contrato = Contrato.query.get(data.get("contract_id"))
     if not contrato:
         raise HTTPException(status_code=404, detail="Contrato no encontrado")
 
-    html = render_html(f"{data['contract_type']}_template.html", data['filled_slots'])
-    pdf_path = html_to_pdf(html, f"./output/{data['contract_type']}.pdf")
-
-    hash_doc = generate_sha256(pdf_path)
-    codigo_probatorio = secrets.token_hex(4)
-    token = secrets.token_urlsafe(16)
-    link_expiration = dt.datetime.utcnow() + dt.timedelta(minutes=15)
-
-    evidencia = Evidencia(
-        contrato_id=contrato.id,
-        tipo_id=1,
-        metadatos={
-            "hash_documento": hash_doc,
-            "codigo_probatorio": codigo_probatorio,
-            "link_temporal": token,
-            "link_expiration": link_expiration
-        }
-    )
-    db.session.add(evidencia)
+    # Render, PDF, hash, evidencia y correo corren en jobs.run_job_workers
+    job = create_job("confirmacion", {
+        "contract_id": contrato.id,
+        "contract_type": data["contract_type"],
+        "filled_slots": data["filled_slots"],
+        "email": data.get("email")
+    }, usuario_id=user.id)
     db.session.commit()
+    return {"job_id": job.id, "estado": job.estado, "status_url": f"/jobs/{job.id}"}
 
-    base_front = os.getenv("URL_BASE_FRONTEND")
-    enlace = f"{base_front}/video/{token}"
+def _get_own_job(job_id: str, user) -> Job:
+    job = Job.query.get(job_id)
+    if not job or job.usuario_id != user.id:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+    return job
 
-    # Enviar correo (SMTP o simulado)
-    send_email(data.get("email"), "Enlace para video probatorio",
-               f"Ingrese al siguiente enlace: {enlace}\nCódigo: {codigo_probatorio}")
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str, user=Depends(get_current_user)):
+    return _get_own_job(job_id, user).to_dict()
 
-    return {
-        "evidence_id": evidencia.id,
-        "token": token,
-        "link": enlace,
-        "codigo_probatorio": codigo_probatorio
-    }
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, user=Depends(get_current_user)):
+    _get_own_job(job_id, user)
+
+    async def stream():
+        ultimo = None
+        while True:
+            # Cada lectura en una transacción nueva para ver el progreso del worker
+            db.session.rollback()
+            job = Job.query.get(job_id)
+            estado = json_dumps(job.to_dict())
+            if estado != ultimo:
+                yield b"event: " + job.estado.encode() + b"\ndata: " + estado + b"\n\n"
+                ultimo = estado
+            if job.estado in ESTADOS_FINALES:
+                return
+            await asyncio.sleep(JOB_POLL_SECONDS)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.post("/keynua/batch")
+async def keynua_batch(data: dict, user=Depends(get_current_user)):
+    # data: {"contratos": [{"contract_id": ..., "signer": {...}}, ...], "concurrency": 8}
+    pedidos = data.get("contratos") or []
+    if not isinstance(pedidos, list):
+        raise HTTPException(status_code=422, detail="contratos debe ser una lista")
+    if len(pedidos) > KEYNUA_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"Máximo {KEYNUA_BATCH_MAX} contratos por lote")
+    try:
+        concurrency = int(data.get("concurrency") or KEYNUA_BATCH_CONCURRENCY)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=422, detail="concurrency debe ser un entero")
+    # El cliente puede pedir menos paralelismo, nunca más que el configurado
+    concurrency = min(max(1, concurrency), KEYNUA_BATCH_CONCURRENCY)
+    ids = [p.get("contract_id") for p in pedidos]
+    contratos = {c.id: c for c in Contrato.query.filter(Contrato.id.in_(ids), Contrato.creador_id == user.id).all()}
+
+    items, rechazados = [], []
+    for p in pedidos:
+        contrato = contratos.get(p.get("contract_id"))
+        if not contrato or not contrato.archivo_original_url:
+            rechazados.append({"contrato_id": p.get("contract_id"), "error": "Contrato no encontrado o sin PDF"})
+            continue
+        signer = dict(p.get("signer") or {}, contrato_id=contrato.id)
+        items.append({"contrato_id": contrato.id, "pdf_path": contrato.archivo_original_url, "signer": signer})
+
+    result = await send_batch_to_keynua(items, concurrency)
+    result["fallidos"].extend(rechazados)
+    return result
 
 @app.get("/validate-link")
 async def validate_link(token: str):
-    evidencia = Evidencia.query.filter_by(metadatos={"link_temporal": token}).first()
+    evidencia = Evidencia.query.filter(Evidencia.metadatos["link_temporal"].astext == token).first()
     if not evidencia:
         raise HTTPException(status_code=404, detail="Token no encontrado")
-    if evidencia.metadatos.get("estado_link") != "activo" or dt.datetime.utcnow() > evidencia.metadatos.get("link_expiration"):
+    try:
+        expiracion = dt.datetime.fromisoformat(evidencia.metadatos.get("link_expiration"))
+    except (TypeError, ValueError):
+        # Sin fecha de expiración válida el link no se da por vigente
+        expiracion = None
+    if evidencia.metadatos.get("estado_link") != "activo" or expiracion is None or dt.datetime.utcnow() > expiracion:
         return {"valid": False, "reason": "Link expirado o bloqueado"}
 
     contrato = Contrato.query.get(evidencia.contrato_id)
@@ -125,55 +192,99 @@ async def validate_link(token: str):
     }
 
 @app.post("/upload-video")
-async def upload_video(token: str, file: UploadFile = File(...), user=Depends(verify_token)):
-    evidencia = Evidencia.query.filter(Evidencia.metadatos["link_temporal"] == token).first()
+async def upload_video(token: str, file: UploadFile = File(...), user=Depends(get_current_user)):
+    evidencia = Evidencia.query.filter(Evidencia.metadatos["link_temporal"].astext == token).first()
     if not evidencia:
         raise HTTPException(status_code=404, detail="Token no encontrado")
 
-    video_path = os.path.join(VIDEOS_DIR, f"{token}.mp4")
-    with open(video_path, "wb") as f:
-        f.write(await file.read())
+    # Se copia por chunks desde el temporal del upload, hasheando en la misma pasada
+    ref = await asyncio.to_thread(get_blob_store().put_fileobj, file.file)
 
-    evidencia.metadatos["video_url"] = video_path
+    evidencia.metadatos["video_url"] = ref.uri
+    evidencia.metadatos["video_sha256"] = ref.sha256
+    evidencia.metadatos["video_bytes"] = ref.size
     evidencia.metadatos["intentos_video"] = evidencia.metadatos.get("intentos_video", 0) + 1
     if evidencia.metadatos["intentos_video"] >= 2:
         evidencia.metadatos["estado_link"] = "bloqueado"
+    # Duración, miniatura y versión de revisión se generan en segundo plano (video_processing)
+    job = create_job("video", {
+        "evidencia_id": evidencia.id,
+        "video_url": ref.uri,
+        "video_sha256": ref.sha256
+    }, usuario_id=user.id)
     db.session.commit()
 
     return {
         "status": "bloqueado" if evidencia.metadatos["intentos_video"] >= 2 else "activo",
-        "attempts": evidencia.metadatos["intentos_video"]
+        "attempts": evidencia.metadatos["intentos_video"],
+        "job_id": job.id
     }
 
-@app.post("/webhook-keynua")
+@app.post("/webhook-keynua", status_code=202)
 async def webhook_keynua(request: Request):
-    data = await request.json()
-    pdf_signed_path = data.get("signed_pdf_path")
-    hash_final = generate_sha256(pdf_signed_path)
-    tsa_timestamp = dt.datetime.utcnow()
-    blockchain_hash = f"bc_{hash_final[:16]}"
-
-    evidencia = Evidencia.query.get(data.get("evidence_id"))
-    if evidencia:
-        evidencia.metadatos.update({
-            "hash_documento": hash_final,
-            "blockchain_hash": blockchain_hash,
-            "tsa_timestamp": tsa_timestamp,
-            "estado_link": "firmado"
-        })
-        db.session.commit()
-
-    return {"ok": True}
+    # Solo se persiste el evento; hash y actualizaciones los hace webhook_queue.run_consumer
+    raw_body = await request.body()
+    try:
+        data = json.loads(raw_body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="JSON inválido")
+    created = enqueue_event(data, raw_body, request.headers)
+    return {"ok": True, "duplicado": not created}
+
+@app.get("/chat/historial")
+async def chat_historial(cursor: str = None, limit: int = None, user=Depends(get_current_user)):
+    try:
+        items, next_cursor = get_chats_page(user.id, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"data": items, "next_cursor": next_cursor}
 
 @app.get("/chats/history")
-async def chat_history(user=Depends(verify_token)):
-    history = []
-    return {"history": history}
+async def chat_history(cursor: str = None, limit: int = None, user=Depends(get_current_user)):
+    result = await chat_historial(cursor, limit, user)
+    return {"history": result["data"], "next_cursor": result["next_cursor"]}
 
-@app.get("/metrics")
-async def metrics():
-    tiempo_promedio = db.session.query(
-        db.func.avg(db.func.extract('epoch', Contrato.fecha_actualizacion - Contrato.fecha_creacion))
-    ).filter(Contrato.estado == 'firmado').scalar()
+@app.get("/chat/{chat_id}")
+async def chat_detail(chat_id: int, cursor: str = None, limit: int = None, user=Depends(get_current_user)):
+    chat = db.session.query(Chat.id, Chat.nombre, Chat.estado, Chat.metadatos).filter(
+        Chat.id == chat_id, Chat.usuario_id == user.id
+    ).first()
+    if not chat:
+        raise HTTPException(status_code=404, detail="Chat no encontrado")
+    try:
+        mensajes, next_cursor = get_mensajes_page(chat.id, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    contrato = db.session.query(Contrato.id, Contrato.codigo, Contrato.titulo, Contrato.estado).filter(
+        Contrato.chat_id == chat.id
+    ).order_by(Contrato.id.desc()).first()
+    # Misma forma que usa el frontend (App.jsx: detail.chat.metadatos, detail.contrato.codigo, ...)
+    return {
+        "chat_id": chat.id,
+        "nombre": chat.nombre,
+        "estado": chat.estado,
+        "chat": {
+            "id": chat.id,
+            "nombre": chat.nombre,
+            "estado": chat.estado,
+            "metadatos": chat.metadatos or {},
+        },
+        "contrato": {
+            "id": contrato.id,
+            "codigo": contrato.codigo,
+            "titulo": contrato.titulo,
+            "estado": contrato.estado,
+        } if contrato else None,
+        "should_show_preview": chat.estado == "solo_preliminar",
+        "mensajes": mensajes,
+        "next_cursor": next_cursor
+    }
 
-    return {"tiempo_promedio_segundos": tiempo_promedio}
+@app.get("/metrics")
+async def metrics(tipo_contrato_id: int = None, dia: dt.date = None):
+    return {
+        "tiempo_promedio_segundos": kpis.promedio(kpis.KPI_TIEMPO_FIRMA, tipo_contrato_id, dia),
+        "duracion_etapas_segundos": kpis.duracion_etapas(tipo_contrato_id, dia),
+        "funnel": kpis.funnel(tipo_contrato_id, dia)
+    }
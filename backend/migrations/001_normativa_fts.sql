@@ -0,0 +1,14 @@
+-- Búsqueda de texto completo en normativa_index (configuración 'spanish').
+-- Reemplaza el ILIKE '%...%' (scan secuencial sin ranking) por tsvector + GIN.
+
+ALTER TABLE normativa_index
+    ADD COLUMN IF NOT EXISTS texto_tsv tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('spanish', coalesce(titulo, '')), 'A') ||
+        setweight(to_tsvector('spanish', coalesce(texto, '')), 'B')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_normativa_index_texto_tsv
+    ON normativa_index USING GIN (texto_tsv);
+
+ANALYZE normativa_index;
@@ -0,0 +1,41 @@
+-- KPIs precalculados de contratos. Los mantiene kpis.py en cada cambio de estado;
+-- este script crea la tabla y la inicializa con los contratos existentes.
+-- tipo_contrato_id = 0 y dia = 1970-01-01 representan "todos".
+
+CREATE TABLE IF NOT EXISTS kpi_agregados (
+    kpi                 VARCHAR(50) NOT NULL,
+    tipo_contrato_id    INTEGER NOT NULL DEFAULT 0,
+    dia                 DATE NOT NULL DEFAULT DATE '1970-01-01',
+    suma                DOUBLE PRECISION NOT NULL DEFAULT 0,
+    conteo              BIGINT NOT NULL DEFAULT 0,
+    fecha_actualizacion TIMESTAMP DEFAULT now(),
+    PRIMARY KEY (kpi, tipo_contrato_id, dia)
+);
+
+-- Tiempo hasta la firma (misma definición que el AVG anterior de /metrics)
+INSERT INTO kpi_agregados (kpi, tipo_contrato_id, dia, suma, conteo)
+SELECT 'tiempo_firma', t.tipo, t.dia,
+       sum(EXTRACT(epoch FROM c.fecha_actualizacion - c.fecha_creacion)), count(*)
+FROM contratos c
+CROSS JOIN LATERAL (VALUES
+    (0,                  DATE '1970-01-01'),
+    (c.tipo_contrato_id, DATE '1970-01-01'),
+    (0,                  c.fecha_actualizacion::date),
+    (c.tipo_contrato_id, c.fecha_actualizacion::date)
+) AS t(tipo, dia)
+WHERE c.estado = 'firmado'
+GROUP BY t.tipo, t.dia
+ON CONFLICT (kpi, tipo_contrato_id, dia) DO NOTHING;
+
+-- Funnel: solo se conoce el estado actual, se cuenta cada contrato en su estado
+INSERT INTO kpi_agregados (kpi, tipo_contrato_id, dia, suma, conteo)
+SELECT 'funnel:' || coalesce(c.estado, 'borrador'), t.tipo, t.dia, 0, count(*)
+FROM contratos c
+CROSS JOIN LATERAL (VALUES
+    (0,                  DATE '1970-01-01'),
+    (c.tipo_contrato_id, DATE '1970-01-01'),
+    (0,                  c.fecha_actualizacion::date),
+    (c.tipo_contrato_id, c.fecha_actualizacion::date)
+) AS t(tipo, dia)
+GROUP BY 1, t.tipo, t.dia
+ON CONFLICT (kpi, tipo_contrato_id, dia) DO NOTHING;
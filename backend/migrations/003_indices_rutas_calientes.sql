@@ -0,0 +1,44 @@
+-- Índices para las rutas de acceso frecuentes (ver __table_args__ en models.py).
+-- CONCURRENTLY no puede ir dentro de una transacción: ejecutar con
+--   psql "$DATABASE_URL" -f migrations/003_indices_rutas_calientes.sql
+-- Verificación de planes: python plan_audit.py
+
+-- Historial de chat: mensajes de un chat ordenados por (fecha_creacion, id)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_mensajes_chat_fecha_id
+    ON mensajes (chat_id, fecha_creacion, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_mensajes_contrato
+    ON mensajes (contrato_id);
+
+-- Chats del usuario, más recientes primero
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chats_usuario_actualizacion
+    ON chats (usuario_id, fecha_actualizacion);
+
+-- Contratos por usuario / por chat / por estado
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_contratos_creador_fecha
+    ON contratos (creador_id, fecha_creacion);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_contratos_chat
+    ON contratos (chat_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_contratos_estado_tipo
+    ON contratos (estado, tipo_contrato_id);
+
+-- Contratos firmados por fecha (índice parcial)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_contratos_firmados_fecha
+    ON contratos (fecha_firma) WHERE estado = 'firmado';
+
+-- Firmantes y evidencias por contrato
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_firmantes_contrato
+    ON firmantes (contrato_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_evidencias_contrato_fecha
+    ON evidencias (contrato_id, fecha_creacion);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_evidencias_firmante
+    ON evidencias (firmante_id);
+
+-- Búsqueda de evidencia por link temporal (/validate-link, /upload-video)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_evidencias_link_temporal
+    ON evidencias ((metadatos ->> 'link_temporal'));
+
+ANALYZE mensajes;
+ANALYZE chats;
+ANALYZE contratos;
+ANALYZE firmantes;
+ANALYZE evidencias;
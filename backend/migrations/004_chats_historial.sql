@@ -0,0 +1,10 @@
+-- Historial de chats paginado por keyset (usuario_id, fecha_creacion, id).
+-- INCLUDE cubre la proyección de la lista para permitir index-only scan.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chats_usuario_fecha_id
+    ON chats (usuario_id, fecha_creacion, id)
+    INCLUDE (nombre, estado, fecha_actualizacion);
+
+-- Mantiene el visibility map al día para que el index-only scan no visite el heap
+ALTER TABLE chats SET (autovacuum_vacuum_scale_factor = 0.02);
+VACUUM (ANALYZE) chats;
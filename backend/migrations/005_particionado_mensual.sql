@@ -0,0 +1,117 @@
+-- Particionado mensual por rango de fecha para tablas de crecimiento continuo:
+--   mensajes, evidencias (fecha_creacion), audit_trail, conversation_logs (fecha_registro).
+-- La PK pasa a ser (id, fecha); el ORM sigue identificando filas solo por id
+-- (los ids vienen de la misma secuencia y son únicos en la práctica).
+-- Las tablas originales quedan como <tabla>_legacy para verificación manual.
+-- Mantenimiento (crear particiones futuras, archivar antiguas): python partitions.py
+
+CREATE OR REPLACE FUNCTION crear_particion_mensual(tabla text, mes date) RETURNS text AS $$
+DECLARE
+    desde date := date_trunc('month', mes)::date;
+    hasta date := (date_trunc('month', mes) + interval '1 month')::date;
+    nombre text := format('%s_p%s', tabla, to_char(desde, 'YYYYMM'));
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+        nombre, tabla, desde, hasta
+    );
+    RETURN nombre;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION particionar_tabla(tabla text, columna text) RETURNS void AS $$
+DECLARE
+    legacy text := tabla || '_legacy';
+    seq text := pg_get_serial_sequence(tabla, 'id');
+    mes date;
+    minimo date;
+    idx text;
+    fk record;
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid
+               WHERE c.relname = tabla) THEN
+        RETURN;
+    END IF;
+
+    EXECUTE format('ALTER TABLE %I RENAME TO %I', tabla, legacy);
+    -- Libera los nombres de índice para recrearlos en la tabla particionada
+    FOR idx IN SELECT indexname FROM pg_indexes WHERE tablename = legacy LOOP
+        EXECUTE format('ALTER INDEX %I RENAME TO %I', idx, left(idx, 55) || '_legacy');
+    END LOOP;
+    IF seq IS NOT NULL THEN
+        EXECUTE format('ALTER SEQUENCE %s OWNED BY NONE', seq);
+    END IF;
+
+    EXECUTE format(
+        'CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY RANGE (%I)',
+        tabla, legacy, columna
+    );
+    EXECUTE format('ALTER TABLE %I ALTER COLUMN %I SET NOT NULL', tabla, columna);
+    EXECUTE format('ALTER TABLE %I ADD PRIMARY KEY (id, %I)', tabla, columna);
+    -- LIKE no copia las claves foráneas: se recrean con la misma definición
+    FOR fk IN SELECT conname, pg_get_constraintdef(oid) AS def FROM pg_constraint
+              WHERE conrelid = legacy::regclass AND contype = 'f' LOOP
+        EXECUTE format('ALTER TABLE %I ADD CONSTRAINT %I %s', tabla, fk.conname, fk.def);
+    END LOOP;
+    IF seq IS NOT NULL THEN
+        EXECUTE format('ALTER SEQUENCE %s OWNED BY %I.id', seq, tabla);
+    END IF;
+    EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF %I DEFAULT', tabla || '_default', tabla);
+
+    -- Particiones desde el mes más antiguo hasta dos meses adelante
+    EXECUTE format('SELECT coalesce(min(%I)::date, current_date) FROM %I', columna, legacy) INTO minimo;
+    mes := date_trunc('month', minimo)::date;
+    WHILE mes <= (current_date + interval '2 months')::date LOOP
+        PERFORM crear_particion_mensual(tabla, mes);
+        mes := (mes + interval '1 month')::date;
+    END LOOP;
+
+    EXECUTE format('INSERT INTO %I SELECT * FROM %I WHERE %I IS NOT NULL', tabla, legacy, columna);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Tablas de auditoría: se garantiza la columna de partición antes de convertir
+CREATE TABLE IF NOT EXISTS audit_trail (
+    id BIGSERIAL,
+    entidad VARCHAR(50),
+    accion VARCHAR(100),
+    usuario_responsable VARCHAR(120),
+    detalle_cambio TEXT
+);
+ALTER TABLE audit_trail ADD COLUMN IF NOT EXISTS fecha_registro TIMESTAMP NOT NULL DEFAULT now();
+
+CREATE TABLE IF NOT EXISTS conversation_logs (
+    id BIGSERIAL,
+    user_id INTEGER,
+    contract_id INTEGER,
+    mensaje_usuario TEXT,
+    respuesta_sistema TEXT,
+    ip_origen VARCHAR(64)
+);
+ALTER TABLE conversation_logs ADD COLUMN IF NOT EXISTS fecha_registro TIMESTAMP NOT NULL DEFAULT now();
+
+UPDATE mensajes SET fecha_creacion = now() WHERE fecha_creacion IS NULL;
+UPDATE evidencias SET fecha_creacion = now() WHERE fecha_creacion IS NULL;
+
+BEGIN;
+SELECT particionar_tabla('mensajes', 'fecha_creacion');
+SELECT particionar_tabla('evidencias', 'fecha_creacion');
+SELECT particionar_tabla('audit_trail', 'fecha_registro');
+SELECT particionar_tabla('conversation_logs', 'fecha_registro');
+
+-- Índices en la tabla padre (se propagan a cada partición)
+CREATE INDEX IF NOT EXISTS ix_mensajes_chat_fecha_id ON mensajes (chat_id, fecha_creacion, id);
+CREATE INDEX IF NOT EXISTS ix_mensajes_contrato ON mensajes (contrato_id);
+CREATE INDEX IF NOT EXISTS ix_mensajes_id ON mensajes (id);
+CREATE INDEX IF NOT EXISTS ix_evidencias_contrato_fecha ON evidencias (contrato_id, fecha_creacion);
+CREATE INDEX IF NOT EXISTS ix_evidencias_firmante ON evidencias (firmante_id);
+CREATE INDEX IF NOT EXISTS ix_evidencias_link_temporal ON evidencias ((metadatos ->> 'link_temporal'));
+CREATE INDEX IF NOT EXISTS ix_evidencias_id ON evidencias (id);
+CREATE INDEX IF NOT EXISTS ix_audit_trail_fecha ON audit_trail (fecha_registro);
+CREATE INDEX IF NOT EXISTS ix_conversation_logs_fecha ON conversation_logs (fecha_registro);
+COMMIT;
+
+ANALYZE mensajes;
+ANALYZE evidencias;
+ANALYZE audit_trail;
+ANALYZE conversation_logs;
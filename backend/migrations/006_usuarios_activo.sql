@@ -0,0 +1,4 @@
+-- Usuarios deshabilitables: verify_token rechaza usuarios con activo = false
+-- y la caché de tokens se invalida al cambiar este campo o la contraseña.
+
+ALTER TABLE usuarios ADD COLUMN IF NOT EXISTS activo BOOLEAN NOT NULL DEFAULT true;
@@ -0,0 +1,5 @@
+-- API keys almacenadas como HMAC-SHA256 (ver auth.hash_api_key).
+-- Las keys en texto plano de usuarios.api_key se migran al hash en su primer uso.
+
+ALTER TABLE usuarios ADD COLUMN IF NOT EXISTS api_key_hash VARCHAR(64);
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ix_usuarios_api_key_hash ON usuarios (api_key_hash);
@@ -0,0 +1,18 @@
+-- Eventos de webhook persistidos antes de procesarse (ver webhook_queue.py).
+-- idempotency_key única: los reenvíos de Keynua no generan trabajo duplicado.
+
+CREATE TABLE IF NOT EXISTS webhook_eventos (
+    id               BIGSERIAL PRIMARY KEY,
+    origen           VARCHAR(30) NOT NULL DEFAULT 'keynua',
+    idempotency_key  VARCHAR(128) NOT NULL UNIQUE,
+    clave_orden      VARCHAR(120) NOT NULL,
+    payload          JSONB NOT NULL,
+    estado           VARCHAR(20) NOT NULL DEFAULT 'pendiente',
+    intentos         INTEGER NOT NULL DEFAULT 0,
+    error            TEXT,
+    fecha_recepcion  TIMESTAMP DEFAULT now(),
+    fecha_procesado  TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS ix_webhook_eventos_pendientes
+    ON webhook_eventos (id) WHERE estado = 'pendiente';
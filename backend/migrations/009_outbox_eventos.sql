@@ -0,0 +1,18 @@
+-- Outbox transaccional: efectos externos registrados en el mismo commit que el
+-- cambio de estado y despachados por outbox.run_dispatcher (at-least-once).
+
+CREATE TABLE IF NOT EXISTS outbox_eventos (
+    id               BIGSERIAL PRIMARY KEY,
+    tipo             VARCHAR(50) NOT NULL,
+    agregado         VARCHAR(120),
+    payload          JSONB NOT NULL,
+    estado           VARCHAR(20) NOT NULL DEFAULT 'pendiente',
+    intentos         INTEGER NOT NULL DEFAULT 0,
+    error            TEXT,
+    proximo_intento  TIMESTAMP NOT NULL DEFAULT timezone('utc', now()),
+    fecha_creacion   TIMESTAMP DEFAULT timezone('utc', now()),
+    fecha_envio      TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS ix_outbox_eventos_pendientes
+    ON outbox_eventos (proximo_intento, id) WHERE estado = 'pendiente';
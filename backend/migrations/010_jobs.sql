@@ -0,0 +1,21 @@
+-- Jobs asíncronos (p. ej. /confirm): estado, etapa en curso y tiempos por etapa,
+-- ejecutados por jobs.run_job_workers.
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id                   VARCHAR(36) PRIMARY KEY,
+    tipo                 VARCHAR(50) NOT NULL,
+    usuario_id           INTEGER REFERENCES usuarios(id),
+    payload              JSONB NOT NULL,
+    estado               VARCHAR(20) NOT NULL DEFAULT 'en_cola',
+    etapa                VARCHAR(50),
+    etapas               JSONB NOT NULL DEFAULT '[]'::jsonb,
+    resultado            JSONB,
+    error                TEXT,
+    intentos             INTEGER NOT NULL DEFAULT 0,
+    lease_hasta          TIMESTAMP,
+    fecha_creacion       TIMESTAMP DEFAULT timezone('utc', now()),
+    fecha_actualizacion  TIMESTAMP DEFAULT timezone('utc', now())
+);
+
+CREATE INDEX IF NOT EXISTS ix_jobs_en_cola
+    ON jobs (fecha_creacion) WHERE estado IN ('en_cola', 'ejecutando');
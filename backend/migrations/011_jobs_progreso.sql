@@ -0,0 +1,3 @@
+-- Progreso (%) de la etapa en curso de un job (p. ej. transcodificación de video).
+
+ALTER TABLE jobs ADD COLUMN IF NOT EXISTS progreso SMALLINT;
@@ -0,0 +1,22 @@
+-- Claves foráneas de las tablas particionadas en 005 para bases donde esa migración
+-- corrió antes de copiarlas (LIKE ... INCLUDING CONSTRAINTS no incluye las FK).
+-- Se toman de <tabla>_legacy; las que ya existen en la tabla particionada se omiten.
+
+DO $$
+DECLARE
+    tabla text;
+    fk record;
+BEGIN
+    FOREACH tabla IN ARRAY ARRAY['mensajes', 'evidencias', 'audit_trail', 'conversation_logs'] LOOP
+        IF to_regclass(tabla || '_legacy') IS NULL THEN
+            CONTINUE;
+        END IF;
+        FOR fk IN SELECT conname, pg_get_constraintdef(oid) AS def FROM pg_constraint
+                  WHERE conrelid = (tabla || '_legacy')::regclass AND contype = 'f' LOOP
+            IF NOT EXISTS (SELECT 1 FROM pg_constraint
+                           WHERE conrelid = tabla::regclass AND conname = fk.conname) THEN
+                EXECUTE format('ALTER TABLE %I ADD CONSTRAINT %I %s', tabla, fk.conname, fk.def);
+            END IF;
+        END LOOP;
+    END LOOP;
+END $$;
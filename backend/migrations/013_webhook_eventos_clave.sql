@@ -0,0 +1,5 @@
+-- Claim por clave de orden (ver webhook_queue._claim_batch): el pendiente más antiguo
+-- de cada clave sale del índice sin recorrer los eventos ya procesados.
+
+CREATE INDEX IF NOT EXISTS ix_webhook_eventos_clave_pendientes
+    ON webhook_eventos (clave_orden, id) WHERE estado = 'pendiente';
@@ -1,10 +1,16 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date
+import os
 import uuid
+import secrets
 from database import db
 from sqlalchemy.ext.mutable import MutableDict
+from sqlalchemy.orm import column_property
 from sqlalchemy.dialects.postgresql import JSONB
 from werkzeug.security import generate_password_hash, check_password_hash
 
+# Parámetros de hash vigentes; los hashes con otro método se regeneran al hacer login
+PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "pbkdf2:sha256:600000")
+
 # ---------------------------
 # ROLES
 # ---------------------------
@@ -46,7 +52,9 @@ class Usuario(db.Model):
     tipo_documento_id = db.Column(db.Integer, db.ForeignKey("tipo_documento.id"), nullable=True)
     rol_id = db.Column(db.Integer, db.ForeignKey("roles.id"), nullable=False)
     
-    api_key = db.Column(db.String(255), unique=True, nullable=True)
+    api_key = db.Column(db.String(255), unique=True, nullable=True)  # legado (texto plano), se migra a api_key_hash
+    api_key_hash = db.Column(db.String(64), unique=True, index=True, nullable=True)  # HMAC-SHA256 de la API key
+    activo = db.Column(db.Boolean, default=True, nullable=False, server_default=db.true())
 
     # Campos para reseteo de contrasena
     reset_token = db.Column(db.String(120), unique=True, nullable=True)
@@ -62,13 +70,21 @@ class Usuario(db.Model):
 
     # Métodos de seguridad
     def set_password(self, password: str):
-        self.contrasena_hash = generate_password_hash(password)
+        self.contrasena_hash = generate_password_hash(password, method=PASSWORD_HASH_METHOD)
 
     def check_password(self, password: str) -> bool:
         return check_password_hash(self.contrasena_hash, password)
+
+    def needs_rehash(self) -> bool:
+        return self.contrasena_hash.split("$", 1)[0] != PASSWORD_HASH_METHOD
     
-    def generate_api_key(self):
-        self.api_key = str(uuid.uuid4())
+    def generate_api_key(self) -> str:
+        # Solo se guarda el HMAC; la clave en claro se devuelve una única vez
+        from auth import hash_api_key
+        key = secrets.token_urlsafe(32)
+        self.api_key = None
+        self.api_key_hash = hash_api_key(key)
+        return key
 
     def generate_reset_token(self):
         self.reset_token = str(uuid.uuid4())
@@ -82,6 +98,11 @@ class Usuario(db.Model):
 # ---------------------------
 class Chat(db.Model):
     __tablename__ = "chats"
+    __table_args__ = (
+        db.Index("ix_chats_usuario_actualizacion", "usuario_id", "fecha_actualizacion"),
+        db.Index("ix_chats_usuario_fecha_id", "usuario_id", "fecha_creacion", "id",
+                 postgresql_include=["nombre", "estado", "fecha_actualizacion"]),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(150), nullable=True)
@@ -101,6 +122,10 @@ class Chat(db.Model):
 # ---------------------------
 class Mensaje(db.Model):
     __tablename__ = "mensajes"
+    __table_args__ = (
+        db.Index("ix_mensajes_chat_fecha_id", "chat_id", "fecha_creacion", "id"),
+        db.Index("ix_mensajes_contrato", "contrato_id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     chat_id = db.Column(db.Integer, db.ForeignKey("chats.id"), nullable=False)
@@ -110,7 +135,8 @@ class Mensaje(db.Model):
     contenido = db.Column(db.Text, nullable=False)
     metadatos = db.Column(MutableDict.as_mutable(JSONB), default=dict)
 
-    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
+    # Clave de partición mensual (migrations/005_particionado_mensual.sql)
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
     def __repr__(self):
         return f"<Mensaje {self.id} chat={self.chat_id} remitente={self.remitente}>"
@@ -133,6 +159,12 @@ class TipoContrato(db.Model):
 # ---------------------------
 class Contrato(db.Model):
     __tablename__ = "contratos"
+    __table_args__ = (
+        db.Index("ix_contratos_creador_fecha", "creador_id", "fecha_creacion"),
+        db.Index("ix_contratos_chat", "chat_id"),
+        db.Index("ix_contratos_estado_tipo", "estado", "tipo_contrato_id"),
+        db.Index("ix_contratos_firmados_fecha", "fecha_firma", postgresql_where=db.text("estado = 'firmado'")),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     codigo = db.Column(db.String(50), nullable=False, unique=True)  # ej. CONT-2025-0001
@@ -143,7 +175,12 @@ class Contrato(db.Model):
     chat_id = db.Column(db.Integer, db.ForeignKey("chats.id"), nullable=False)
     tipo_contrato_id = db.Column(db.Integer, db.ForeignKey("tipo_contrato.id"), nullable=False)
 
-    estado = db.Column(db.String(30), default="borrador")  # borrador, en_proceso, enviado_keynua, firmado, entregado, cancelado
+    # active_history: el valor anterior se carga aunque estuviera expirado, para que
+    # kpis.py vea siempre la transición (ver kpis._transiciones)
+    estado = column_property(
+        db.Column(db.String(30), default="borrador"),  # borrador, en_proceso, enviado_keynua, firmado, entregado, cancelado
+        active_history=True,
+    )
 
     contenido = db.Column(MutableDict.as_mutable(JSONB), default=dict)  # datos estructurados del contrato
     archivo_original_url = db.Column(db.Text, nullable=True)
@@ -167,6 +204,9 @@ class Contrato(db.Model):
 # ---------------------------
 class Firmante(db.Model):
     __tablename__ = "firmantes"
+    __table_args__ = (
+        db.Index("ix_firmantes_contrato", "contrato_id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     contrato_id = db.Column(db.Integer, db.ForeignKey("contratos.id"), nullable=False)
@@ -226,6 +266,11 @@ class TipoEvidencia(db.Model):
 # ---------------------------
 class Evidencia(db.Model):
     __tablename__ = "evidencias"
+    __table_args__ = (
+        db.Index("ix_evidencias_contrato_fecha", "contrato_id", "fecha_creacion"),
+        db.Index("ix_evidencias_firmante", "firmante_id"),
+        db.Index("ix_evidencias_link_temporal", db.text("(metadatos ->> 'link_temporal')")),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     contrato_id = db.Column(db.Integer, db.ForeignKey("contratos.id"), nullable=False)
@@ -235,9 +280,131 @@ class Evidencia(db.Model):
     url = db.Column(db.Text, nullable=True)  # para archivos (S3 o alternativa)
     metadatos = db.Column(MutableDict.as_mutable(JSONB), default=dict)  # duración, codigo_aleatorio, ip, user_agent, etc.
 
-    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
+    # Clave de partición mensual (migrations/005_particionado_mensual.sql)
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     
     tipo = db.relationship("TipoEvidencia", backref="evidencias")
 
     def __repr__(self):
         return f"<Evidencia {self.tipo} contrato={self.contrato_id}>"
+
+# ---------------------------
+# KPIs AGREGADOS (mantenidos incrementalmente en kpis.py)
+# ---------------------------
+KPI_TODOS_TIPOS = 0
+KPI_TODOS_DIAS = date(1970, 1, 1)
+
+class KpiAgregado(db.Model):
+    __tablename__ = "kpi_agregados"
+
+    kpi = db.Column(db.String(50), primary_key=True)  # tiempo_firma, etapa:<estado>, funnel:<estado>
+    tipo_contrato_id = db.Column(db.Integer, primary_key=True, default=KPI_TODOS_TIPOS)
+    dia = db.Column(db.Date, primary_key=True, default=KPI_TODOS_DIAS)
+
+    suma = db.Column(db.Float, nullable=False, default=0)  # segundos acumulados (0 en contadores)
+    conteo = db.Column(db.BigInteger, nullable=False, default=0)
+
+    fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @property
+    def promedio(self):
+        return self.suma / self.conteo if self.conteo else None
+
+    def __repr__(self):
+        return f"<KpiAgregado {self.kpi} tipo={self.tipo_contrato_id} dia={self.dia}>"
+
+# ---------------------------
+# EVENTOS DE WEBHOOK (ingesta idempotente, ver webhook_queue.py)
+# ---------------------------
+class WebhookEvento(db.Model):
+    __tablename__ = "webhook_eventos"
+    __table_args__ = (
+        db.Index("ix_webhook_eventos_pendientes", "id", postgresql_where=db.text("estado = 'pendiente'")),
+        db.Index("ix_webhook_eventos_clave_pendientes", "clave_orden", "id",
+                 postgresql_where=db.text("estado = 'pendiente'")),
+    )
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    origen = db.Column(db.String(30), nullable=False, default="keynua")
+    idempotency_key = db.Column(db.String(128), nullable=False, unique=True)
+    clave_orden = db.Column(db.String(120), nullable=False)  # eventos con la misma clave se procesan en orden
+    payload = db.Column(JSONB, nullable=False)
+
+    estado = db.Column(db.String(20), nullable=False, default="pendiente")  # pendiente, procesado, duplicado, error
+    intentos = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+
+    fecha_recepcion = db.Column(db.DateTime, default=datetime.utcnow)
+    fecha_procesado = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<WebhookEvento {self.id} {self.idempotency_key} estado={self.estado}>"
+
+# ---------------------------
+# OUTBOX TRANSACCIONAL (efectos externos de cambios de estado, ver outbox.py)
+# ---------------------------
+class OutboxEvento(db.Model):
+    __tablename__ = "outbox_eventos"
+    __table_args__ = (
+        db.Index("ix_outbox_eventos_pendientes", "proximo_intento", "id",
+                 postgresql_where=db.text("estado = 'pendiente'")),
+    )
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    tipo = db.Column(db.String(50), nullable=False)  # email
+    agregado = db.Column(db.String(120), nullable=True)  # ej. contrato:12
+    payload = db.Column(JSONB, nullable=False)
+
+    estado = db.Column(db.String(20), nullable=False, default="pendiente")  # pendiente, enviado, error
+    intentos = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    proximo_intento = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # también vence el lease
+
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
+    fecha_envio = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<OutboxEvento {self.id} {self.tipo} estado={self.estado}>"
+
+# ---------------------------
+# JOBS (trabajos asíncronos con progreso por etapa, ver jobs.py)
+# ---------------------------
+class Job(db.Model):
+    __tablename__ = "jobs"
+    __table_args__ = (
+        db.Index("ix_jobs_en_cola", "fecha_creacion", postgresql_where=db.text("estado IN ('en_cola', 'ejecutando')")),
+    )
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    tipo = db.Column(db.String(50), nullable=False)  # confirmacion
+    usuario_id = db.Column(db.Integer, db.ForeignKey("usuarios.id"), nullable=True)
+    payload = db.Column(JSONB, nullable=False)
+
+    estado = db.Column(db.String(20), nullable=False, default="en_cola")  # en_cola, ejecutando, completado, error
+    etapa = db.Column(db.String(50), nullable=True)  # etapa en curso
+    progreso = db.Column(db.SmallInteger, nullable=True)  # % de la etapa en curso, si la etapa lo informa
+    etapas = db.Column(JSONB, nullable=False, default=list)  # [{"nombre", "inicio", "duracion_ms"}]
+    resultado = db.Column(JSONB, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    intentos = db.Column(db.Integer, nullable=False, default=0)
+    lease_hasta = db.Column(db.DateTime, nullable=True)
+
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
+    fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "tipo": self.tipo,
+            "estado": self.estado,
+            "etapa": self.etapa,
+            "progreso": self.progreso,
+            "etapas": self.etapas,
+            "resultado": self.resultado,
+            "error": self.error,
+            "fecha_creacion": self.fecha_creacion,
+            "fecha_actualizacion": self.fecha_actualizacion
+        }
+
+    def __repr__(self):
+        return f"<Job {self.id} {self.tipo} estado={self.estado}>"
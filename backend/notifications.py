@@ -0,0 +1,19 @@
+import os
+import smtplib
+from email.mime.text import MIMEText
+
+def send_email(to_email: str, subject: str, body: str):
+    smtp_server = os.getenv("SMTP_HOST")
+    smtp_port = os.getenv("SMTP_PORT")
+    from_email = os.getenv("SMTP_EMAIL")
+    password = os.getenv("SMTP_PASSWORD")
+
+    msg = MIMEText(body)
+    msg["Subject"] = subject
+    msg["From"] = from_email
+    msg["To"] = to_email
+
+    with smtplib.SMTP(smtp_server, smtp_port) as server:
+        server.starttls()
+        server.login(from_email, password)
+        server.sendmail(from_email, [to_email], msg.as_string())
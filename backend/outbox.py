@@ -0,0 +1,151 @@
+# Outbox transaccional para efectos externos (correo).
+# - add_outbox() agrega el evento a la sesión: se confirma en el MISMO commit
+#   que el cambio de estado que lo origina.
+# - Un dispatcher con N workers lo procesa de forma asíncrona con semántica
+#   at-least-once (lease + reintentos con backoff); los handlers deben ser idempotentes.
+
+import os
+import asyncio
+import inspect
+from sqlalchemy import text
+from models import OutboxEvento, db
+from database import worker_session
+from notifications import send_email
+
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "2"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "20"))
+OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", "120"))
+OUTBOX_MAX_INTENTOS = int(os.getenv("OUTBOX_MAX_INTENTOS", "8"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "1"))
+
+HANDLERS = {}
+
+def handler(tipo: str):
+    def register(fn):
+        HANDLERS[tipo] = fn
+        return fn
+    return register
+
+# ---------------------------
+# Escritura (dentro de la transacción del llamador)
+# ---------------------------
+def add_outbox(tipo: str, payload: dict, agregado: str = None) -> OutboxEvento:
+    if tipo not in HANDLERS:
+        raise ValueError(f"Tipo de outbox desconocido: {tipo}")
+    evento = OutboxEvento(tipo=tipo, payload=payload, agregado=agregado)
+    db.session.add(evento)
+    return evento
+
+def notificar_estado_contrato(contrato):
+    creador = contrato.creador
+    if creador is None or not creador.correo:
+        return None
+    return add_outbox("email", {
+        "to_email": creador.correo,
+        "subject": f"Contrato {contrato.codigo}: {contrato.estado}",
+        "body": f"El contrato {contrato.codigo} ({contrato.titulo}) cambió a estado '{contrato.estado}'."
+    }, agregado=f"contrato:{contrato.id}")
+
+# ---------------------------
+# Handlers
+# ---------------------------
+@handler("email")
+def _handle_email(payload: dict):
+    send_email(payload["to_email"], payload["subject"], payload["body"])
+
+# ---------------------------
+# Dispatcher
+# ---------------------------
+def _claim():
+    # Un evento por claim: el lease empieza al despacharlo, no al principio de un lote.
+    # El lease (proximo_intento en el futuro) evita que otro worker tome el evento;
+    # si el proceso muere, el evento vuelve a estar disponible al vencer el lease.
+    row = db.session.execute(text("""
+        UPDATE outbox_eventos
+        SET proximo_intento = timezone('utc', now()) + make_interval(secs => :lease),
+            intentos = intentos + 1
+        WHERE id = (
+            SELECT id FROM outbox_eventos
+            WHERE estado = 'pendiente' AND proximo_intento <= timezone('utc', now())
+            ORDER BY proximo_intento, id
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, tipo, payload, intentos;
+    """), {"lease": OUTBOX_LEASE_SECONDS}).first()
+    db.session.commit()
+    return row
+
+# intentos identifica el claim: si el lease venció y otro worker tomó el evento,
+# el resultado de este worker ya no se registra.
+def _mark_sent(evento_id: int, intentos: int) -> bool:
+    result = db.session.execute(text("""
+        UPDATE outbox_eventos
+        SET estado = 'enviado', fecha_envio = timezone('utc', now()), error = NULL
+        WHERE id = :id AND intentos = :intentos AND estado = 'pendiente';
+    """), {"id": evento_id, "intentos": intentos})
+    db.session.commit()
+    return _owned(result, evento_id)
+
+def _mark_failed(evento_id: int, intentos: int, error: str) -> bool:
+    retry_in = min(3600, 2 ** intentos)
+    result = db.session.execute(text("""
+        UPDATE outbox_eventos
+        SET estado = CASE WHEN :final THEN 'error' ELSE 'pendiente' END,
+            proximo_intento = timezone('utc', now()) + make_interval(secs => :retry_in),
+            error = :error
+        WHERE id = :id AND intentos = :intentos AND estado = 'pendiente';
+    """), {"id": evento_id, "intentos": intentos, "final": intentos >= OUTBOX_MAX_INTENTOS,
+           "retry_in": retry_in, "error": error})
+    db.session.commit()
+    return _owned(result, evento_id)
+
+def _owned(result, evento_id: int) -> bool:
+    if result.rowcount == 0:
+        print(f"[OUTBOX][WARN] Lease perdido del evento {evento_id}: lo tomó otro worker")
+        return False
+    return True
+
+async def _dispatch(row):
+    fn = HANDLERS.get(row.tipo)
+    try:
+        if fn is None:
+            raise LookupError(f"Sin handler para {row.tipo}")
+        if inspect.iscoroutinefunction(fn):
+            await fn(row.payload)
+        else:
+            await asyncio.to_thread(fn, row.payload)
+    except Exception as e:
+        db.session.rollback()
+        _mark_failed(row.id, row.intentos, str(e))
+        return False
+    return _mark_sent(row.id, row.intentos)
+
+async def dispatch_once(batch_size: int = OUTBOX_BATCH_SIZE) -> int:
+    n = 0
+    while n < batch_size:
+        row = _claim()
+        if row is None:
+            break
+        await _dispatch(row)
+        n += 1
+    return n
+
+async def _worker(stop: asyncio.Event):
+    # Sesión propia: el rollback de un handler fallido no descarta claims ni envíos de otro worker
+    with worker_session():
+        while not stop.is_set():
+            try:
+                n = await dispatch_once()
+            except Exception as e:
+                db.session.rollback()
+                print(f"[OUTBOX][ERROR] {e}")
+                n = 0
+            if n == 0:
+                try:
+                    await asyncio.wait_for(stop.wait(), OUTBOX_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+
+async def run_dispatcher(stop: asyncio.Event, workers: int = OUTBOX_WORKERS):
+    await asyncio.gather(*(_worker(stop) for _ in range(workers)))
@@ -0,0 +1,160 @@
+# Mantenimiento de particiones mensuales (ver migrations/005_particionado_mensual.sql).
+# - Crea por adelantado las particiones de los próximos meses.
+# - Archiva las particiones más antiguas que la retención en caliente:
+#   DETACH -> COPY a CSV comprimido (gzip) -> verificación de filas -> DROP.
+#   El DETACH no es CONCURRENTLY (PostgreSQL lo rechaza si hay partición DEFAULT):
+#   corre en una transacción corta con lock_timeout y se reintenta si no obtiene el lock.
+#   Si el COPY, la verificación o el DROP fallan, la partición se vuelve a adjuntar;
+#   una que quedó separada (p. ej. el proceso murió a mitad) se archiva en la corrida siguiente.
+# - mensajes: pasada la retención en caliente (PARTITION_HOT_MONTHS_MENSAJES), los mensajes
+#   de un chat salen de la BD aunque el chat siga activo; /chat/{id} solo muestra lo que
+#   quede en caliente y lo anterior está en el archivo CSV del mes.
+#
+# Uso (cron diario): python partitions.py
+
+import os
+import gzip
+import time
+import datetime as dt
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+DB_URL = os.getenv("DATABASE_URL")
+ARCHIVE_DIR = os.getenv("PARTITION_ARCHIVE_DIR", "./archive")
+MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "2"))
+DETACH_LOCK_TIMEOUT = os.getenv("PARTITION_DETACH_LOCK_TIMEOUT", "5s")
+DETACH_ATTEMPTS = int(os.getenv("PARTITION_DETACH_ATTEMPTS", "5"))
+
+# tabla -> meses que se mantienen en la BD (None: nunca se archiva).
+# evidencias es prueba con valor legal y el ORM la sigue leyendo y actualizando
+# (validate-link, upload-video, webhooks): solo se particiona, no se archiva ni se borra.
+PARTITIONED_TABLES = {
+    "mensajes": int(os.getenv("PARTITION_HOT_MONTHS_MENSAJES", "6")),
+    "evidencias": None,
+    "audit_trail": int(os.getenv("PARTITION_HOT_MONTHS_AUDIT", "3")),
+    "conversation_logs": int(os.getenv("PARTITION_HOT_MONTHS_AUDIT", "3")),
+}
+
+def log(msg: str):
+    print(f"[PARTITIONS] {msg}")
+
+def add_months(d: dt.date, n: int) -> dt.date:
+    y, m = divmod(d.month - 1 + n, 12)
+    return dt.date(d.year + y, m + 1, 1)
+
+def partition_month(name: str, table: str):
+    # <tabla>_pYYYYMM -> date
+    suffix = name[len(table) + 2:]
+    if not (name.startswith(f"{table}_p") and len(suffix) == 6 and suffix.isdigit()):
+        return None
+    return dt.date(int(suffix[:4]), int(suffix[4:]), 1)
+
+def list_partitions(conn, table: str):
+    rows = conn.execute(text("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = :table
+    """), {"table": table}).fetchall()
+    return [r[0] for r in rows]
+
+def list_detached_partitions(conn, table: str):
+    """Tablas <tabla>_pYYYYMM que ya no están adjuntas (archivado interrumpido)."""
+    rows = conn.execute(text("""
+        SELECT c.relname FROM pg_class c
+        WHERE c.relkind = 'r' AND c.relname LIKE :prefix
+          AND NOT EXISTS (SELECT 1 FROM pg_inherits i WHERE i.inhrelid = c.oid)
+    """), {"prefix": f"{table}\\_p%"}).fetchall()
+    return [r[0] for r in rows if partition_month(r[0], table) is not None]
+
+def ensure_future_partitions(engine, today: dt.date = None):
+    first = (today or dt.date.today()).replace(day=1)
+    with engine.begin() as conn:
+        for table in PARTITIONED_TABLES:
+            for i in range(MONTHS_AHEAD + 1):
+                name = conn.execute(
+                    text("SELECT crear_particion_mensual(:table, :mes)"),
+                    {"table": table, "mes": add_months(first, i)}
+                ).scalar()
+                log(f"ok {name}")
+
+def detach_partition(engine, table: str, name: str):
+    # Transacción corta: el lock exclusivo sobre la tabla padre dura solo el DETACH
+    for attempt in range(1, DETACH_ATTEMPTS + 1):
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(f"SET LOCAL lock_timeout = '{DETACH_LOCK_TIMEOUT}'"))
+                conn.execute(text(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"'))
+            return
+        except OperationalError as e:
+            if attempt == DETACH_ATTEMPTS:
+                raise
+            log(f"DETACH {name} sin lock (intento {attempt}): {e.orig}")
+            time.sleep(2 * attempt)
+
+def attach_partition(engine, table: str, name: str):
+    desde = partition_month(name, table)
+    with engine.begin() as conn:
+        conn.execute(text(f"SET LOCAL lock_timeout = '{DETACH_LOCK_TIMEOUT}'"))
+        conn.execute(text(
+            f'ALTER TABLE "{table}" ATTACH PARTITION "{name}" '
+            f"FOR VALUES FROM ('{desde}') TO ('{add_months(desde, 1)}')"
+        ))
+
+def archive_partition(engine, table: str, name: str, detached: bool = False):
+    os.makedirs(os.path.join(ARCHIVE_DIR, table), exist_ok=True)
+    path = os.path.join(ARCHIVE_DIR, table, f"{name}.csv.gz")
+
+    if not detached:
+        detach_partition(engine, table, name)
+
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        cur.execute(f'SELECT count(*) FROM "{name}"')
+        expected = cur.fetchone()[0]
+        with gzip.open(path + ".tmp", "wb", compresslevel=6) as f:
+            cur.copy_expert(f'COPY "{name}" TO STDOUT WITH (FORMAT csv, HEADER true)', f)
+        with gzip.open(path + ".tmp", "rt", encoding="utf-8") as f:
+            written = sum(1 for _ in f) - 1
+        # Filas con saltos de línea en texto ocupan varias líneas CSV: solo se exige >=
+        if written < expected:
+            raise RuntimeError(f"{name}: archivadas {written} de {expected} filas")
+        os.replace(path + ".tmp", path)
+        cur.execute(f'DROP TABLE "{name}"')
+        raw.commit()
+        cur.close()
+    except Exception:
+        raw.rollback()
+        # Separada, la partición esconde sus filas de la tabla padre: se vuelve a adjuntar
+        try:
+            attach_partition(engine, table, name)
+            log(f"{name} no se archivó: se volvió a adjuntar")
+        except Exception as e:
+            log(f"{name} no se pudo volver a adjuntar, se reintenta en la próxima corrida: {e}")
+        raise
+    finally:
+        raw.close()
+    log(f"archivada {name} ({expected} filas) -> {path}")
+
+def archive_old_partitions(engine, today: dt.date = None):
+    first = (today or dt.date.today()).replace(day=1)
+    for table, hot_months in PARTITIONED_TABLES.items():
+        if hot_months is None:
+            continue
+        limit = add_months(first, -hot_months)
+        with engine.connect() as conn:
+            names = list_partitions(conn, table)
+            detached = set(list_detached_partitions(conn, table))
+        for name in sorted(set(names) | detached):
+            month = partition_month(name, table)
+            if month is not None and month < limit:
+                archive_partition(engine, table, name, detached=name in detached)
+
+def main():
+    engine = create_engine(DB_URL)
+    ensure_future_partitions(engine)
+    archive_old_partitions(engine)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+# Auditoría de planes de consulta para las rutas calientes.
+# - Siembra un dataset sintético dentro de una transacción (se hace rollback al final).
+# - Ejecuta EXPLAIN (ANALYZE, FORMAT JSON) de cada consulta caliente.
+# - Falla (exit 1) si alguna cae en Seq Scan sobre sus tablas principales.
+#
+# Uso: python plan_audit.py   (requiere DATABASE_URL y las migraciones aplicadas)
+
+import os
+import sys
+import json
+from sqlalchemy import create_engine, text
+
+DB_URL = os.getenv("DATABASE_URL")
+SCALE = int(os.getenv("PLAN_AUDIT_SCALE", "1"))
+
+N_USUARIOS = 2_000 * SCALE
+N_CHATS = 10_000 * SCALE
+N_MENSAJES = 200_000 * SCALE
+N_CONTRATOS = 20_000 * SCALE
+BASE_ID = 10_000_000  # ids sembrados fuera del rango real
+
+SEED_SQL = [
+    "INSERT INTO roles (id, nombre) VALUES (:base, 'plan_audit') ON CONFLICT DO NOTHING",
+    "INSERT INTO tipo_contrato (id, descripcion, plantilla) VALUES (:base, 'plan_audit', 'x') ON CONFLICT DO NOTHING",
+    "INSERT INTO tipo_evidencia (id, descripcion) VALUES (:base, 'plan_audit') ON CONFLICT DO NOTHING",
+    f"""
+    INSERT INTO usuarios (id, nombre, correo, contrasena_hash, numero_documento, rol_id, fecha_creacion)
+    SELECT :base + g, 'u' || g, 'plan_audit_' || g || '@example.com', 'x', '00000000', :base, now()
+    FROM generate_series(1, {N_USUARIOS}) g
+    """,
+    f"""
+    INSERT INTO chats (id, nombre, usuario_id, estado, fecha_creacion, fecha_actualizacion)
+    SELECT :base + g, 'chat ' || g, :base + 1 + (g % {N_USUARIOS}), 'activo',
+           now() - (g || ' minutes')::interval, now() - (g || ' minutes')::interval
+    FROM generate_series(1, {N_CHATS}) g
+    """,
+    f"""
+    INSERT INTO mensajes (id, chat_id, usuario_id, remitente, contenido, metadatos, fecha_creacion)
+    SELECT :base + g, :base + 1 + (g % {N_CHATS}), :base + 1 + (g % {N_USUARIOS}),
+           CASE WHEN g % 2 = 0 THEN 'usuario' ELSE 'sistema' END,
+           repeat('texto ', 20), '{{"k": 1}}'::jsonb, now() - (g || ' seconds')::interval
+    FROM generate_series(1, {N_MENSAJES}) g
+    """,
+    f"""
+    INSERT INTO contratos (id, codigo, titulo, creador_id, chat_id, tipo_contrato_id, estado,
+                           fecha_creacion, fecha_firma, fecha_actualizacion)
+    SELECT :base + g, 'PLAN-AUDIT-' || g, 'contrato ' || g, :base + 1 + (g % {N_USUARIOS}),
+           :base + 1 + (g % {N_CHATS}), :base,
+           (ARRAY['borrador','en_proceso','enviado_keynua','firmado','entregado','cancelado'])[1 + g % 6],
+           now() - (g || ' hours')::interval,
+           CASE WHEN g % 6 = 3 THEN now() - (g || ' minutes')::interval END,
+           now()
+    FROM generate_series(1, {N_CONTRATOS}) g
+    """,
+    f"""
+    INSERT INTO firmantes (id, contrato_id, nombre, rol_firmante_id)
+    SELECT :base + g, :base + 1 + (g % {N_CONTRATOS}), 'firmante ' || g, :base
+    FROM generate_series(1, {N_CONTRATOS * 2}) g
+    """,
+    f"""
+    INSERT INTO evidencias (id, contrato_id, tipo_id, metadatos, fecha_creacion)
+    SELECT :base + g, :base + 1 + (g % {N_CONTRATOS}), :base,
+           jsonb_build_object('link_temporal', 'tok' || g), now()
+    FROM generate_series(1, {N_CONTRATOS * 3}) g
+    """,
+]
+
+# (nombre, sql, parámetros, tablas que no deben recorrerse secuencialmente)
+HOT_QUERIES = [
+    ("historial_chat", """
+        SELECT id, remitente, contenido, fecha_creacion FROM mensajes
+        WHERE chat_id = :chat_id
+        ORDER BY fecha_creacion DESC, id DESC LIMIT 50
+    """, {"chat_id": BASE_ID + 7}, {"mensajes"}),
+    ("historial_chat_keyset", """
+        SELECT id, remitente, contenido, fecha_creacion FROM mensajes
+        WHERE chat_id = :chat_id AND (fecha_creacion, id) < (now() - interval '1 hour', :max_id)
+        ORDER BY fecha_creacion DESC, id DESC LIMIT 21
+    """, {"chat_id": BASE_ID + 7, "max_id": BASE_ID + N_MENSAJES}, {"mensajes"}),
+    ("chats_keyset", """
+        SELECT id, nombre, estado, fecha_creacion, fecha_actualizacion FROM chats
+        WHERE usuario_id = :usuario_id AND (fecha_creacion, id) < (now(), :max_id)
+        ORDER BY fecha_creacion DESC, id DESC LIMIT 21
+    """, {"usuario_id": BASE_ID + 7, "max_id": BASE_ID + N_CHATS}, {"chats"}),
+    ("chats_keyset_sin_fecha", """
+        SELECT id, nombre, estado, fecha_creacion, fecha_actualizacion FROM chats
+        WHERE usuario_id = :usuario_id AND fecha_creacion IS NULL AND id < :max_id
+        ORDER BY id DESC LIMIT 21
+    """, {"usuario_id": BASE_ID + 7, "max_id": BASE_ID + N_CHATS}, {"chats"}),
+    ("chats_por_usuario", """
+        SELECT id, nombre, fecha_actualizacion FROM chats
+        WHERE usuario_id = :usuario_id
+        ORDER BY fecha_actualizacion DESC LIMIT 20
+    """, {"usuario_id": BASE_ID + 7}, {"chats"}),
+    ("contratos_por_usuario", """
+        SELECT id, codigo, estado, fecha_creacion FROM contratos
+        WHERE creador_id = :usuario_id
+        ORDER BY fecha_creacion DESC LIMIT 20
+    """, {"usuario_id": BASE_ID + 7}, {"contratos"}),
+    ("contratos_por_chat", """
+        SELECT id, codigo, estado FROM contratos WHERE chat_id = :chat_id
+    """, {"chat_id": BASE_ID + 7}, {"contratos"}),
+    ("firmados_por_fecha", """
+        SELECT id, fecha_firma FROM contratos
+        WHERE estado = 'firmado' AND fecha_firma >= now() - interval '1 day'
+        ORDER BY fecha_firma DESC LIMIT 100
+    """, {}, {"contratos"}),
+    ("firmantes_por_contrato", """
+        SELECT id, nombre, estado FROM firmantes WHERE contrato_id = :contrato_id
+    """, {"contrato_id": BASE_ID + 7}, {"firmantes"}),
+    ("evidencias_por_contrato", """
+        SELECT id, tipo_id, fecha_creacion FROM evidencias
+        WHERE contrato_id = :contrato_id ORDER BY fecha_creacion
+    """, {"contrato_id": BASE_ID + 7}, {"evidencias"}),
+    ("evidencia_por_link", """
+        SELECT id, contrato_id FROM evidencias WHERE metadatos ->> 'link_temporal' = :token
+    """, {"token": "tok77"}, {"evidencias"}),
+]
+
+def _walk(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from _walk(child)
+
+def partition_parents(conn) -> dict:
+    """particion -> tabla padre, según pg_inherits (mensajes_p202601 -> mensajes)."""
+    rows = conn.execute(text("""
+        SELECT c.relname, p.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+    """)).fetchall()
+    return dict(rows)
+
+def _root_table(relation: str, parents: dict) -> str:
+    while relation in parents:
+        relation = parents[relation]
+    return relation
+
+def seq_scans(plan: dict, tables: set, parents: dict = None) -> list:
+    # En tablas particionadas EXPLAIN nombra la partición, no la tabla padre
+    parents = parents or {}
+    return [
+        n["Relation Name"] for n in _walk(plan["Plan"])
+        if n.get("Node Type") == "Seq Scan" and _root_table(n.get("Relation Name"), parents) in tables
+    ]
+
+def audit(conn) -> list:
+    failures = []
+    parents = partition_parents(conn)
+    for name, sql, params, tables in HOT_QUERIES:
+        plan = conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}"), params).scalar()
+        plan = plan[0] if isinstance(plan, list) else json.loads(plan)[0]
+        bad = seq_scans(plan, tables, parents)
+        status = "FAIL" if bad else "ok"
+        print(f"[{status}] {name:<26} {plan['Execution Time']:>8.2f} ms  {plan['Plan']['Node Type']}")
+        if bad:
+            failures.append((name, bad))
+    return failures
+
+def main():
+    engine = create_engine(DB_URL)
+    with engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            for stmt in SEED_SQL:
+                conn.execute(text(stmt), {"base": BASE_ID})
+            for table in ("usuarios", "chats", "mensajes", "contratos", "firmantes", "evidencias"):
+                conn.execute(text(f"ANALYZE {table}"))
+            failures = audit(conn)
+        finally:
+            trans.rollback()
+
+    if failures:
+        for name, tables in failures:
+            print(f"Seq Scan en {name}: {', '.join(tables)}")
+        sys.exit(1)
+    print("Todas las consultas calientes usan índices.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# Serialización JSON de las respuestas con orjson.
+# - FastJSONResponse: clase de respuesta por defecto de la app.
+# - FastJSONRoute: entrega el valor devuelto por el endpoint directo a orjson, sin el
+#   recorrido previo de jsonable_encoder (que FastAPI hace aunque la respuesta sea orjson).
+# orjson serializa de forma nativa dataclasses (ExtractionResult, NormalizedEntity, ...),
+# datetime/date, UUID y enums; _default cubre el resto de tipos que aparecen en la app.
+
+import asyncio
+import decimal
+import functools
+import orjson
+from fastapi.responses import JSONResponse, Response
+from fastapi.routing import APIRoute
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+def _default(obj):
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    if hasattr(obj, "dict"):
+        return obj.dict()
+    if hasattr(obj, "_mapping"):  # Row de SQLAlchemy
+        return dict(obj._mapping)
+    raise TypeError(f"Tipo no serializable a JSON: {type(obj).__name__}")
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+
+def canonical_dumps(content) -> bytes:
+    # Claves ordenadas: el mismo contenido produce siempre los mismos bytes (hashes, ETags)
+    return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS | orjson.OPT_SORT_KEYS)
+
+class FastJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+def _to_response(result, status_code: int):
+    if isinstance(result, Response):
+        return result
+    return FastJSONResponse(result, status_code=status_code)
+
+def _wrap_endpoint(endpoint, status_code: int):
+    # functools.wraps conserva la firma: FastAPI sigue resolviendo parámetros y dependencias
+    if asyncio.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            return _to_response(await endpoint(*args, **kwargs), status_code)
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            return _to_response(endpoint(*args, **kwargs), status_code)
+    return wrapper
+
+class FastJSONRoute(APIRoute):
+    def __init__(self, path: str, endpoint, **kwargs):
+        response_model = kwargs.get("response_model")
+        # Con response_model explícito se conserva la validación/filtrado de FastAPI
+        if getattr(response_model, "value", response_model) is None:
+            endpoint = _wrap_endpoint(endpoint, kwargs.get("status_code") or 200)
+        super().__init__(path, endpoint, **kwargs)
@@ -1,7 +1,8 @@
 
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemLoader, TemplateNotFound, meta
 from weasyprint import HTML
 import os
+import hashlib
 
 TEMPLATE_DIR = os.getenv("TEMPLATE_DIR", "./templates")
 
@@ -14,3 +15,39 @@ def render_html(template_name: str, context: dict) -> str:
 def html_to_pdf(html_content: str, output_path: str):
     HTML(string=html_content).write_pdf(output_path)
     return output_path
+
+# Versión de la plantilla: hash de su fuente y de todo lo que incluye/extiende/importa
+# (con nombre literal), recalculada solo si cambia el mtime de alguno de esos archivos
+_template_versions = {}
+
+def _mtime(template_name: str) -> int:
+    try:
+        return os.stat(os.path.join(TEMPLATE_DIR, template_name)).st_mtime_ns
+    except FileNotFoundError:
+        raise TemplateNotFound(template_name)
+
+def _dependency_sources(template_name: str) -> dict:
+    """nombre -> (mtime, fuente) de la plantilla y sus dependencias."""
+    sources, pending = {}, [template_name]
+    while pending:
+        name = pending.pop()
+        if name in sources:
+            continue
+        # mtime antes de leer: si el archivo cambia en medio, la próxima llamada lo recalcula
+        mtime = _mtime(name)
+        source, _, _ = env.loader.get_source(env, name)
+        sources[name] = (mtime, source)
+        pending.extend(n for n in meta.find_referenced_templates(env.parse(source)) if n is not None)
+    return sources
+
+def template_version(template_name: str) -> str:
+    cached = _template_versions.get(template_name)
+    if cached and all(_mtime(name) == mtime for name, mtime in cached[0].items()):
+        return cached[1]
+    sources = _dependency_sources(template_name)
+    h = hashlib.sha256()
+    for name in sorted(sources):
+        h.update(name.encode("utf-8") + b"\0" + sources[name][1].encode("utf-8") + b"\0")
+    version = h.hexdigest()[:16]
+    _template_versions[template_name] = ({name: mtime for name, (mtime, _) in sources.items()}, version)
+    return version
@@ -0,0 +1,56 @@
+import os
+import sys
+
+import pytest
+from flask import Flask
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import db  # noqa: E402
+
+# Las pruebas de colas (SKIP LOCKED, advisory locks, JSONB) necesitan Postgres real.
+# TEST_DATABASE_URL debe apuntar a una base descartable: se recrean todas las tablas.
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+@pytest.fixture(scope="session")
+def pg_app():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL no definido")
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = TEST_DATABASE_URL
+    db.init_app(app)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    return app
+
+@pytest.fixture
+def pg(pg_app):
+    with pg_app.app_context():
+        yield db
+        db.session.remove()
+        tablas = ", ".join(t.name for t in db.metadata.sorted_tables)
+        with db.engine.begin() as conn:
+            conn.execute(text(f"TRUNCATE {tablas} RESTART IDENTITY CASCADE"))
+
+@pytest.fixture
+def contrato(pg):
+    from models import Chat, Contrato, Rol, TipoContrato, Usuario
+
+    rol = Rol(nombre="cliente")
+    tipo = TipoContrato(descripcion="Arrendamiento", plantilla="arrendamiento.html")
+    pg.session.add_all([rol, tipo])
+    pg.session.flush()
+    usuario = Usuario(nombre="Ana", correo="ana@example.com", contrasena_hash="x",
+                      numero_documento="12345678", rol_id=rol.id)
+    pg.session.add(usuario)
+    pg.session.flush()
+    chat = Chat(usuario_id=usuario.id)
+    pg.session.add(chat)
+    pg.session.flush()
+    c = Contrato(codigo="CONT-2025-0001", titulo="Arrendamiento", creador_id=usuario.id,
+                 chat_id=chat.id, tipo_contrato_id=tipo.id, estado="enviado_keynua")
+    pg.session.add(c)
+    pg.session.commit()
+    return c
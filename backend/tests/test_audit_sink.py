@@ -0,0 +1,87 @@
+# Spill, reintento y cuarentena del sink de auditoría, contra SQLite.
+
+import json
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from audit_sink import AuditSink
+
+DDL = """
+CREATE TABLE conversation_logs (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER, contract_id INTEGER,
+    mensaje_usuario TEXT NOT NULL, respuesta_sistema TEXT, ip_origen TEXT
+)
+"""
+
+def _row(i, mensaje="hola"):
+    return ("conversation_logs", {"user_id": i, "mensaje_usuario": mensaje})
+
+@pytest.fixture
+def sink(tmp_path):
+    url = f"sqlite:///{tmp_path / 'audit.db'}"
+    with create_engine(url).begin() as conn:
+        conn.execute(text(DDL))
+    return AuditSink(db_url=url, spill_path=str(tmp_path / "spill.jsonl"),
+                     quarantine_path=str(tmp_path / "quarantine.jsonl"))
+
+def _user_ids(sink):
+    with sink._get_engine().connect() as conn:
+        return [r[0] for r in conn.execute(text("SELECT user_id FROM conversation_logs ORDER BY id"))]
+
+def _lines(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(l)["row"]["user_id"] for l in f]
+
+def _db_down(sink, monkeypatch, after: int = 0):
+    """_write falla como BD caída a partir de la llamada número after."""
+    real, calls = sink._write, {"n": 0}
+
+    def write(batch):
+        calls["n"] += 1
+        if calls["n"] > after:
+            raise OperationalError("INSERT", {}, Exception("sin conexión"))
+        return real(batch)
+    monkeypatch.setattr(sink, "_write", write)
+
+def test_flush_writes_batch(sink):
+    sink._flush([_row(1), _row(2)])
+    assert _user_ids(sink) == [1, 2]
+
+def test_outage_spills_and_replays_once(sink, monkeypatch):
+    _db_down(sink, monkeypatch)
+    sink._flush([_row(1)])
+    sink._flush([_row(2)])
+    monkeypatch.undo()
+    sink._flush([_row(3)])
+    assert _user_ids(sink) == [1, 2, 3]
+    sink._flush([])
+    assert _user_ids(sink) == [1, 2, 3]
+
+def test_bad_row_is_quarantined_without_blocking_batch(sink):
+    sink._flush([_row(1), _row(2, mensaje=None), _row(3)])
+    assert _user_ids(sink) == [1, 3]
+    assert _lines(sink.quarantine_path) == [2]
+
+def test_outage_during_row_by_row_keeps_only_unwritten_tail(sink, monkeypatch):
+    # Lote rechazado (fila inválida) y la BD se cae después de escribir la primera fila
+    _db_down(sink, monkeypatch)
+    sink._flush([_row(1)])
+    monkeypatch.undo()
+    _db_down(sink, monkeypatch, after=2)
+    sink._flush([_row(2, mensaje=None), _row(3)])
+    assert _user_ids(sink) == [1]
+    assert _lines(sink._inflight_path()) == [2, 3]
+    monkeypatch.undo()
+    sink._flush([])
+    assert _user_ids(sink) == [1, 3]
+    assert _lines(sink.quarantine_path) == [2]
+
+def test_spill_cap_counts_inflight(sink, monkeypatch):
+    sink.spill_max_bytes = len(json.dumps({"table": "conversation_logs", "row": _row(1)[1]})) * 3
+    _db_down(sink, monkeypatch)
+    for i in range(10):
+        sink._flush([_row(i)])
+    assert len(_lines(sink._inflight_path())) <= 3
+    assert sink.dropped >= 7
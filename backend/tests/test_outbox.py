@@ -0,0 +1,78 @@
+# Claims con lease, reintentos y fencing por intentos del outbox.
+
+import asyncio
+import datetime as dt
+import pytest
+
+import outbox
+from models import OutboxEvento
+
+@pytest.fixture
+def enviados(monkeypatch):
+    sent = []
+    monkeypatch.setitem(outbox.HANDLERS, "email", lambda payload: sent.append(payload["to_email"]))
+    return sent
+
+def _evento(pg, to_email="ana@example.com"):
+    ev = outbox.add_outbox("email", {"to_email": to_email, "subject": "s", "body": "b"})
+    pg.session.commit()
+    return ev.id
+
+def _get(pg, evento_id):
+    pg.session.expire_all()
+    return pg.session.get(OutboxEvento, evento_id)
+
+def _expire_lease(pg, evento_id):
+    pg.session.query(OutboxEvento).filter_by(id=evento_id).update(
+        {"proximo_intento": dt.datetime.utcnow() - dt.timedelta(seconds=1)})
+    pg.session.commit()
+
+def test_unknown_tipo_is_rejected():
+    with pytest.raises(ValueError):
+        outbox.add_outbox("keynua_envio", {})
+
+def test_claim_leases_one_event_at_a_time(pg):
+    a, b = _evento(pg), _evento(pg)
+    first, second = outbox._claim(), outbox._claim()
+    assert {first.id, second.id} == {a, b}
+    assert first.intentos == second.intentos == 1
+    assert outbox._claim() is None
+
+def test_dispatch_once_sends_and_marks(pg, enviados):
+    a = _evento(pg, "a@example.com")
+    b = _evento(pg, "b@example.com")
+    assert asyncio.run(outbox.dispatch_once()) == 2
+    assert enviados == ["a@example.com", "b@example.com"]
+    assert {_get(pg, a).estado, _get(pg, b).estado} == {"enviado"}
+
+def test_failed_handler_backs_off_then_gives_up(pg, monkeypatch):
+    def falla(payload):
+        raise RuntimeError("SMTP caído")
+    monkeypatch.setitem(outbox.HANDLERS, "email", falla)
+    monkeypatch.setattr(outbox, "OUTBOX_MAX_INTENTOS", 2)
+    evento_id = _evento(pg)
+
+    assert asyncio.run(outbox.dispatch_once()) == 1
+    ev = _get(pg, evento_id)
+    assert (ev.estado, ev.intentos, ev.error) == ("pendiente", 1, "SMTP caído")
+    assert ev.proximo_intento > dt.datetime.utcnow()
+    assert asyncio.run(outbox.dispatch_once()) == 0
+
+    _expire_lease(pg, evento_id)
+    assert asyncio.run(outbox.dispatch_once()) == 1
+    assert _get(pg, evento_id).estado == "error"
+
+def test_expired_claim_cannot_record_its_result(pg):
+    evento_id = _evento(pg)
+    viejo = outbox._claim()
+    _expire_lease(pg, evento_id)
+    nuevo = outbox._claim()
+    assert nuevo.intentos == viejo.intentos + 1
+
+    assert outbox._mark_failed(viejo.id, viejo.intentos, "timeout") is False
+    assert outbox._mark_sent(viejo.id, viejo.intentos) is False
+    ev = _get(pg, evento_id)
+    assert (ev.estado, ev.error) == ("pendiente", None)
+
+    assert outbox._mark_sent(nuevo.id, nuevo.intentos) is True
+    assert _get(pg, evento_id).estado == "enviado"
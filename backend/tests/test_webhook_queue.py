@@ -0,0 +1,135 @@
+# Ingesta idempotente y aplicación en orden de los webhooks de Keynua.
+
+import asyncio
+import os
+import pytest
+from sqlalchemy import create_engine, text
+
+import webhook_queue
+from blob_store import LocalBlobStore
+from models import Evidencia, OutboxEvento, TipoEvidencia, WebhookEvento
+
+@pytest.fixture
+def descargas(tmp_path, monkeypatch):
+    d = tmp_path / "keynua_downloads"
+    d.mkdir()
+    monkeypatch.setattr(webhook_queue, "KEYNUA_DOWNLOAD_DIR", os.path.realpath(d))
+    store = LocalBlobStore(str(tmp_path / "blobs"))
+
+    def put_file(path):
+        with open(path, "rb") as src:
+            return store.put_fileobj(src)
+    monkeypatch.setattr(webhook_queue, "put_file", put_file)
+    return d
+
+@pytest.fixture
+def evidencia(pg, contrato):
+    tipo = TipoEvidencia(descripcion="video")
+    pg.session.add(tipo)
+    pg.session.flush()
+    ev = Evidencia(contrato_id=contrato.id, tipo_id=tipo.id, metadatos={"estado_link": "enviado"})
+    pg.session.add(ev)
+    pg.session.commit()
+    return ev
+
+def _enqueue(payload, event_id):
+    return webhook_queue.enqueue_event(payload, repr(payload).encode(), {"X-Keynua-Event-Id": event_id})
+
+def _estados():
+    return {ev.idempotency_key: ev.estado for ev in WebhookEvento.query.order_by(WebhookEvento.id)}
+
+def _process():
+    return asyncio.run(webhook_queue.process_batch())
+
+# ---------------------------
+# Sin base de datos
+# ---------------------------
+def test_idempotency_key_prefers_header_then_body_hash():
+    assert webhook_queue.idempotency_key_for({"Idempotency-Key": "k1"}, b"{}") == "k1"
+    a = webhook_queue.idempotency_key_for({}, b'{"a": 1}')
+    assert a == webhook_queue.idempotency_key_for({}, b'{"a": 1}')
+    assert a != webhook_queue.idempotency_key_for({}, b'{"a": 2}')
+
+def test_signed_pdf_outside_download_dir_is_rejected(descargas, tmp_path):
+    dentro = descargas / "firmado.pdf"
+    dentro.write_bytes(b"%PDF")
+    fuera = tmp_path / "otro.pdf"
+    fuera.write_bytes(b"%PDF")
+    (descargas / "enlace.pdf").symlink_to(fuera)
+
+    assert webhook_queue._signed_pdf_file(str(dentro)) == os.path.realpath(dentro)
+    for path in (str(fuera), str(descargas / ".." / "otro.pdf"), str(descargas / "enlace.pdf")):
+        with pytest.raises(PermissionError):
+            webhook_queue._signed_pdf_file(path)
+
+    blobs = asyncio.run(webhook_queue._store_files({str(dentro), str(fuera)}))
+    assert isinstance(blobs[str(fuera)], PermissionError)
+    assert len(blobs[str(dentro)].sha256) == 64
+
+# ---------------------------
+# Postgres
+# ---------------------------
+def test_redelivery_is_stored_once(pg, contrato):
+    payload = {"transaction_id": contrato.codigo, "status": "firmado"}
+    assert _enqueue(payload, "evt-1") is True
+    assert _enqueue(payload, "evt-1") is False
+    assert WebhookEvento.query.count() == 1
+
+def test_signature_and_status_of_a_contract_share_ordering_key(pg, contrato, evidencia):
+    _enqueue({"evidence_id": evidencia.id}, "firma")
+    _enqueue({"transaction_id": contrato.codigo, "status": "firmado"}, "estado")
+    _enqueue({"transaction_id": "CONT-DESCONOCIDO", "status": "firmado"}, "otro")
+    claves = [ev.clave_orden for ev in WebhookEvento.query.order_by(WebhookEvento.id)]
+    assert claves == [f"contrato:{contrato.id}"] * 2 + ["transaccion:CONT-DESCONOCIDO"]
+
+def test_failed_event_holds_back_later_events_of_its_contract(pg, contrato, evidencia, descargas, tmp_path):
+    fuera = tmp_path / "otro.pdf"
+    fuera.write_bytes(b"%PDF")
+    _enqueue({"evidence_id": evidencia.id, "signed_pdf_path": str(fuera)}, "firma")
+    _enqueue({"transaction_id": contrato.codigo, "status": "firmado"}, "estado")
+    _enqueue({"ping": True}, "global")
+
+    assert _process() == 1
+    assert _estados() == {"firma": "pendiente", "estado": "pendiente", "global": "procesado"}
+    firma = WebhookEvento.query.filter_by(idempotency_key="firma").one()
+    assert firma.intentos == 1 and "fuera de" in firma.error
+
+def test_signed_pdf_then_status_apply_in_order(pg, contrato, evidencia, descargas):
+    pdf = descargas / "firmado.pdf"
+    pdf.write_bytes(b"%PDF firmado")
+    _enqueue({"evidence_id": evidencia.id, "signed_pdf_path": str(pdf)}, "firma")
+    _enqueue({"transaction_id": contrato.codigo, "status": "firmado"}, "estado")
+    _enqueue({"transaction_id": contrato.codigo, "status": "firmado"}, "estado-reenviado")
+
+    assert _process() == 3
+    assert _estados() == {"firma": "procesado", "estado": "procesado", "estado-reenviado": "duplicado"}
+    meta = pg.session.get(Evidencia, evidencia.id).metadatos
+    assert meta["estado_link"] == "firmado" and meta["pdf_firmado_url"]
+    pg.session.refresh(contrato)
+    assert contrato.estado == "firmado" and contrato.fecha_firma is not None
+    assert OutboxEvento.query.filter_by(tipo="email", agregado=f"contrato:{contrato.id}").count() == 1
+
+def test_signature_without_pdf_marks_evidence_signed_once(pg, evidencia):
+    _enqueue({"evidence_id": evidencia.id}, "firma")
+    _enqueue({"evidence_id": evidencia.id, "reintento": 1}, "firma-2")
+    assert _process() == 2
+    assert _estados() == {"firma": "procesado", "firma-2": "duplicado"}
+    meta = pg.session.get(Evidencia, evidencia.id).metadatos
+    assert meta["estado_link"] == "firmado" and "hash_documento" not in meta
+
+def test_claim_skips_key_held_by_another_consumer(pg, contrato):
+    _enqueue({"transaction_id": contrato.codigo, "status": "firmado"}, "estado")
+    _enqueue({"ping": True}, "global")
+
+    otro = create_engine(pg.engine.url).connect()
+    try:
+        with otro.begin():
+            otro.execute(text("SELECT pg_advisory_xact_lock(hashtext(:k))"),
+                         {"k": f"contrato:{contrato.id}"})
+            grupos = webhook_queue._claim_batch(10)
+            assert list(grupos) == ["global"]
+            pg.session.rollback()
+    finally:
+        otro.close()
+    assert list(webhook_queue._claim_batch(10)) == [f"contrato:{contrato.id}", "global"]
+    pg.session.rollback()
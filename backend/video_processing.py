@@ -0,0 +1,126 @@
+# Post-procesamiento de videos probatorios como job (ver jobs.py):
+# probe (duración y metadatos) -> miniatura -> versión de revisión en baja tasa de bits.
+# Usa ffprobe/ffmpeg instalados localmente, cada uno en su propio proceso; jobs.py no
+# reclama más de VIDEO_MAX_CONCURRENCY videos a la vez. El progreso de la
+# transcodificación se lee de `-progress pipe:1` y se publica en jobs.progreso.
+
+import os
+import json
+import asyncio
+import tempfile
+import datetime as dt
+from models import Evidencia, db
+from jobs import job_handler
+from blob_store import put_file, local_path_for
+
+FFMPEG_BIN = os.getenv("FFMPEG_BIN", "ffmpeg")
+FFPROBE_BIN = os.getenv("FFPROBE_BIN", "ffprobe")
+VIDEO_MAX_CONCURRENCY = int(os.getenv("VIDEO_MAX_CONCURRENCY", "2"))
+VIDEO_THREADS = int(os.getenv("VIDEO_THREADS", "2"))  # hilos de ffmpeg por video
+VIDEO_REVIEW_HEIGHT = int(os.getenv("VIDEO_REVIEW_HEIGHT", "480"))
+VIDEO_REVIEW_BITRATE = os.getenv("VIDEO_REVIEW_BITRATE", "600k")
+VIDEO_THUMBNAIL_WIDTH = int(os.getenv("VIDEO_THUMBNAIL_WIDTH", "320"))
+
+class VideoProcessingError(Exception):
+    pass
+
+async def _run(*args) -> bytes:
+    proc = await asyncio.create_subprocess_exec(
+        *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await proc.communicate()
+    if proc.returncode != 0:
+        raise VideoProcessingError(f"{os.path.basename(args[0])} falló ({proc.returncode}): {stderr.decode(errors='replace')[-500:]}")
+    return stdout
+
+# ---------------------------
+# Etapas
+# ---------------------------
+async def probe(path: str) -> dict:
+    raw = await _run(FFPROBE_BIN, "-v", "error", "-print_format", "json", "-show_format", "-show_streams", path)
+    info = json.loads(raw)
+    fmt = info.get("format", {})
+    video = next((s for s in info.get("streams", []) if s.get("codec_type") == "video"), {})
+    audio = next((s for s in info.get("streams", []) if s.get("codec_type") == "audio"), {})
+    return {
+        "duracion": float(fmt.get("duration") or 0),
+        "formato": fmt.get("format_name"),
+        "bitrate": int(fmt.get("bit_rate") or 0),
+        "codec_video": video.get("codec_name"),
+        "ancho": video.get("width"),
+        "alto": video.get("height"),
+        "fps": video.get("avg_frame_rate"),
+        "codec_audio": audio.get("codec_name"),
+        "fecha_grabacion": fmt.get("tags", {}).get("creation_time"),
+    }
+
+async def thumbnail(path: str, dest: str, duracion: float) -> str:
+    instante = min(1.0, duracion / 2) if duracion else 0
+    await _run(FFMPEG_BIN, "-y", "-v", "error", "-ss", f"{instante:.3f}", "-i", path,
+               "-frames:v", "1", "-vf", f"scale={VIDEO_THUMBNAIL_WIDTH}:-2", dest)
+    return dest
+
+async def review_rendition(path: str, dest: str, duracion: float, on_progress=None) -> str:
+    proc = await asyncio.create_subprocess_exec(
+        FFMPEG_BIN, "-y", "-v", "error", "-nostats", "-progress", "pipe:1",
+        "-i", path, "-threads", str(VIDEO_THREADS),
+        "-vf", f"scale=-2:'min({VIDEO_REVIEW_HEIGHT},ih)'",
+        "-c:v", "libx264", "-preset", "veryfast", "-b:v", VIDEO_REVIEW_BITRATE,
+        "-maxrate", VIDEO_REVIEW_BITRATE, "-bufsize", VIDEO_REVIEW_BITRATE,
+        "-c:a", "aac", "-b:a", "64k", "-movflags", "+faststart", dest,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    stderr_task = asyncio.create_task(proc.stderr.read())
+    async for line in proc.stdout:
+        key, _, value = line.decode(errors="replace").strip().partition("=")
+        # out_time_ms viene en microsegundos pese al nombre
+        if key == "out_time_ms" and duracion and on_progress and value.isdigit():
+            on_progress(int(value) / 1_000_000 / duracion * 100)
+    stderr = await stderr_task
+    if await proc.wait() != 0:
+        raise VideoProcessingError(f"ffmpeg falló ({proc.returncode}): {stderr.decode(errors='replace')[-500:]}")
+    return dest
+
+# ---------------------------
+# Job
+# ---------------------------
+@job_handler("video", max_concurrency=VIDEO_MAX_CONCURRENCY)
+async def run_video(ctx) -> dict:
+    data = ctx.payload
+    src = await asyncio.to_thread(local_path_for, data["video_url"])
+    with tempfile.TemporaryDirectory(prefix="video-") as tmp:
+        async with ctx.stage("probe"):
+            info = await probe(src)
+
+        async with ctx.stage("miniatura"):
+            miniatura_path = await thumbnail(src, os.path.join(tmp, "miniatura.jpg"), info["duracion"])
+            miniatura = await asyncio.to_thread(put_file, miniatura_path, True)
+
+        async with ctx.stage("revision"):
+            revision_path = await review_rendition(src, os.path.join(tmp, "revision.mp4"),
+                                                   info["duracion"], ctx.progress)
+            revision = await asyncio.to_thread(put_file, revision_path, True)
+
+    async with ctx.stage("registro"):
+        evidencia = Evidencia.query.get(data["evidencia_id"])
+        if evidencia is None:
+            raise LookupError("Evidencia no encontrada")
+        # Un upload posterior reemplazó el video: no pisar sus resultados con los de este
+        if evidencia.metadatos.get("video_sha256") != data["video_sha256"]:
+            return {"omitido": "video reemplazado"}
+        evidencia.metadatos.update({
+            "video_duracion": info["duracion"],
+            "video_info": info,
+            "video_miniatura_url": miniatura.uri,
+            "video_revision_url": revision.uri,
+            "video_revision_bytes": revision.size,
+            "video_procesado_en": dt.datetime.utcnow().isoformat(),
+        })
+        db.session.commit()
+
+    return {
+        "evidencia_id": data["evidencia_id"],
+        "duracion": info["duracion"],
+        "miniatura_url": miniatura.uri,
+        "revision_url": revision.uri,
+    }
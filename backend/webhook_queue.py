@@ -0,0 +1,238 @@
+# Ingesta idempotente y procesamiento en cola de webhooks de Keynua.
+# - El endpoint solo persiste el evento crudo (con su idempotency key) y responde 202.
+# - Un consumidor en segundo plano procesa los eventos en lotes, en orden por contrato,
+#   descarta reenvíos y guarda el PDF firmado en el blob store fuera del event loop.
+# - Ninguna transacción queda abierta mientras se espera el blob store: primero se
+#   guardan los PDFs y luego se reclama y aplica el lote en una transacción corta.
+
+import os
+import asyncio
+import hashlib
+import datetime as dt
+from collections import OrderedDict
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from models import Contrato, Evidencia, WebhookEvento, db
+from database import worker_session
+from outbox import notificar_estado_contrato
+from blob_store import put_file
+
+WEBHOOK_BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", "50"))
+WEBHOOK_POLL_SECONDS = float(os.getenv("WEBHOOK_POLL_SECONDS", "1"))
+WEBHOOK_MAX_INTENTOS = int(os.getenv("WEBHOOK_MAX_INTENTOS", "5"))
+WEBHOOK_HASH_CONCURRENCY = int(os.getenv("WEBHOOK_HASH_CONCURRENCY", "4"))
+# Solo se aceptan PDFs firmados descargados en este directorio
+KEYNUA_DOWNLOAD_DIR = os.path.realpath(os.getenv("KEYNUA_DOWNLOAD_DIR", "./keynua_downloads"))
+
+# ---------------------------
+# Ingesta
+# ---------------------------
+def idempotency_key_for(headers, raw_body: bytes) -> str:
+    key = headers.get("Idempotency-Key") or headers.get("X-Keynua-Event-Id")
+    if key:
+        return key[:128]
+    # Sin cabecera: un reenvío de Keynua trae el mismo cuerpo
+    return "sha256:" + hashlib.sha256(raw_body).hexdigest()
+
+def ordering_key(payload: dict) -> str:
+    # Firma y cambios de estado del mismo contrato comparten clave: se aplican en orden
+    contrato_id = None
+    if payload.get("evidence_id") is not None:
+        contrato_id = (db.session.query(Evidencia.contrato_id)
+                       .filter(Evidencia.id == payload["evidence_id"]).scalar())
+    elif payload.get("transaction_id") is not None:
+        contrato_id = (db.session.query(Contrato.id)
+                       .filter(Contrato.codigo == payload["transaction_id"]).scalar())
+    if contrato_id is not None:
+        return f"contrato:{contrato_id}"
+    # Sin contrato conocido el evento no hace nada al aplicarse; igual se serializa por su id
+    if payload.get("evidence_id") is not None:
+        return f"evidencia:{payload['evidence_id']}"
+    if payload.get("transaction_id") is not None:
+        return f"transaccion:{payload['transaction_id']}"
+    return "global"
+
+def enqueue_event(payload: dict, raw_body: bytes, headers) -> bool:
+    """Guarda el evento; devuelve False si era un reenvío ya registrado."""
+    stmt = insert(WebhookEvento.__table__).values(
+        origen="keynua",
+        idempotency_key=idempotency_key_for(headers, raw_body),
+        clave_orden=ordering_key(payload),
+        payload=payload,
+        estado="pendiente",
+        intentos=0,
+        fecha_recepcion=dt.datetime.utcnow(),
+    ).on_conflict_do_nothing(index_elements=["idempotency_key"]).returning(WebhookEvento.__table__.c.id)
+    created = db.session.execute(stmt).first() is not None
+    db.session.commit()
+    return created
+
+# ---------------------------
+# Procesamiento
+# ---------------------------
+def _signed_pdf_file(path: str) -> str:
+    # La ruta llega en el cuerpo del webhook: no se copia nada fuera del directorio de descargas
+    real = os.path.realpath(path)
+    if os.path.commonpath([real, KEYNUA_DOWNLOAD_DIR]) != KEYNUA_DOWNLOAD_DIR:
+        raise PermissionError(f"Ruta de PDF firmado fuera de {KEYNUA_DOWNLOAD_DIR}")
+    return real
+
+async def _store_files(paths) -> dict:
+    # El PDF firmado entra al blob store: el hash sale de la misma copia
+    slots = asyncio.Semaphore(WEBHOOK_HASH_CONCURRENCY)
+
+    async def one(path):
+        try:
+            real = _signed_pdf_file(path)
+        except PermissionError as e:
+            return path, e
+        async with slots:
+            try:
+                return path, await asyncio.to_thread(put_file, real)
+            except OSError as e:
+                return path, e
+
+    return dict(await asyncio.gather(*(one(p) for p in paths)))
+
+def _apply_signed(evento: WebhookEvento, blobs: dict) -> str:
+    payload = evento.payload
+    evidencia = Evidencia.query.get(payload.get("evidence_id"))
+    if not evidencia:
+        return "procesado"
+    blob = blobs.get(payload.get("signed_pdf_path"))
+    if isinstance(blob, Exception):
+        raise blob
+
+    if blob is None:
+        # Firma sin PDF adjunto: se registra el estado, sin campos de hash
+        if evidencia.metadatos.get("estado_link") == "firmado":
+            return "duplicado"
+        evidencia.metadatos.update({
+            "tsa_timestamp": dt.datetime.utcnow().isoformat(),
+            "estado_link": "firmado"
+        })
+        return "procesado"
+
+    if evidencia.metadatos.get("hash_documento") == blob.sha256 and evidencia.metadatos.get("estado_link") == "firmado":
+        return "duplicado"
+    evidencia.metadatos.update({
+        "hash_documento": blob.sha256,
+        "pdf_firmado_url": blob.uri,
+        "blockchain_hash": f"bc_{blob.sha256[:16]}",
+        "tsa_timestamp": dt.datetime.utcnow().isoformat(),
+        "estado_link": "firmado"
+    })
+    return "procesado"
+
+def _apply_status(evento: WebhookEvento) -> str:
+    payload = evento.payload
+    contrato = Contrato.query.filter_by(codigo=payload.get("transaction_id")).first()
+    if not contrato:
+        raise LookupError("Contrato no encontrado")
+    if contrato.estado == payload.get("status"):
+        return "duplicado"
+    contrato.estado = payload.get("status")
+    if contrato.estado == "firmado":
+        # Lo lee el índice parcial ix_contratos_firmados_fecha (firmados recientes)
+        contrato.fecha_firma = dt.datetime.utcnow()
+    notificar_estado_contrato(contrato)
+    return "procesado"
+
+def _claim_batch(batch_size: int) -> "OrderedDict[str, list]":
+    # Claves con pendientes, por antigüedad de su primer evento
+    claves = db.session.execute(text("""
+        SELECT clave_orden FROM webhook_eventos
+        WHERE estado = 'pendiente'
+        GROUP BY clave_orden
+        ORDER BY min(id)
+        LIMIT :n
+    """), {"n": batch_size}).scalars().all()
+
+    claimed: "OrderedDict[str, list]" = OrderedDict()
+    restantes = batch_size
+    for clave in claves:
+        if restantes <= 0:
+            break
+        # Primero el lock de la clave (hasta el fin de la transacción): quien lo tiene es el
+        # único consumidor de la clave, y toma sus eventos desde el pendiente más antiguo
+        locked = db.session.execute(
+            text("SELECT pg_try_advisory_xact_lock(hashtext(:k))"), {"k": clave}
+        ).scalar()
+        if not locked:
+            continue
+        evs = (WebhookEvento.query
+               .filter(WebhookEvento.clave_orden == clave, WebhookEvento.estado == "pendiente")
+               .order_by(WebhookEvento.id)
+               .with_for_update()
+               .limit(restantes)
+               .all())
+        if evs:
+            claimed[clave] = evs
+            restantes -= len(evs)
+    return claimed
+
+def _pending_paths(batch_size: int) -> set:
+    # Lectura sin locks: solo para saber qué PDFs guardar antes de reclamar
+    eventos = (WebhookEvento.query
+               .filter(WebhookEvento.estado == "pendiente")
+               .order_by(WebhookEvento.id)
+               .limit(batch_size)
+               .all())
+    paths = {ev.payload.get("signed_pdf_path") for ev in eventos if ev.payload.get("signed_pdf_path")}
+    db.session.rollback()
+    return paths
+
+def _apply_batch(batch_size: int, blobs: dict) -> int:
+    grupos = _claim_batch(batch_size)
+    if not grupos:
+        db.session.rollback()
+        return 0
+
+    ahora = dt.datetime.utcnow()
+    procesados = 0
+    for evs in grupos.values():
+        for ev in evs:
+            path = ev.payload.get("signed_pdf_path")
+            if path and path not in blobs:
+                # Llegó después de guardar los PDFs: queda para el próximo lote, en orden
+                break
+            try:
+                with db.session.begin_nested():
+                    if ev.payload.get("evidence_id") is not None:
+                        ev.estado = _apply_signed(ev, blobs)
+                    elif ev.payload.get("transaction_id") is not None:
+                        ev.estado = _apply_status(ev)
+                    else:
+                        ev.estado = "procesado"
+                ev.fecha_procesado = ahora
+                procesados += 1
+            except Exception as e:
+                ev.intentos += 1
+                ev.error = str(e)
+                if ev.intentos >= WEBHOOK_MAX_INTENTOS:
+                    ev.estado = "error"
+                # Mantiene el orden: los eventos siguientes de la misma clave esperan
+                break
+    db.session.commit()
+    return procesados
+
+async def process_batch(batch_size: int = WEBHOOK_BATCH_SIZE) -> int:
+    paths = _pending_paths(batch_size)
+    blobs = await _store_files(paths) if paths else {}
+    # Claim, aplicación y commit sin ningún await en medio
+    return _apply_batch(batch_size, blobs)
+
+async def run_consumer(stop: asyncio.Event):
+    with worker_session():
+        while not stop.is_set():
+            try:
+                n = await process_batch()
+            except Exception as e:
+                db.session.rollback()
+                print(f"[WEBHOOK][ERROR] {e}")
+                n = 0
+            if n == 0:
+                try:
+                    await asyncio.wait_for(stop.wait(), WEBHOOK_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass